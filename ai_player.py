@@ -1,12 +1,33 @@
-import aiohttp
 import json
 import asyncio
+import hashlib
 import logging
 import re
-from typing import Dict, List, Tuple, Optional
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple, Optional
+from go_board import PASS_MOVE, GoBoard
+from batching import batch_registry
+from http_pool import session_registry
+from mcts import mcts_engine
+from opening_book import opening_book
+from metrics import AI_CALLS_IN_FLIGHT, AI_MOVES, FALLBACK_MOVES, MOVE_PHASE_SECONDS
+from policy import default_policy
+from prompt_builder import DEFAULT_TOKEN_BUDGETS, PromptBuilder, render_board_text
+from resilience import InvalidMoveError, ModelResponseError, resilient_caller
+from response_cache import make_cache_key, response_cache
+from scoring import AREA_SCORING, DEFAULT_KOMI, score_board
 
 logger = logging.getLogger('go_game')
 
+# 流式响应中尽早识别落子坐标，例如 "move": [3, 15]
+MOVE_PATTERN = re.compile(r'"move"\s*:\s*\[\s*(\d+)\s*,\s*(\d+)\s*\]')
+# 紧跟在 move 之后、可能尚未结束的 reasoning 字段
+PARTIAL_REASONING_PATTERN = re.compile(r'"reasoning"\s*:\s*"((?:[^"\\]|\\.)*)')
+# 思考过程增量的合并阈值，避免每个token都广播一次
+THINKING_FLUSH_CHARS = 64
+THINKING_FLUSH_INTERVAL = 0.2
+
 def extract_json_from_markdown(text: str) -> str:
     """从Markdown文本中提取JSON内容"""
     # 匹配```json和```之间的内容，或者```和```之间的内容
@@ -17,10 +38,12 @@ def extract_json_from_markdown(text: str) -> str:
         return matches[0].strip()
     return text.strip()
 
-def format_board_state(board: List[List[int]]) -> str:
-    """格式化棋盘状态，使其更易读"""
+def format_board_state(board) -> str:
+    """格式化棋盘状态，使其更易读（GoBoard 使用按局面缓存的渲染）"""
+    if isinstance(board, GoBoard):
+        return board.cached_render("prompt", render_board_text)
     formatted = "当前棋盘状态：\n\n"
-    formatted += "   " + " ".join(f"{i:2d}" for i in range(19)) + "\n"
+    formatted += "   " + " ".join(f"{i:2d}" for i in range(len(board))) + "\n"
     for i, row in enumerate(board):
         formatted += f"{i:2d} "
         formatted += " ".join(
@@ -53,23 +76,43 @@ def format_chat_history(chat_history: Optional[List[Dict]]) -> str:
     return formatted
 
 class AIPlayer:
-    def __init__(self, model_type="compatible", api_url=None, model_name=None, bearer_token=None):
+    def __init__(self, model_type="compatible", api_url=None, model_name=None, bearer_token=None, stream=False,
+                 prompt_token_budget=None, use_response_cache=True, candidate_count=5, hedge_api_url=None,
+                 use_opening_book=True):
         self.model_type = model_type
+        self.stream = stream  # 是否使用流式响应
+        self.use_response_cache = use_response_cache  # 是否使用按局面缓存的落子结果
+        self.use_opening_book = use_opening_book  # 开局阶段是否从定式库取子
+        self.fallback_count = 0  # 使用本地策略兜底的次数
+        self.candidate_count = candidate_count  # 提示词中给出的本地候选落点数，0 表示不提供
+        self.prompt_builder = PromptBuilder(
+            token_budget=prompt_token_budget or DEFAULT_TOKEN_BUDGETS.get(model_type, 6000)
+        )
         self.model_name = model_name or self._get_default_model_name()
         self.api_url = api_url or self._get_default_api_url()
+        self.hedge_api_url = hedge_api_url  # 主接口过慢或熔断时使用的备用接口（同一模型）
         self.headers = {
             'Content-Type': 'application/json'
         }
         if bearer_token:
             self.headers['Authorization'] = f'Bearer {bearer_token}'
-        logger.info(f"初始化AI玩家，类型: {model_type}, API地址: {self.api_url}, MODEL名称: {self.model_name}")
+        # 凭据指纹：合并请求只在使用同一凭据的对局之间进行
+        self._credential = hashlib.blake2b(bearer_token.encode("utf-8"), digest_size=8).hexdigest() if bearer_token else ""
+        # 预先绑定本模型的各阶段指标，热路径上不再按标签查找
+        self._phase_metrics = {
+            phase: MOVE_PHASE_SECONDS.labels(phase, self.model_name)
+            for phase in ("prompt", "ttfb", "llm", "parse", "validate")
+        }
+        self._in_flight_metric = AI_CALLS_IN_FLIGHT.labels(self.model_name)
+        logger.info(f"初始化AI玩家，类型: {model_type}, API地址: {self.api_url}, MODEL名称: {self.model_name}, 流式: {stream}")
 
     def _get_default_model_name(self):
         """根据模型类型获取默认模型名称"""
         model_defaults = {
             "deepseek": "deepseek-chat",
             "openai": "gpt-4o",
-            "compatible": "DeepSeek-R1"
+            "compatible": "DeepSeek-R1",
+            "mcts": "mcts"
         }
         return model_defaults.get(self.model_type, "DeepSeek-R1")
 
@@ -78,21 +121,18 @@ class AIPlayer:
         api_defaults = {
             "deepseek": "https://api.deepseek.com/v1/chat/completions",
             "openai": "https://api.openai.com/v1/chat/completions",
-            "compatible": "http://ip:port/v1/chat/completions"
+            "compatible": "http://ip:port/v1/chat/completions",
+            "mcts": "mcts://local"
         }
         return api_defaults.get(self.model_type, "http://ip:port/v1/chat/completions")
 
+    def memory_footprint(self) -> int:
+        """估算本棋手占用的内存（字节），不含共享的连接池和指标"""
+        return sys.getsizeof(self) + sys.getsizeof(vars(self)) + self.prompt_builder.memory_footprint()
+
     def _format_board(self, board):
         """将棋盘转换为字符串表示"""
-        symbols = {0: ".", 1: "●", 2: "○"}
-        board_str = "当前棋盘状态：\n"
-        # 添加列标签
-        board_str += "   " + " ".join([f"{i:2}" for i in range(19)]) + "\n"
-        for i, row in enumerate(board):
-            # 添加行标签
-            board_str += f"{i:2} "
-            board_str += " ".join([symbols[cell] for cell in row]) + "\n"
-        return board_str
+        return format_board_state(board)
 
     def _format_chat_history(self, chat_history):
         """格式化聊天历史"""
@@ -105,69 +145,12 @@ class AIPlayer:
             chat_str += f"{player}: {msg['message']}\n"
         return chat_str
 
-    def _create_prompt(self, board, current_player, moves_history, chat_history=None):
-        """创建AI提示词"""
-        prompt = f"""我是一名围棋战术家，我的棋风以凌厉攻势著称，现在需要撕开对手防线。
-
-{format_board_state(board)}
-
-此刻轮到我执{'黑' if current_player == 1 else '白'}发起致命打击。
-
-{format_moves_history(moves_history)}
-
-{format_chat_history(chat_history)}
-
-我将执行：
-1. 闪电战局扫描 - 5秒内定位敌方最薄弱环节
-2. 死亡交叉分析 - 找出可同时威胁两个弱点的穿刺点
-3. 窒息战术选择 - 优先考虑能持续压缩对手生存空间的落点
-
-必须满足以下战争准则：
-1. 落子必须产生至少两个后续杀招威胁
-2. 优先阻断敌方大龙连接通道
-3. 当存在劫争可能时，主动制造战争迷雾
-4. 不能在已经存在棋子的地方落子
-
-立即输出作战方案：
-{{
-"move": [x,y], // 落子位置坐标
-"reasoning": "...", // 简明扼要的斩首战术说明（使用军事术语，如"钳形攻势/纵深突破"）
-"pressure_index": 0-100 // 计算该落子对敌方造成的心理压迫值
-}}
-
-血腥法则：
-
-1. 禁止任何防御性布阵
-2. 若存在同价值目标，选择使对手最痛苦的落点
-3. 当棋盘有血迹（吃子痕迹）时，必须持续扩大战果
-"""
-        prompt2 = f"""我是一位围棋大师，让我仔细思考下一步棋该如何落子。
-
-{format_board_state(board)}
-
-现在轮到我下{'黑棋' if current_player == 1 else '白棋'}了。
-
-{format_moves_history(moves_history)}
-
-{format_chat_history(chat_history)}
-
-我需要：
-1. 仔细评估当前局势
-2. 分析对手的意图和动向
-3. 制定整体战略部署
-
-我会以JSON格式表达我的思考结果：
-{{
-    "move": [x, y],     // x,y为0-18的整数，表示我决定落子的坐标
-    "reasoning": "..."  // 我为什么选择这个位置（以第一人称表述，如"我选择这里是因为..."）
-}}
-
-注意事项：
-- 确保我选择的位置是空位
-- 认真思考对手之前的对话（如果有）
-- 清晰地解释我的战术分析
-"""
-        return prompt
+    def _create_prompt(self, board: GoBoard, current_player, moves_history, chat_history=None):
+        """创建AI提示词（增量渲染，受token预算约束，附带本地评估的候选落点）"""
+        candidates = None
+        if self.candidate_count:
+            candidates = default_policy.candidates(board, current_player, self.candidate_count)
+        return self.prompt_builder.build(board, current_player, moves_history, chat_history, candidates)
 
     def _prepare_request_data(self, prompt):
         """根据模型类型准备请求数据"""
@@ -182,12 +165,13 @@ class AIPlayer:
             base_data.update({
                 "max_tokens": 8192,
                 "stop": None,
-                "stream": False
+                "stream": self.stream
             })
         elif self.model_type == "openai":
             base_data.update({
                 "max_tokens": 4096,
-                "response_format": {"type": "text"}
+                "response_format": {"type": "text"},
+                "stream": self.stream
             })
         else:  # compatible
             base_data.update({
@@ -196,7 +180,7 @@ class AIPlayer:
                 "presence_penalty": 0,
                 "response_format": {"type": "text"},
                 "stop": None,
-                "stream": False,
+                "stream": self.stream,
                 "stream_options": None,
                 "tools": None,
                 "tool_choice": "none",
@@ -206,72 +190,392 @@ class AIPlayer:
         
         return base_data
 
-    async def get_move(self, board, current_player, moves_history, chat_history=None):
-        """获取AI的下一步移动"""
-        import time
+    def _parse_move(self, ai_response: str, board: GoBoard, current_player: int) -> Tuple[int, int, str]:
+        """从完整的AI回复中解析并校验落子"""
+        parse_start = time.perf_counter()
+        try:
+            json_str = extract_json_from_markdown(ai_response)
+            logger.debug("提取的JSON字符串：\n%s", json_str)
+            move_data = json.loads(json_str)
+        except json.JSONDecodeError:
+            logger.error("AI返回的响应格式无效")
+            raise ModelResponseError(
+                "AI返回的响应格式无效",
+                '注意：我上一次的回复无法解析。这一次必须输出要求的JSON，例如 {"move": [x, y], "reasoning": "..."}。'
+            )
+        finally:
+            self._phase_metrics["parse"].observe(time.perf_counter() - parse_start)
+        return self._move_from_data(move_data, board, current_player)
+
+    def _move_from_data(self, move_data: dict, board: GoBoard, current_player: int) -> Tuple[int, int, str]:
+        """从解析出的JSON对象中取出并校验落子（单独请求和合并请求共用）"""
+        try:
+            move = move_data['move']
+            if isinstance(move, str) and move.strip().lower() == "pass":
+                x, y = PASS_MOVE
+            else:
+                x, y = move
+            reasoning = move_data.get('reasoning', '无解释')
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"AI返回的移动无效: {str(e)}")
+            raise ModelResponseError(
+                f"AI返回的移动无效: {str(e)}",
+                '注意：我上一次回复中的 move 字段无效。这一次必须输出 "move": [x, y]（0-18的整数）或 "move": "pass"。'
+            )
+        self._validate_move(x, y, board, current_player)
+        return x, y, reasoning
+
+    def _validate_move(self, x: int, y: int, board: GoBoard, current_player: int):
+        """校验坐标范围和落子合法性（停一手总是合法的）"""
+        if (x, y) == PASS_MOVE:
+            return
+        validate_start = time.perf_counter()
+        # 验证坐标是否有效
+        if not (isinstance(x, int) and isinstance(y, int) and 0 <= x < 19 and 0 <= y < 19):
+            reason = "坐标超出棋盘范围"
+        # 验证位置是否已被占用，以及是否为自杀或劫争禁着
+        elif not board.is_empty(x, y):
+            reason = "该位置已被占用"
+        elif not board.is_legal(x, y, current_player):
+            reason = "该位置为禁着点（自杀或劫争）"
+        else:
+            self._phase_metrics["validate"].observe(time.perf_counter() - validate_start)
+            return
+        self._phase_metrics["validate"].observe(time.perf_counter() - validate_start)
+        logger.error(f"AI返回的移动无效: ({x}, {y}) {reason}")
+        raise InvalidMoveError(x, y, reason)
+
+    async def _read_stream(self, response, board: GoBoard, current_player: int, start_time: float,
+                           on_thinking: Optional[Callable[[str], Awaitable[None]]] = None,
+                           request_start: Optional[float] = None) -> Tuple[int, int, str]:
+        """逐块读取SSE流，解析到合法的move字段后立即返回，不等待流结束"""
+        content = ""
+        reasoning_text = ""
+        pending = ""  # 尚未转发的思考增量
+        last_flush = time.time()
+        first_token_time = None
+        scan_from = 0  # content中需要重新匹配move的起点
+        in_think_tag = False
+
+        async def flush():
+            nonlocal pending, last_flush
+            if pending and on_thinking:
+                await on_thinking(pending)
+            pending = ""
+            last_flush = time.time()
+
+        async for raw_line in response.content:
+            line = raw_line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == b"[DONE]":
+                break
+            try:
+                event = json.loads(payload)
+                delta = event['choices'][0].get('delta') or {}
+            except (json.JSONDecodeError, KeyError, IndexError):
+                continue
+
+            thinking_delta = delta.get('reasoning_content') or ""
+            content_delta = delta.get('content') or ""
+            if not thinking_delta and not content_delta:
+                continue
+            if first_token_time is None:
+                first_token_time = time.time()
+                if request_start is not None:
+                    self._phase_metrics["ttfb"].observe(time.perf_counter() - request_start)
+                logger.info(f"AI首个token耗时: {round(first_token_time - start_time, 2)}秒")
+
+            # 兼容把思考过程放在 <think>...</think> 中的模型
+            if content_delta:
+                prev_len = len(content)
+                content += content_delta
+                think_start = prev_len
+                if not prev_len and content_delta.lstrip().startswith("<think>"):
+                    in_think_tag = True
+                    think_start = content.index("<think>") + len("<think>")
+                if in_think_tag:
+                    end = content.find("</think>", max(0, prev_len - len("</think>")))
+                    if end == -1:
+                        thinking_delta += content[think_start:]
+                    else:
+                        in_think_tag = False
+                        thinking_delta += content[think_start:end]
+                        scan_from = end + len("</think>")
+
+            if thinking_delta:
+                reasoning_text += thinking_delta
+                pending += thinking_delta
+                if len(pending) >= THINKING_FLUSH_CHARS or time.time() - last_flush >= THINKING_FLUSH_INTERVAL:
+                    await flush()
+
+            if in_think_tag:
+                continue
+            match = MOVE_PATTERN.search(content, scan_from)
+            if match:
+                await flush()
+                x, y = int(match.group(1)), int(match.group(2))
+                self._validate_move(x, y, board, current_player)
+                partial = PARTIAL_REASONING_PATTERN.search(content, match.end())
+                if partial and partial.group(1):
+                    reasoning = partial.group(1)
+                else:
+                    reasoning = reasoning_text.strip() or '无解释'
+                logger.info(f"AI流式响应提前解析到落子 ({x}, {y})，落子耗时: {round(time.time() - start_time, 2)}秒")
+                return x, y, reasoning
+            # 只需要从末尾附近重新匹配，避免重复扫描整个回复
+            scan_from = max(scan_from, len(content) - 64)
+
+        await flush()
+        logger.debug("AI流式响应: %s", content)
+        x, y, reasoning = self._parse_move(content, board, current_player)
+        logger.info(f"AI流式响应结束后解析到落子 ({x}, {y})，落子耗时: {round(time.time() - start_time, 2)}秒")
+        return x, y, reasoning
+
+    async def get_move(self, board: GoBoard, current_player, moves_history, chat_history=None,
+                       on_thinking: Optional[Callable[[str], Awaitable[None]]] = None,
+                       scoring: str = AREA_SCORING, komi: Optional[float] = None,
+                       captures: Optional[Dict[int, int]] = None):
+        """
+        获取AI的下一步移动，流式模式下通过 on_thinking 回调转发思考过程增量
+
+        scoring/komi/captures 为本局的计分规则、贴目（None 为该规则的默认值）和双方提子数，
+        本地 MCTS 用它们做搜索和停一手判断
+        """
+        self._in_flight_metric.inc()
+        try:
+            return await self._get_move(board, current_player, moves_history, chat_history, on_thinking,
+                                        scoring, komi, captures)
+        finally:
+            self._in_flight_metric.dec()
+
+    async def _get_move(self, board: GoBoard, current_player, moves_history, chat_history,
+                        on_thinking: Optional[Callable[[str], Awaitable[None]]],
+                        scoring: str, komi: Optional[float], captures: Optional[Dict[int, int]]):
         start_time = time.time()
+
+        # 开局前几手直接从定式库中取子，不调用模型
+        if self.use_opening_book and opening_book.enabled:
+            book_move = opening_book.choose(board, current_player, len(moves_history))
+            if book_move is not None:
+                AI_MOVES.labels(self.model_name, "book").inc()
+                elapsed_time = round(time.time() - start_time, 2)
+                logger.info(f"使用定式库落子: ({book_move.x}, {book_move.y})，共 {book_move.games} 局")
+                reasoning = (f"这是定式库中的常见下法：该局面在 {book_move.games} 局中出现，"
+                             f"这一手的胜率为 {book_move.win_rate:.0%}")
+                return book_move.x, book_move.y, reasoning, elapsed_time
+
+        # 本地蒙特卡洛树搜索，不调用模型
+        if self.model_type == "mcts":
+            return await self._mcts_move(board, current_player, moves_history, start_time,
+                                         scoring, komi, captures)
+
+        # 相同模型、模板和局面下已有的落子结果，仍需通过合法性检查
+        cache_key = None
+        if self.use_response_cache and response_cache.enabled:
+            cache_key = make_cache_key(
+                self.model_name, self.prompt_builder.template_id, board.position_key, current_player
+            )
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                x, y = cached["x"], cached["y"]
+                if (x, y) == PASS_MOVE or board.is_legal(x, y, current_player):
+                    response_cache.record_saved(cached)
+                    AI_MOVES.labels(self.model_name, "cache").inc()
+                    elapsed_time = round(time.time() - start_time, 2)
+                    logger.info(f"命中落子缓存: ({x}, {y})，节省约 {cached['elapsed']}秒")
+                    return x, y, cached["reasoning"], elapsed_time
+                response_cache.record_rejected()
         
+        prompt_start = time.perf_counter()
         prompt = self._create_prompt(board, current_player, moves_history, chat_history)
-        logger.info(f"AI提示词: {prompt}")
+        self._phase_metrics["prompt"].observe(time.perf_counter() - prompt_start)
+        logger.debug("AI提示词: %s", prompt)
+        logger.info(f"提示词大小: {self.prompt_builder.last_prompt_bytes}字节, 估算token: {self.prompt_builder.last_prompt_tokens}")
         
-        request_data = self._prepare_request_data(prompt)
+        # 启用合并请求时，第一次请求与同一接口上其他对局合并；需要纠正时改为单独请求
+        batched = batch_registry.enabled and not self.stream
+
+        def request(correction):
+            if batched and correction is None:
+                return self._request_move_batched(board, current_player, moves_history)
+            return self._request_move(
+                self.api_url, prompt, correction, board, current_player, start_time, on_thinking
+            )
+
+        try:
+            x, y, reasoning = await resilient_caller.call(
+                self.api_url,
+                request,
+                self.hedge_api_url,
+                (lambda correction: self._request_move(
+                    self.hedge_api_url, prompt, correction, board, current_player, start_time
+                )) if self.hedge_api_url else None
+            )
+        except Exception as e:
+            logger.error(f"获取AI移动时出错: {str(e) or type(e).__name__}")
+            return self.fallback_move(board, current_player, start_time)
+
+        AI_MOVES.labels(self.model_name, "llm").inc()
+        end_time = time.time()
+        elapsed_time = round(end_time - start_time, 2)
+        logger.info(f"AI决定在 ({x}, {y}) 落子，原因: {reasoning}，耗时: {elapsed_time}秒")
+        if cache_key is not None:
+            await self._store_cached_move(cache_key, x, y, reasoning, elapsed_time)
+        return x, y, reasoning, elapsed_time
+
+    async def _mcts_move(self, board: GoBoard, current_player: int, moves_history, start_time: float,
+                         scoring: str = AREA_SCORING, komi: Optional[float] = None,
+                         captures: Optional[Dict[int, int]] = None):
+        """
+        在进程池中做一次 MCTS 搜索；对方停一手且按本局规则己方领先、或无处可下时停一手
+
+        模拟只数子，按本局贴目计算胜负：下完的棋局里数目法与数子法的差别只在提子和
+        单官，胜负通常一致，停一手则按本局规则（含提子数）实际计分
+        """
+        if komi is None:
+            komi = DEFAULT_KOMI[scoring]
+        candidates = default_policy.candidates(board, current_player, mcts_engine.config.candidates)
+        reasoning = None
+        if not candidates:
+            reasoning = "我发现已经没有有价值的落子位置了，这一手我选择停一手"
+        elif moves_history and tuple(moves_history[-1][:2]) == PASS_MOVE:
+            score = score_board(board, scoring, komi, captures)
+            if score.winner == current_player:
+                rule = "数子法" if scoring == AREA_SCORING else "数目法"
+                reasoning = f"对方停一手，按{rule}（贴 {komi:g}）计分为 {score.summary}，我方领先，我也停一手"
+        if reasoning is not None:
+            AI_MOVES.labels(self.model_name, "mcts").inc()
+            x, y = PASS_MOVE
+            return x, y, reasoning, round(time.time() - start_time, 2)
 
+        size = board.size
+        ko = board.ko_point if board.ko_color == current_player else -1
+        result = await mcts_engine.search(
+            size, bytes(board.cells), current_player, ko, komi, [y * size + x for x, y in candidates]
+        )
+        # 模拟中不检查全局同形，这里按访问次数依次取第一个合法的着手
+        for x, y, visits, wins in result.moves:
+            if board.is_legal(x, y, current_player):
+                break
+        else:
+            return self.fallback_move(board, current_player, start_time)
+
+        AI_MOVES.labels(self.model_name, "mcts").inc()
+        elapsed_time = round(time.time() - start_time, 2)
+        win_rate = wins / visits if visits else 0.0
+        logger.info(f"MCTS 决定在 ({x}, {y}) 落子，{result.playouts} 次模拟"
+                    f"（{result.playouts_per_second:.0f} 次/秒，{result.workers} 个进程），胜率 {win_rate:.0%}")
+        reasoning = (f"经过 {result.playouts} 次随机模拟（{result.playouts_per_second:.0f} 次/秒），"
+                     f"这一手访问 {visits} 次，估计胜率 {win_rate:.0%}")
+        return x, y, reasoning, elapsed_time
+
+    async def _request_move(self, api_url: str, prompt: str, correction: Optional[str], board: GoBoard,
+                            current_player: int, start_time: float,
+                            on_thinking: Optional[Callable[[str], Awaitable[None]]] = None) -> Tuple[int, int, str]:
+        """向一个接口请求一次落子，correction 为上一次回复无效时追加的纠正说明"""
+        if correction:
+            prompt = f"{prompt}\n{correction}\n"
+        request_data = self._prepare_request_data(prompt)
+        session = session_registry.get(api_url)
+        request_start = time.perf_counter()
         try:
-            async with aiohttp.ClientSession() as session:
+            async with session.post(
+                api_url,
+                headers=self.headers,
+                json=request_data,
+                trace_request_ctx={"model": self.model_name}
+            ) as response:
+                if response.status != 200:
+                    logger.error(f"API请求失败: {response.status}")
+                    raise Exception(f"API请求失败: {response.status}")
+
+                if self.stream:
+                    return await self._read_stream(
+                        response, board, current_player, start_time, on_thinking, request_start
+                    )
+                # 非流式模式下以收到响应头作为首字节时间
+                self._phase_metrics["ttfb"].observe(time.perf_counter() - request_start)
+                result = await response.json()
+                logger.debug("AI响应: %s", result)
+
+                # 提取AI响应内容
+                ai_response = result['choices'][0]['message']['content']
+
+                # 从Markdown中提取JSON并解析
+                return self._parse_move(ai_response, board, current_player)
+        finally:
+            self._phase_metrics["llm"].observe(time.perf_counter() - request_start)
+
+    async def _request_move_batched(self, board: GoBoard, current_player: int,
+                                    moves_history) -> Tuple[int, int, str]:
+        """把本局的落子请求放入该接口的收集窗口，与其他对局合并发出"""
+        candidates = None
+        if self.candidate_count:
+            candidates = default_policy.candidates(board, current_player, self.candidate_count)
+        batcher = batch_registry.get(self.api_url, self.model_name, self._batch_sender(), self._credential)
+        return await batcher.submit(
+            lambda position_id: self.prompt_builder.build_position(
+                position_id, board, current_player, moves_history, candidates
+            ),
+            lambda entry: self._move_from_data(entry, board, current_player)
+        )
+
+    def _batch_sender(self) -> Callable[[str], Awaitable[str]]:
+        """
+        合并请求的发送函数，只引用接口地址、请求头和请求模板
+
+        收集窗口在同一接口、模型和凭据的对局之间共享并长期存在，不能持有本棋手对象
+        """
+        api_url = self.api_url
+        model_name = self.model_name
+        headers = dict(self.headers)
+        template = self._prepare_request_data("")
+        ttfb_metric = self._phase_metrics["ttfb"]
+        llm_metric = self._phase_metrics["llm"]
+
+        async def send(prompt: str) -> str:
+            request_data = dict(template, messages=[{"role": "user", "content": prompt}])
+            session = session_registry.get(api_url)
+            request_start = time.perf_counter()
+            try:
                 async with session.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=request_data
+                    api_url,
+                    headers=headers,
+                    json=request_data,
+                    trace_request_ctx={"model": model_name}
                 ) as response:
                     if response.status != 200:
-                        logger.error(f"API请求失败: {response.status}")
+                        logger.error(f"合并请求失败: {response.status}")
                         raise Exception(f"API请求失败: {response.status}")
-                    
+                    ttfb_metric.observe(time.perf_counter() - request_start)
                     result = await response.json()
-                    logger.info(f"AI响应: {result}")
-                    
-                    # 提取AI响应内容
-                    ai_response = result['choices'][0]['message']['content']
-                    
-                    # 从Markdown中提取JSON并解析
-                    try:
-                        json_str = extract_json_from_markdown(ai_response)
-                        logger.info(f"提取的JSON字符串：\n{json_str}")
-                        move_data = json.loads(json_str)
-                        x, y = move_data['move']
-                        reasoning = move_data.get('reasoning', '无解释')
-                        # 验证坐标是否有效
-                        if not (0 <= x < 19 and 0 <= y < 19):
-                            raise ValueError("无效的坐标范围")
-                        
-                        # 验证位置是否已被占用
-                        if board[y][x] != 0:
-                            raise ValueError("该位置已被占用")
-                        
-                        end_time = time.time()
-                        elapsed_time = round(end_time - start_time, 2)
-                        logger.info(f"AI决定在 ({x}, {y}) 落子，原因: {reasoning}，耗时: {elapsed_time}秒")
-                        return x, y, reasoning, elapsed_time
-                        
-                    except json.JSONDecodeError:
-                        logger.error("AI返回的响应格式无效")
-                        raise Exception("AI返回的响应格式无效")
-                    except (KeyError, ValueError) as e:
-                        logger.error(f"AI返回的移动无效: {str(e)}")
-                        raise Exception(f"AI返回的移动无效: {str(e)}")
-                        
+                    return result['choices'][0]['message']['content']
+            finally:
+                llm_metric.observe(time.perf_counter() - request_start)
+
+        return send
+
+    async def _store_cached_move(self, cache_key: str, x: int, y: int, reasoning: str, elapsed_time: float):
+        """写入落子缓存，缓存出错不影响本次落子"""
+        try:
+            await response_cache.put(cache_key, x, y, reasoning, elapsed_time)
         except Exception as e:
-            logger.error(f"获取AI移动时出错: {str(e)}")
-            # 在出错时返回一个随机的有效移动
-            import random
-            empty_positions = [
-                (x, y) for x in range(19) for y in range(19)
-                if board[y][x] == 0
-            ]
-            if empty_positions:
-                x, y = random.choice(empty_positions)
-                logger.warning(f"使用随机移动: ({x}, {y})")
-                end_time = time.time()
-                elapsed_time = round(end_time - start_time, 2)
-                return x, y, "抱歉，我遇到了一些问题，所以这一手我选择了一个随机的位置", elapsed_time
-            return None, None, "我发现已经没有可以落子的位置了", 0
+            logger.error(f"写入落子缓存失败: {str(e)}")
+
+    def fallback_move(self, board: GoBoard, current_player: int, start_time: float = None, reason: str = "error"):
+        """在出错或超时时用本地策略选一手（不填自己的眼），无处可下时停一手"""
+        self.fallback_count += 1
+        FALLBACK_MOVES.labels(self.model_name, reason).inc()
+        AI_MOVES.labels(self.model_name, "fallback").inc()
+        end_time = time.time()
+        elapsed_time = round(end_time - start_time, 2) if start_time else 0
+        move = default_policy.choose(board, current_player)
+        if move is not None:
+            x, y = move
+            logger.warning(f"使用本地策略落子: ({x}, {y})")
+            return x, y, "抱歉，我遇到了一些问题，所以这一手我按本地评估选择了一个位置", elapsed_time
+        logger.warning("没有可下的有效位置，停一手")
+        x, y = PASS_MOVE
+        return x, y, "我发现已经没有有价值的落子位置了，这一手我选择停一手", elapsed_time
@@ -0,0 +1,220 @@
+"""同一模型接口上多盘棋的落子请求合并（微批处理）
+
+许多盘 AI 对局共用一个模型接口时，每一手单独请求会浪费服务商的限流额度，也
+增加了每次请求的固定开销。启用后（GO_BATCH_WINDOW_MS > 0），同一 (api_url, 模型名, 凭据)
+的落子请求先进入一个短暂的收集窗口，窗口结束或凑满 max_batch 盘时合并成一个
+多局面提示词（BATCH_TEMPLATE）发出，模型按局面编号给出每盘棋的落子，再分别交回
+各自等待的对局。
+
+- 合并请求整体失败（网络错误、超时）时，该批所有对局按各自的重试策略重试
+- 某盘棋的回复缺失或落子无效时，只有这一盘改为单独请求并附带纠正说明
+- 等待者已超时或取消的局面在发出前被剔除
+- 统计批次数、平均装填率（每批盘数 / max_batch）和因等待窗口增加的排队时间，
+  装填率和排队时间同时导出到 /metrics
+
+服务商的离线批处理接口（以小时计的异步任务）不适合逐手对局，因此只实现多局面提示词。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import MOVE_PHASE_SECONDS, registry
+from prompt_builder import BATCH_TEMPLATE
+from resilience import ModelResponseError
+
+logger = logging.getLogger('go_game')
+
+BATCH_FILL_RATIO = registry.histogram(
+    "go_batch_fill_ratio", "合并请求的装填率（每批盘数 / 最大批量）", ("model",),
+    buckets=(0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1.0))
+
+# send(prompt) 发出一次请求并返回模型回复的文本
+SendPrompt = Callable[[str], Awaitable[str]]
+# parse(entry) 把回复中某盘棋的一项解析为 (x, y, reasoning)，无效时抛出 ModelResponseError
+ParseEntry = Callable[[Dict[str, Any]], Tuple[int, int, str]]
+
+
+@dataclass
+class BatchConfig:
+    """合并请求的配置"""
+    window: float = 0.0  # 收集窗口（秒），0 表示不合并
+    max_batch: int = 8  # 每批最多盘数
+
+    @classmethod
+    def from_env(cls) -> "BatchConfig":
+        """从 GO_BATCH_* 环境变量读取配置"""
+        return cls(
+            window=float(os.getenv("GO_BATCH_WINDOW_MS", 0)) / 1000,
+            max_batch=int(os.getenv("GO_BATCH_MAX_SIZE", 8)),
+        )
+
+
+class _Pending:
+    __slots__ = ("position_id", "text", "parse", "future", "enqueued_at")
+
+    def __init__(self, position_id: str, text: str, parse: ParseEntry, future: asyncio.Future):
+        self.position_id = position_id
+        self.text = text
+        self.parse = parse
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+def _extract_entries(text: str) -> Dict[str, Dict[str, Any]]:
+    """从合并请求的回复中取出 {局面编号: 该盘的一项}"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        raise ValueError("回复中没有JSON对象")
+    data = json.loads(text[start:end + 1])
+    moves = data.get("moves") if isinstance(data, dict) else None
+    if not isinstance(moves, list):
+        raise ValueError("回复中缺少 moves 数组")
+    return {str(entry.get("id")): entry for entry in moves if isinstance(entry, dict)}
+
+
+class MoveBatcher:
+    """一个 (api_url, 模型名, 凭据) 的收集窗口"""
+
+    def __init__(self, model_name: str, send: SendPrompt, config: BatchConfig):
+        self.model_name = model_name
+        self.send = send
+        self.config = config
+        self._pending: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: set = set()
+        self._next_id = 0
+        self.batches = 0
+        self.positions = 0
+        self.fill_total = 0.0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.failures = 0  # 整批失败次数
+        self.rejected = 0  # 回复缺失或无效、改为单独请求的局面数
+        self._wait_metric = MOVE_PHASE_SECONDS.labels("batch_wait", model_name)
+        self._fill_metric = BATCH_FILL_RATIO.labels(model_name)
+
+    async def submit(self, render: Callable[[str], str], parse: ParseEntry) -> Tuple[int, int, str]:
+        """
+        加入收集窗口并等待该盘的落子
+        render(position_id) 渲染带编号的局面文本
+        """
+        self._next_id += 1
+        position_id = f"p{self._next_id}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_Pending(position_id, render(position_id), parse, future))
+        if len(self._pending) >= self.config.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.config.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # 已超时或取消的等待者不再发出
+        batch = [item for item in self._pending if not item.future.done()]
+        self._pending = []
+        if not batch:
+            return
+        task = asyncio.create_task(self._send_batch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send_batch(self, batch: List[_Pending]):
+        now = time.perf_counter()
+        fill = len(batch) / self.config.max_batch
+        self.batches += 1
+        self.positions += len(batch)
+        self.fill_total += fill
+        self._fill_metric.observe(fill)
+        for item in batch:
+            wait = now - item.enqueued_at
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self._wait_metric.observe(wait)
+
+        prompt = BATCH_TEMPLATE.format(count=len(batch), positions="".join(item.text for item in batch))
+        logger.info(f"合并 {len(batch)} 盘棋的落子请求（{self.model_name}）")
+        try:
+            entries = _extract_entries(await self.send(prompt))
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"合并请求失败（{len(batch)} 盘）: {str(e) or type(e).__name__}")
+            if isinstance(e, (ValueError, KeyError)):
+                # 回复无法解析：每盘改为单独请求
+                e = ModelResponseError(f"合并请求的回复无法解析: {str(e)}", "注意：请严格按要求的JSON格式回复。")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        for item in batch:
+            if item.future.done():
+                continue
+            entry = entries.get(item.position_id)
+            try:
+                if entry is None:
+                    raise ModelResponseError(
+                        f"合并请求的回复中缺少局面 {item.position_id}",
+                        "注意：这一次只需要为这一盘棋给出落子，并严格按要求的JSON格式回复。"
+                    )
+                item.future.set_result(item.parse(entry))
+            except ModelResponseError as e:
+                self.rejected += 1
+                item.future.set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "positions": self.positions,
+            "pending": len(self._pending),
+            "avg_batch_size": round(self.positions / self.batches, 2) if self.batches else 0,
+            "avg_fill_ratio": round(self.fill_total / self.batches, 3) if self.batches else 0,
+            "avg_queue_wait": round(self.wait_total / self.positions, 4) if self.positions else 0,
+            "max_queue_wait": round(self.wait_max, 4),
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+class BatcherRegistry:
+    """按 (api_url, 模型名, 凭据指纹) 共享的收集窗口"""
+
+    def __init__(self, config: Optional[BatchConfig] = None):
+        self.config = config or BatchConfig()
+        self._batchers: Dict[Tuple[str, str, str], MoveBatcher] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.window > 0 and self.config.max_batch > 1
+
+    def get(self, api_url: str, model_name: str, send: SendPrompt, credential: str = "") -> MoveBatcher:
+        """
+        获取该接口、模型和凭据的收集窗口，不存在时用 send 创建
+
+        credential 为请求凭据的指纹：不同凭据的对局不合并，各自用自己的凭据计费和鉴权。
+        send 只应引用请求所需的数据，不应持有某个棋手对象，否则该棋手会一直无法释放
+        """
+        key = (api_url, model_name, credential)
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            batcher = self._batchers[key] = MoveBatcher(model_name, send, self.config)
+        return batcher
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.config.window * 1000,
+            "max_batch": self.config.max_batch,
+            "endpoints": {
+                "|".join(part for part in key if part): batcher.stats() for key, batcher in self._batchers.items()
+            },
+        }
+
+
+# 全局共享的合并请求注册表
+batch_registry = BatcherRegistry(BatchConfig.from_env())
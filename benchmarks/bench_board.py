@@ -0,0 +1,59 @@
+"""规则引擎微基准：随机下完整盘棋，统计每秒落子数
+
+用法: python benchmarks/bench_board.py [--games 200] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from go_board import BOARD_SIZE, GoBoard  # noqa: E402
+
+
+def play_random_game(rng: random.Random, size: int = BOARD_SIZE, max_moves: int = None) -> int:
+    """双方随机落子（不填己方眼）直到都无处可下，返回总手数"""
+    board = GoBoard(size)
+    max_moves = max_moves or size * size * 3
+    color = 1
+    moves = 0
+    passes = 0
+    while passes < 2 and moves < max_moves:
+        candidates = board.empty_points()
+        rng.shuffle(candidates)
+        for x, y in candidates:
+            if board.is_legal(x, y, color) and not board.is_eye(x, y, color):
+                board.play(x, y, color)
+                moves += 1
+                passes = 0
+                break
+        else:
+            passes += 1
+        color = 3 - color
+    return moves
+
+
+def main():
+    parser = argparse.ArgumentParser(description="围棋规则引擎基准测试")
+    parser.add_argument("--games", type=int, default=200, help="随机对局数")
+    parser.add_argument("--size", type=int, default=BOARD_SIZE, help="棋盘大小")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    total_moves = 0
+    start = time.perf_counter()
+    for _ in range(args.games):
+        total_moves += play_random_game(rng, args.size)
+    elapsed = time.perf_counter() - start
+
+    print(f"对局数: {args.games}")
+    print(f"总手数: {total_moves} (平均 {total_moves / args.games:.1f} 手/局)")
+    print(f"耗时: {elapsed:.2f}秒")
+    print(f"速度: {total_moves / elapsed:,.0f} 手/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""本地 MCTS 基准：单进程模拟速度和根并行的加速比
+
+先在当前进程中直接调用 search() 测量纯模拟速度，再通过 MCTSEngine 的进程池分别
+用 1 个和 N 个进程（根并行）搜索同一局面，比较每秒模拟数。
+
+用法: python benchmarks/bench_mcts.py [--size 9] [--seconds 2] [--workers 4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcts import BLACK, MCTSConfig, MCTSEngine, search  # noqa: E402
+
+
+async def run_engine(size: int, seconds: float, workers: int, searches: int):
+    """用 workers 个进程搜索空棋盘 searches 次（第一次用于启动进程池，不计入）"""
+    engine = MCTSEngine(MCTSConfig(playouts=10 ** 9, time_budget=seconds, workers=workers, pool_size=workers))
+    cells = bytes(size * size)
+    root_moves = list(range(size * size))
+    try:
+        await engine.search(size, cells, BLACK, -1, 7.5, root_moves, seed=0)
+        results = [await engine.search(size, cells, BLACK, -1, 7.5, root_moves, seed=i + 1)
+                   for i in range(searches)]
+    finally:
+        engine.close()
+    playouts = sum(result.playouts for result in results)
+    elapsed = sum(result.seconds for result in results)
+    return playouts / elapsed, results[-1].moves[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 MCTS 基准测试")
+    parser.add_argument("--size", type=int, default=9, help="棋盘大小")
+    parser.add_argument("--seconds", type=float, default=2.0, help="每次搜索的时间预算（秒）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="根并行的进程数")
+    parser.add_argument("--searches", type=int, default=3, help="每种配置的搜索次数")
+    args = parser.parse_args()
+
+    size = args.size
+    result = search(size, bytes(size * size), BLACK, -1, 7.5, list(range(size * size)),
+                    10 ** 9, args.seconds, seed=1)
+    print(f"{size}路空棋盘，每次搜索 {args.seconds} 秒")
+    print(f"当前进程: {result['playouts']} 次模拟，{result['playouts'] / result['seconds']:.0f} 次/秒")
+
+    single, _ = asyncio.run(run_engine(size, args.seconds, 1, args.searches))
+    print(f"进程池 1 个进程: {single:.0f} 次/秒")
+    if args.workers > 1:
+        parallel, (x, y, visits, wins) = asyncio.run(run_engine(size, args.seconds, args.workers, args.searches))
+        print(f"进程池 {args.workers} 个进程（根并行）: {parallel:.0f} 次/秒，加速 {parallel / single:.2f} 倍")
+        print(f"最后一次搜索选择 ({x}, {y})，访问 {visits} 次，胜率 {wins / visits:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""指标埋点开销微基准
+
+分别测量热路径上的几种记录方式的单次耗时，并按每一手大约记录的次数估算
+每手的埋点总开销，与一次本地落子评估（最便宜的一手）对比；最后测量 /metrics
+抓取时生成文本的耗时。
+
+用法: python benchmarks/bench_metrics.py [--iterations 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from go_board import GoBoard  # noqa: E402
+from metrics import MetricsRegistry  # noqa: E402
+from policy import MovePolicy  # noqa: E402
+
+# 一次成功的模型落子大约记录的指标次数：prompt/connect/ttfb/llm/parse/validate 六个阶段、
+# 一次落子计数、进行中请求数加减各一次、一次广播
+OBSERVATIONS_PER_MOVE = 11
+
+
+def per_call_ns(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指标埋点开销基准测试")
+    parser.add_argument("--iterations", type=int, default=200000, help="每项测量的调用次数")
+    parser.add_argument("--series", type=int, default=50, help="抓取测试中的模型（标签组合）数")
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "bench", ("phase", "model"))
+    counter = registry.counter("bench_total", "bench", ("model",))
+    gauge = registry.gauge("bench_in_flight", "bench", ("model",))
+    bound = histogram.labels("llm", "model-a")
+    bound_counter = counter.labels("model-a")
+    bound_gauge = gauge.labels("model-a")
+
+    n = args.iterations
+    baseline = per_call_ns(lambda: None, n)
+    results = {
+        "预绑定 histogram.observe": per_call_ns(lambda: bound.observe(0.123), n),
+        "每次查找 labels().observe": per_call_ns(lambda: histogram.labels("llm", "model-a").observe(0.123), n),
+        "perf_counter 计时 + observe": per_call_ns(
+            lambda: bound.observe(time.perf_counter() - time.perf_counter()), n),
+        "预绑定 counter.inc": per_call_ns(bound_counter.inc, n),
+        "预绑定 gauge.inc + dec": per_call_ns(lambda: (bound_gauge.inc(), bound_gauge.dec()), n),
+    }
+    print(f"空调用基线: {baseline:.0f} 纳秒")
+    for name, ns in results.items():
+        print(f"{name}: {ns - baseline:.0f} 纳秒")
+
+    per_move_us = (results["perf_counter 计时 + observe"] - baseline) * OBSERVATIONS_PER_MOVE / 1000
+    board = GoBoard()
+    policy = MovePolicy()
+    evaluate_us = per_call_ns(lambda: policy.evaluate(board, 1), 200) / 1000
+    print(f"每手约 {OBSERVATIONS_PER_MOVE} 次记录: {per_move_us:.2f} 微秒"
+          f"（本地落子评估一次 {evaluate_us:.0f} 微秒，占 {per_move_us / evaluate_us:.1%}）")
+
+    for i in range(args.series):
+        for phase in ("prompt", "connect", "ttfb", "llm", "parse", "validate"):
+            histogram.labels(phase, f"model-{i}").observe(0.01 * i)
+    render_ms = per_call_ns(registry.render, 50) / 1e6
+    print(f"抓取 {args.series * 6} 个直方图序列: {render_ms:.2f} 毫秒/次")
+
+
+if __name__ == "__main__":
+    main()
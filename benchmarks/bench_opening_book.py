@@ -0,0 +1,84 @@
+"""定式库微基准：建库耗时、库大小和单次查询耗时
+
+用本地评估策略自对弈生成一批对局写入临时棋谱库，建立定式库后在库中的局面
+（命中）和随机局面（未命中）上分别测量 OpeningBook.lookup 的平均耗时。
+
+用法: python benchmarks/bench_opening_book.py [--games 500] [--plies 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game_record import ArchiveWriter, GameRecord  # noqa: E402
+from go_board import GoBoard  # noqa: E402
+from opening_book import OpeningBook, build_book  # noqa: E402
+from policy import MovePolicy  # noqa: E402
+
+
+def self_play(rng: random.Random, plies: int) -> GameRecord:
+    """用评估策略下出开局前 plies 手（候选点少，开局重复度高）"""
+    policy = MovePolicy()
+    board = GoBoard()
+    moves = []
+    color = 1
+    for _ in range(plies):
+        move = policy.choose(board, color, top_k=3, rng=rng)
+        if move is None:
+            break
+        board.play(move[0], move[1], color)
+        moves.append((move[0], move[1], color))
+        color = 3 - color
+    return GameRecord(winner=rng.choice((1, 2)), moves=moves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="定式库基准测试")
+    parser.add_argument("--games", type=int, default=500, help="自对弈局数")
+    parser.add_argument("--plies", type=int, default=20, help="收录前多少手")
+    parser.add_argument("--lookups", type=int, default=20000, help="查询次数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive_path = os.path.join(tmp, "games.gor")
+        book_path = os.path.join(tmp, "book.gob")
+        records = [self_play(rng, args.plies) for _ in range(args.games)]
+        with ArchiveWriter(archive_path) as writer:
+            for record in records:
+                writer.append(record)
+
+        start = time.perf_counter()
+        entries = build_book([archive_path], book_path, args.plies, min_games=1)
+        build_s = time.perf_counter() - start
+        print(f"建库: {args.games} 局, {entries} 个条目, 耗时 {build_s:.2f} 秒, "
+              f"文件 {os.path.getsize(book_path) / 1024:.1f} KB")
+
+        book = OpeningBook(book_path)
+        hits = [record.board_at(rng.randrange(len(record.moves))) for record in records[:200]]
+        misses = []
+        for _ in range(200):
+            board = GoBoard()
+            for i in range(8):
+                x, y = rng.randrange(19), rng.randrange(19)
+                if board.is_legal(x, y, 1 + i % 2):
+                    board.play(x, y, 1 + i % 2)
+            misses.append(board)
+
+        for name, boards in (("命中局面", hits), ("未命中局面", misses)):
+            found = sum(1 for board in boards if book.lookup(board, 1) or book.lookup(board, 2))
+            start = time.perf_counter()
+            for i in range(args.lookups):
+                book.lookup(boards[i % len(boards)], 1 + i % 2)
+            lookup_us = (time.perf_counter() - start) / args.lookups * 1e6
+            print(f"{name}: 有库中着手 {found}/{len(boards)}, 单次查询平均 {lookup_us:.1f} 微秒")
+        book.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""本地落子评估微基准：统计整盘评估和取候选点的耗时
+
+在随机对局的各个阶段取局面，分别测量 MovePolicy.evaluate 和 candidates 的平均耗时。
+
+用法: python benchmarks/bench_policy.py [--positions 200] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from go_board import BOARD_SIZE, GoBoard  # noqa: E402
+from policy import MovePolicy  # noqa: E402
+
+
+def sample_positions(rng: random.Random, count: int, size: int = BOARD_SIZE):
+    """用评估策略自对弈，按不同手数截取局面"""
+    policy = MovePolicy()
+    positions = []
+    while len(positions) < count:
+        board = GoBoard(size)
+        color = 1
+        stop = rng.randrange(0, size * size)
+        for _ in range(stop):
+            move = policy.choose(board, color, rng=rng)
+            if move is None:
+                break
+            board.play(move[0], move[1], color)
+            color = 3 - color
+        positions.append((board, color))
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地落子评估基准测试")
+    parser.add_argument("--positions", type=int, default=200, help="测试局面数")
+    parser.add_argument("--repeat", type=int, default=20, help="每个局面重复评估次数")
+    parser.add_argument("--size", type=int, default=BOARD_SIZE, help="棋盘大小")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    positions = sample_positions(rng, args.positions, args.size)
+    policy = MovePolicy()
+
+    start = time.perf_counter()
+    for board, color in positions:
+        for _ in range(args.repeat):
+            policy.evaluate(board, color)
+    evaluate_us = (time.perf_counter() - start) / (len(positions) * args.repeat) * 1e6
+
+    start = time.perf_counter()
+    for board, color in positions:
+        for _ in range(args.repeat):
+            policy.candidates(board, color)
+    candidates_us = (time.perf_counter() - start) / (len(positions) * args.repeat) * 1e6
+
+    print(f"局面数: {len(positions)}, 每个局面重复 {args.repeat} 次")
+    print(f"evaluate: 平均 {evaluate_us:.1f} 微秒")
+    print(f"candidates(k=5): 平均 {candidates_us:.1f} 微秒")
+
+
+if __name__ == "__main__":
+    main()
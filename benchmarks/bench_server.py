@@ -0,0 +1,289 @@
+"""服务端端到端压测：在本地模拟模型接口上驱动 /start_game、/make_move 和大量 WebSocket 观众
+
+启动模拟模型接口和 main.py（uvicorn 子进程），完全离线运行，报告：
+  - 人工落子 /make_move 的 p50/p99 延迟
+  - 落子到所有观众收到 move_complete 的 p50/p99 广播延迟
+  - 每局游戏占用的内存（服务进程 RSS 增量）
+  - AI 对局（双方都是模拟模型）的每手间隔和每秒走到 --moves 手的对局数
+    （服务端没有中止对局的接口，对局走到 --moves 手后继续进行，随服务进程结束）
+
+用法: python benchmarks/bench_server.py [--games 20] [--spectators 10] [--moves 40]
+      [--ai-games 20] [--llm-latency 0.05] [--stream] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from go_board import BOARD_SIZE, GoBoard  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize_latency(values: List[float]) -> Dict[str, float]:
+    """延迟统计（毫秒）"""
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2) if values else 0.0,
+    }
+
+
+def read_rss(pid: int) -> Optional[int]:
+    """读取进程常驻内存（字节），非 Linux 平台返回 None"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+async def wait_ready(session: aiohttp.ClientSession, url: str, timeout: float = 20.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            async with session.get(url) as resp:
+                if resp.status < 500:
+                    return
+        except aiohttp.ClientError:
+            pass
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"服务未能在 {timeout} 秒内启动: {url}")
+        await asyncio.sleep(0.1)
+
+
+class Spectator:
+    """WebSocket 观众，记录收到每条 move_complete 的时间"""
+
+    def __init__(self):
+        self.move_times: List[float] = []
+        self.ready = asyncio.Event()
+        self.moves_seen = asyncio.Condition()
+
+    async def watch(self, session: aiohttp.ClientSession, url: str, stop: asyncio.Event):
+        async with session.ws_connect(url) as ws:
+            stop_task = asyncio.create_task(stop.wait())
+            try:
+                while not stop.is_set():
+                    recv = asyncio.create_task(ws.receive())
+                    done, _ = await asyncio.wait({recv, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+                    if recv not in done:
+                        recv.cancel()
+                        break
+                    msg = recv.result()
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    data = json.loads(msg.data)
+                    if data["type"] == "init":
+                        self.ready.set()
+                    elif data["type"] == "move_complete":
+                        async with self.moves_seen:
+                            self.move_times.append(time.perf_counter())
+                            self.moves_seen.notify_all()
+            finally:
+                stop_task.cancel()
+
+    async def wait_moves(self, count: int):
+        async with self.moves_seen:
+            await self.moves_seen.wait_for(lambda: len(self.move_times) >= count)
+
+
+async def measure_memory(session: aiohttp.ClientSession, base: str, pid: int, count: int) -> Optional[float]:
+    """创建 count 局空闲游戏，返回每局平均占用的内存（KB）"""
+    before = read_rss(pid)
+    if before is None:
+        return None
+    for _ in range(count):
+        async with session.post(f"{base}/start_game", json={"player_type": "human"}) as resp:
+            await resp.read()
+    after = read_rss(pid)
+    return round((after - before) / count / 1024, 2)
+
+
+async def run_human_game(session: aiohttp.ClientSession, base: str, ws_base: str, spectators: int,
+                         moves: int, rng: random.Random, stop: asyncio.Event,
+                         move_latency: List[float], broadcast_latency: List[float]):
+    """一局人工对局：spectators 个观众观看，依次提交 moves 手合法落子"""
+    async with session.post(f"{base}/start_game", json={"player_type": "human"}) as resp:
+        game_id = (await resp.json())["game_id"]
+    watchers = [Spectator() for _ in range(spectators)]
+    tasks = [asyncio.create_task(w.watch(session, f"{ws_base}/ws/{game_id}", stop)) for w in watchers]
+    await asyncio.gather(*(w.ready.wait() for w in watchers))
+
+    board = GoBoard(BOARD_SIZE, superko=True)
+    color = 1
+    for n in range(moves):
+        candidates = [p for p in board.empty_points()
+                      if board.is_legal(p[0], p[1], color) and not board.is_eye(p[0], p[1], color)]
+        if not candidates:
+            break
+        x, y = rng.choice(candidates)
+        board.play(x, y, color)
+        sent = time.perf_counter()
+        async with session.post(f"{base}/make_move", json={"game_id": game_id, "x": x, "y": y}) as resp:
+            await resp.read()
+            if resp.status != 200:
+                raise RuntimeError(f"落子失败: {resp.status}")
+        move_latency.append(time.perf_counter() - sent)
+        for w in watchers:
+            await w.wait_moves(n + 1)
+            broadcast_latency.append(w.move_times[n] - sent)
+        color = 3 - color
+    return tasks
+
+
+async def run_ai_game(session: aiohttp.ClientSession, base: str, ws_base: str, llm_url: str,
+                      moves: int, stream: bool, stop: asyncio.Event, intervals: List[float]):
+    """一局 AI 对局（双方都使用模拟模型），由一个观众观看直到走到 moves 手（对局本身不会停止）"""
+    config = {
+        "player_type": "ai",
+        "black_model_type": "compatible", "black_model_url": llm_url, "black_model_name": "mock-black",
+        "white_model_type": "compatible", "white_model_url": llm_url, "white_model_name": "mock-white",
+        "black_stream": stream, "white_stream": stream,
+    }
+    async with session.post(f"{base}/start_game", json=config) as resp:
+        game_id = (await resp.json())["game_id"]
+    watcher = Spectator()
+    task = asyncio.create_task(watcher.watch(session, f"{ws_base}/ws/{game_id}", stop))
+    start = time.perf_counter()
+    await watcher.wait_moves(moves)
+    times = [start] + watcher.move_times[:moves]
+    intervals.extend(b - a for a, b in zip(times, times[1:]))
+    return [task]
+
+
+async def run_benchmark(args) -> dict:
+    llm_port, app_port = free_port(), free_port()
+    llm_url = f"http://127.0.0.1:{llm_port}/v1/chat/completions"
+    base = f"http://127.0.0.1:{app_port}"
+    ws_base = f"ws://127.0.0.1:{app_port}"
+    workdir = tempfile.mkdtemp(prefix="go_bench_")
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        GO_AI_TURN_DELAY="0",
+        GO_RESPONSE_CACHE_SIZE="0",
+        GO_GAME_STORE="memory",
+    )
+    env.pop("GO_RESPONSE_CACHE_PATH", None)
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "mock_llm_server.py"),
+         "--port", str(llm_port), "--latency", str(args.llm_latency), "--jitter", str(args.llm_jitter),
+         "--seed", str(args.seed)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    # 在临时目录中运行，日志写到临时目录；static 目录用符号链接指向仓库
+    os.symlink(os.path.join(ROOT, "static"), os.path.join(workdir, "static"))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    rng = random.Random(args.seed)
+    stop = asyncio.Event()
+    results: dict = {}
+    connector = aiohttp.TCPConnector(limit=0)
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_ready(session, f"http://127.0.0.1:{llm_port}/stats")
+            await wait_ready(session, f"{base}/debug/games")
+
+            results["memory_per_game_kb"] = await measure_memory(session, base, server.pid, args.memory_games)
+
+            move_latency: List[float] = []
+            broadcast_latency: List[float] = []
+            start = time.perf_counter()
+            task_lists = await asyncio.gather(*(
+                run_human_game(session, base, ws_base, args.spectators, args.moves, rng, stop,
+                               move_latency, broadcast_latency)
+                for _ in range(args.games)
+            ))
+            results["human_phase_seconds"] = round(time.perf_counter() - start, 3)
+            results["make_move_latency"] = summarize_latency(move_latency)
+            results["broadcast_latency"] = summarize_latency(broadcast_latency)
+
+            intervals: List[float] = []
+            start = time.perf_counter()
+            ai_task_lists = await asyncio.gather(*(
+                run_ai_game(session, base, ws_base, llm_url, args.moves, args.stream, stop, intervals)
+                for _ in range(args.ai_games)
+            ))
+            elapsed = time.perf_counter() - start
+            results["ai_move_interval"] = summarize_latency(intervals)
+            results["ai_games_reaching_moves_per_sec"] = round(args.ai_games / elapsed, 3) if elapsed else 0.0
+            results["ai_phase_seconds"] = round(elapsed, 3)
+
+            stop.set()
+            tasks = [t for ts in task_lists + ai_task_lists for t in ts]
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for name in ("scheduler", "broadcaster", "games"):
+                async with session.get(f"{base}/debug/{name}") as resp:
+                    results[name] = await resp.json()
+    finally:
+        server.terminate()
+        mock.terminate()
+        server.wait()
+        mock.wait()
+    results["config"] = {
+        "games": args.games, "spectators": args.spectators, "moves": args.moves,
+        "ai_games": args.ai_games, "llm_latency": args.llm_latency, "stream": args.stream,
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="围棋服务端端到端压测（离线）")
+    parser.add_argument("--games", type=int, default=20, help="人工对局数")
+    parser.add_argument("--spectators", type=int, default=10, help="每局的观众数")
+    parser.add_argument("--moves", type=int, default=40, help="每局的手数")
+    parser.add_argument("--ai-games", type=int, default=20, help="AI 对局数")
+    parser.add_argument("--memory-games", type=int, default=200, help="用于测量内存的空闲对局数")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="模拟模型的延迟（秒）")
+    parser.add_argument("--llm-jitter", type=float, default=0.02, help="模拟模型的延迟抖动（秒）")
+    parser.add_argument("--stream", action="store_true", help="AI 对局使用流式响应")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出全部结果")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    move, bcast, ai = results["make_move_latency"], results["broadcast_latency"], results["ai_move_interval"]
+    print(f"make_move 延迟: p50 {move['p50_ms']} ms, p99 {move['p99_ms']} ms ({move['count']} 次)")
+    print(f"广播延迟: p50 {bcast['p50_ms']} ms, p99 {bcast['p99_ms']} ms ({bcast['count']} 次送达)")
+    print(f"AI 每手间隔: p50 {ai['p50_ms']} ms, p99 {ai['p99_ms']} ms "
+          f"(模拟模型延迟 {args.llm_latency * 1000:.0f} ms)")
+    print(f"AI 对局吞吐: 每秒 {results['ai_games_reaching_moves_per_sec']} 局走到 {args.moves} 手")
+    print(f"每局内存: {results['memory_per_game_kb']} KB")
+
+
+if __name__ == "__main__":
+    main()
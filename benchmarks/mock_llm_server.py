@@ -0,0 +1,178 @@
+"""本地模拟的 OpenAI 兼容模型接口
+
+从提示词中解析棋盘、轮到的一方和上一手，用 policy.py 的本地评估取得分最高的
+几个合法点随机返回一个，无处可下时停一手；可配置延迟、抖动、流式输出和错误率。用于在不调用真实模型的情况下测量服务器自身的开销，完全离线运行。
+
+用法: python benchmarks/mock_llm_server.py [--port 9100] [--latency 0.05] [--jitter 0.02]
+      [--error-rate 0] [--chunk-delay 0.005] [--reasoning-chars 200]
+
+AI 玩家配置为 model_type="compatible"、api_url="http://127.0.0.1:9100/v1/chat/completions"
+即可使用。请求中 "stream": true 时以 SSE 分块返回。多盘棋合并的提示词（见 batching.py）
+按局面编号分别落子，返回 {"moves": [...]}。
+
+提示词中没有劫和全局同形的信息：上一手是单子且只剩一口气时，把这口气当作劫争禁着点
+（可能误禁少数合法点，但不会返回提劫），全局同形禁着不检查。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from typing import Optional, Tuple
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from go_board import GoBoard, get_neighbor_table  # noqa: E402
+from policy import default_policy  # noqa: E402
+
+_ROW_PATTERN = re.compile(r'^\s*(\d+) ((?:[·.●○] ?)+)$', re.MULTILINE)
+_POSITION_PATTERN = re.compile(r'^=== 局面 (\w+)', re.MULTILINE)
+_COLOR_PATTERN = re.compile(r'轮到我(?:执|下)([黑白])')
+_HISTORY_PATTERN = re.compile(r'^- [黑白]棋：(?:\((\d+), (\d+)\)|停一手)$', re.MULTILINE)
+_STONES = {"●": 1, "○": 2}
+
+
+def parse_position(prompt: str) -> Tuple[GoBoard, int]:
+    """从提示词中解析出棋盘和轮到的一方 (board, color)，并按上一手推断劫争禁着点"""
+    rows = [match.group(2).split() for match in _ROW_PATTERN.finditer(prompt)]
+    board = GoBoard(len(rows) or 19)
+    # 合法局面中每块棋都有气，按任意顺序摆子都不会提子
+    for y, row in enumerate(rows):
+        for x, symbol in enumerate(row):
+            stone = _STONES.get(symbol)
+            if stone is not None:
+                board.play(x, y, stone)
+    color_match = _COLOR_PATTERN.search(prompt)
+    color = 2 if color_match and color_match.group(1) == "白" else 1
+
+    last = None
+    for last in _HISTORY_PATTERN.finditer(prompt):
+        pass
+    if last is not None and last.group(1) is not None:
+        size = board.size
+        idx = int(last.group(2)) * size + int(last.group(1))
+        neighbors = get_neighbor_table(size)[idx]
+        if board.cells[idx] == 3 - color and all(board.cells[n] != 3 - color for n in neighbors):
+            liberties = [n for n in neighbors if board.cells[n] == 0]
+            if len(liberties) == 1:
+                board.ko_point = liberties[0]
+                board.ko_color = color
+    return board, color
+
+
+class MockLLM:
+    """模拟模型的行为参数和请求统计"""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0,
+                 chunk_delay: float = 0.005, reasoning_chars: int = 200, seed: Optional[int] = None):
+        self.latency = latency  # 首个token前的基础延迟（秒）
+        self.jitter = jitter  # 延迟的随机抖动（秒）
+        self.error_rate = error_rate  # 返回 HTTP 500 的概率
+        self.chunk_delay = chunk_delay  # 流式输出时每块之间的间隔（秒）
+        self.reasoning_chars = reasoning_chars  # 思考过程的长度
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.batched_positions = 0  # 合并请求中的局面数
+        self.errors = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def _choose(self, prompt: str) -> Tuple[object, str]:
+        """为一盘棋选择 (move 字段, 说明)"""
+        board, color = parse_position(prompt)
+        candidates = default_policy.candidates(board, color, 5)
+        if not candidates:
+            return "pass", "模拟停一手"
+        x, y = self.rng.choice(candidates)
+        return [x, y], f"模拟落子 ({x}, {y})"
+
+    def _answer(self, prompt: str) -> Tuple[str, str]:
+        """返回 (思考过程, 回复内容)"""
+        thinking = ("模拟思考" * (self.reasoning_chars // 4 + 1))[:self.reasoning_chars]
+        positions = list(_POSITION_PATTERN.finditer(prompt))
+        if positions:
+            self.batched_positions += len(positions)
+            moves = []
+            for i, match in enumerate(positions):
+                end = positions[i + 1].start() if i + 1 < len(positions) else len(prompt)
+                move, reasoning = self._choose(prompt[match.start():end])
+                moves.append({"id": match.group(1), "move": move, "reasoning": reasoning})
+            return thinking, json.dumps({"moves": moves}, ensure_ascii=False)
+        move, reasoning = self._choose(prompt)
+        content = json.dumps({"move": move, "reasoning": reasoning}, ensure_ascii=False)
+        return thinking, content
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        data = await request.json()
+        prompt = data["messages"][-1]["content"]
+        await asyncio.sleep(self._delay())
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": {"message": "mock error"}}, status=500)
+
+        thinking, content = self._answer(prompt)
+        if not data.get("stream"):
+            return web.json_response({
+                "id": f"mock-{self.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": data.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content, "reasoning_content": thinking},
+                    "finish_reason": "stop"
+                }]
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunks = [("reasoning_content", thinking[i:i + 16]) for i in range(0, len(thinking), 16)]
+        chunks += [("content", content[i:i + 8]) for i in range(0, len(content), 8)]
+        for field, text in chunks:
+            event = {"choices": [{"index": 0, "delta": {field: text}}]}
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "requests": self.requests, "batched_positions": self.batched_positions, "errors": self.errors
+        })
+
+
+def create_app(mock: MockLLM) -> web.Application:
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", mock.handle)
+    app.router.add_get("/stats", mock.handle_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的 OpenAI 兼容模型接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.05, help="基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="延迟抖动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的概率")
+    parser.add_argument("--chunk-delay", type=float, default=0.005, help="流式输出每块的间隔（秒）")
+    parser.add_argument("--reasoning-chars", type=int, default=200, help="思考过程长度")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    mock = MockLLM(args.latency, args.jitter, args.error_rate, args.chunk_delay,
+                   args.reasoning_chars, args.seed)
+    web.run_app(create_app(mock), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""棋盘几何的预计算表
+
+只取决于棋盘大小、与局面无关的数据按大小计算一次，在所有对局之间共享：
+
+- 点下标与坐标的对应（idx = y * size + x）和每个点的相邻点
+- 星位
+- 8 种对称变换（旋转、翻转）的下标置换及其逆置换
+- 每个点的离边距离（0 为一线）和棋盘内相邻点数
+
+规则引擎、本地评估策略、定式库和计分都从这里取表，热路径上不再逐格计算坐标。
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+def _star_points(size: int) -> Tuple[int, ...]:
+    """星位下标：四角（大于等于13路在四线，更小的棋盘在三线），奇数路加天元，15路以上再加四边"""
+    if size < 7:
+        return (size // 2 * (size + 1),) if size % 2 else ()
+    edge = 3 if size >= 13 else 2
+    lines = [edge, size - 1 - edge]
+    if size % 2:
+        center = size // 2
+        if size >= 15:
+            lines.insert(1, center)
+        points = [(x, y) for y in lines for x in lines]
+        if size < 15:
+            points.append((center, center))
+    else:
+        points = [(x, y) for y in lines for x in lines]
+    return tuple(sorted(y * size + x for x, y in points))
+
+
+class BoardGeometry:
+    """一种棋盘大小的预计算表（只读，通过 get_geometry 获取）"""
+
+    __slots__ = ("size", "points", "coords", "neighbors", "star_points",
+                 "symmetries", "inverse_symmetries", "line", "on_board_neighbors")
+
+    def __init__(self, size: int):
+        n = size * size
+        self.size = size
+        self.points = n
+        # coords[idx] = (x, y)
+        self.coords: Tuple[Tuple[int, int], ...] = tuple((idx % size, idx // size) for idx in range(n))
+        neighbors = []
+        for idx, (x, y) in enumerate(self.coords):
+            points = []
+            if x > 0:
+                points.append(idx - 1)
+            if x < size - 1:
+                points.append(idx + 1)
+            if y > 0:
+                points.append(idx - size)
+            if y < size - 1:
+                points.append(idx + size)
+            neighbors.append(tuple(points))
+        self.neighbors: Tuple[Tuple[int, ...], ...] = tuple(neighbors)
+        self.star_points = _star_points(size)
+
+        # symmetries[t, idx] 为第 t 种变换后的下标，inverse_symmetries 为逆变换
+        m = size - 1
+        xs = np.tile(np.arange(size), size)
+        ys = np.repeat(np.arange(size), size)
+        transformed = (
+            (xs, ys), (m - xs, ys), (xs, m - ys), (m - xs, m - ys),
+            (ys, xs), (m - ys, xs), (ys, m - xs), (m - ys, m - xs),
+        )
+        self.symmetries = np.stack([ty * size + tx for tx, ty in transformed]).astype(np.int64)
+        self.inverse_symmetries = np.empty_like(self.symmetries)
+        self.inverse_symmetries[np.arange(8)[:, None], self.symmetries] = np.arange(n)
+
+        # line[y, x] 为离最近一边的距离，on_board_neighbors[y, x] 为棋盘内的相邻点数
+        edge = np.minimum(np.arange(size), m - np.arange(size))
+        self.line = np.minimum.outer(edge, edge)
+        self.on_board_neighbors = np.array([len(nb) for nb in neighbors], dtype=np.int16).reshape(size, size)
+        for array in (self.symmetries, self.inverse_symmetries, self.line, self.on_board_neighbors):
+            array.flags.writeable = False
+
+    def index(self, x: int, y: int) -> int:
+        return y * self.size + x
+
+    def is_star_point(self, x: int, y: int) -> bool:
+        return y * self.size + x in self.star_points
+
+
+_GEOMETRIES: Dict[int, BoardGeometry] = {}
+
+
+def get_geometry(size: int) -> BoardGeometry:
+    """获取（并缓存）指定棋盘大小的几何表"""
+    geometry = _GEOMETRIES.get(size)
+    if geometry is None:
+        geometry = _GEOMETRIES[size] = BoardGeometry(size)
+    return geometry
@@ -0,0 +1,208 @@
+"""WebSocket 广播扇出
+
+每条消息只序列化一次（安装了 orjson 时使用 orjson），然后放入每个连接各自的
+有界发送队列，由每个连接独立的发送任务并发写出。慢速观众不会阻塞其他连接：
+队列满时丢弃积压消息并改为发送一次完整快照，追上之前再次落后超过一定次数
+则直接断开（发送队列清空即视为已追上，落后次数清零）；发送失败的连接会被及时清理。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from fastapi import WebSocket
+
+from metrics import BROADCAST_SECONDS
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+logger = logging.getLogger('go_game')
+
+
+def serialize(message: dict) -> str:
+    """把消息序列化为JSON文本"""
+    if orjson is not None:
+        return orjson.dumps(message).decode('utf-8')
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+
+
+class Connection:
+    """单个WebSocket连接及其发送队列"""
+
+    def __init__(self, game_id: str, websocket: WebSocket, player_number: int, queue_size: int):
+        self.game_id = game_id
+        self.websocket = websocket
+        self.player_number = player_number
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.needs_snapshot = False  # 已落后，下一条改为发送完整快照
+        self.lag_events = 0  # 追上之前连续落后的次数
+        self.task: Optional[asyncio.Task] = None
+
+
+class Broadcaster:
+    """按游戏管理WebSocket连接并扇出消息"""
+
+    def __init__(self, snapshot_fn: Callable[[str, int], Optional[dict]] = None,
+                 queue_size: int = 64, max_lag_events: int = 3):
+        """
+        snapshot_fn(game_id, player_number) 返回该连接的完整快照，用于落后连接的降级
+        """
+        self.snapshot_fn = snapshot_fn
+        self.queue_size = queue_size
+        self.max_lag_events = max_lag_events
+        self._connections: Dict[str, Dict[WebSocket, Connection]] = {}
+        self._closing: set = set()  # 正在关闭落后连接的任务，保留引用避免被回收
+        self.messages = 0
+        self.deliveries = 0
+        self.downgraded = 0
+        self.dropped = 0
+        self.pruned = 0
+
+    @classmethod
+    def from_env(cls, snapshot_fn: Callable[[str, int], Optional[dict]] = None) -> "Broadcaster":
+        """从 GO_WS_* 环境变量读取配置"""
+        return cls(
+            snapshot_fn,
+            queue_size=int(os.getenv("GO_WS_QUEUE_SIZE", 64)),
+            max_lag_events=int(os.getenv("GO_WS_MAX_LAG_EVENTS", 3)),
+        )
+
+    def has_connections(self, game_id: str) -> bool:
+        return bool(self._connections.get(game_id))
+
+    def connection_count(self, game_id: str = None) -> int:
+        if game_id is not None:
+            return len(self._connections.get(game_id, ()))
+        return sum(len(conns) for conns in self._connections.values())
+
+    def player_number(self, game_id: str, websocket: WebSocket) -> Optional[int]:
+        conn = self._connections.get(game_id, {}).get(websocket)
+        return conn.player_number if conn else None
+
+    def add(self, game_id: str, websocket: WebSocket, player_number: int,
+            initial: Optional[dict] = None) -> Connection:
+        """注册连接并启动发送任务，initial 会作为第一条消息发送"""
+        conn = Connection(game_id, websocket, player_number, self.queue_size)
+        if initial is not None:
+            conn.queue.put_nowait(serialize(initial))
+        self._connections.setdefault(game_id, {})[websocket] = conn
+        conn.task = asyncio.create_task(self._writer(conn))
+        return conn
+
+    def remove(self, game_id: str, websocket: WebSocket):
+        """注销连接并停止其发送任务"""
+        conns = self._connections.get(game_id)
+        if not conns:
+            return
+        conn = conns.pop(websocket, None)
+        if not conns:
+            del self._connections[game_id]
+        if conn and conn.task and conn.task is not asyncio.current_task():
+            conn.task.cancel()
+
+    async def publish(self, game_id: str, message: dict):
+        """序列化一次并放入该游戏所有连接的发送队列，不等待实际发送"""
+        if self._connections.get(game_id):
+            await self.publish_text(game_id, serialize(message))
+
+    async def publish_text(self, game_id: str, text: str):
+        """把已序列化的消息放入该游戏所有本地连接的发送队列（其他 worker 转来的消息直接使用）"""
+        conns = self._connections.get(game_id)
+        if not conns:
+            return
+        start = time.perf_counter()
+        self.messages += 1
+        for conn in list(conns.values()):
+            self._enqueue(conn, text)
+        BROADCAST_SECONDS.observe(time.perf_counter() - start)
+
+    async def send(self, game_id: str, websocket: WebSocket, message: dict):
+        """只发送给单个连接（保持与广播消息的先后顺序）"""
+        conn = self._connections.get(game_id, {}).get(websocket)
+        if conn:
+            self._enqueue(conn, serialize(message))
+
+    def _enqueue(self, conn: Connection, text: str):
+        if conn.needs_snapshot:
+            return
+        try:
+            conn.queue.put_nowait(text)
+            self.deliveries += 1
+        except asyncio.QueueFull:
+            self._handle_lag(conn)
+
+    def _handle_lag(self, conn: Connection):
+        """处理落后的连接：丢弃积压并改发快照，多次落后则断开"""
+        conn.lag_events += 1
+        while not conn.queue.empty():
+            conn.queue.get_nowait()
+        if conn.lag_events > self.max_lag_events or self.snapshot_fn is None:
+            self.dropped += 1
+            logger.warning(f"游戏 {conn.game_id}: WebSocket连接持续落后，断开连接")
+            self.remove(conn.game_id, conn.websocket)
+            task = asyncio.create_task(self._close(conn.websocket))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+            return
+        self.downgraded += 1
+        conn.needs_snapshot = True
+        # 唤醒发送任务，由它生成最新快照
+        conn.queue.put_nowait(None)
+
+    async def _writer(self, conn: Connection):
+        """连接的发送任务"""
+        try:
+            while True:
+                text = await conn.queue.get()
+                if conn.needs_snapshot:
+                    conn.needs_snapshot = False
+                    snapshot = self.snapshot_fn(conn.game_id, conn.player_number)
+                    if snapshot is None:
+                        continue
+                    text = serialize(snapshot)
+                elif text is None:
+                    continue
+                await conn.websocket.send_text(text)
+                if conn.lag_events and conn.queue.empty() and not conn.needs_snapshot:
+                    conn.lag_events = 0  # 已追上
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 发送失败说明连接已断开，及时清理
+            self.pruned += 1
+            logger.info(f"游戏 {conn.game_id}: 清理失效的WebSocket连接: {str(e)}")
+            self.remove(conn.game_id, conn.websocket)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    async def close_all(self):
+        """停止所有发送任务，应用关闭时调用"""
+        tasks = [conn.task for conns in self._connections.values()
+                 for conn in conns.values() if conn.task]
+        self._connections.clear()
+        for task in tasks:
+            task.cancel()
+        tasks.extend(self._closing)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "games": len(self._connections),
+            "connections": self.connection_count(),
+            "messages": self.messages,
+            "deliveries": self.deliveries,
+            "downgraded": self.downgraded,
+            "dropped": self.dropped,
+            "pruned": self.pruned,
+            "serializer": "orjson" if orjson is not None else "json",
+        }
@@ -0,0 +1,410 @@
+"""紧凑的二进制棋谱、SGF 导入导出和基于 mmap 的棋谱库
+
+单局棋谱（小端序）：
+    头部    magic "GOR1" | 版本 | 棋盘大小 | 胜方 | 保留 | 贴目 f32 | 胜负差 f32
+            | 手数 u32 | 元数据长度 u32 | 文本长度 u32
+    元数据  UTF-8 JSON（game_id、双方模型、计分规则等）
+    着手    每手 u16：最高位为颜色（0黑 1白），低15位为 y * size + x，0x7FFF 表示停一手
+    偏移表  (手数 + 1) 个 u32，第 i 手的思考过程为 文本[偏移[i]:偏移[i+1]]（空串表示没有）
+    文本    所有思考过程拼接成的 UTF-8 字节串
+
+棋谱库由多局棋谱首尾相接，末尾是每局起始位置的 u64 索引和尾部
+（局数 u64 + magic "GOAX"）。读取时 mmap 整个文件，按下标直接定位某一局，
+只解析需要的部分；只看头部即可做胜率、手数等统计。
+
+用法:
+    python game_record.py info archive.gor
+    python game_record.py sgf archive.gor 12 > game.sgf
+    python game_record.py import archive.gor a.sgf b.sgf ...
+"""
+import argparse
+import json
+import mmap
+import re
+import struct
+import sys
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from go_board import BOARD_SIZE, PASS_MOVE, GoBoard
+
+RECORD_MAGIC = b"GOR1"
+ARCHIVE_MAGIC = b"GOAX"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sBBBxffIII")
+_FOOTER = struct.Struct("<Q4s")
+_PASS_CODE = 0x7FFF
+_COLOR_BIT = 0x8000
+_NO_WINNER = 255  # 未终局
+
+_SGF_COORDS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def _to_array(typecode: str, data) -> array:
+    """从小端字节构造数组（大端平台上转换字节序）"""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+@dataclass
+class GameRecord:
+    """一局棋谱"""
+    size: int = BOARD_SIZE
+    komi: float = 7.5
+    winner: Optional[int] = None  # 1黑 2白 0和棋 None未终局
+    margin: float = 0.0
+    moves: List[Tuple[int, int, int]] = field(default_factory=list)  # (x, y, 颜色)，停一手为 (-1, -1, 颜色)
+    reasonings: List[Optional[str]] = field(default_factory=list)  # 与 moves 一一对应
+    meta: Dict[str, object] = field(default_factory=dict)
+
+    @property
+    def result(self) -> str:
+        """SGF 风格的结果，如 B+3.5"""
+        if self.winner is None:
+            return ""
+        if self.winner == 0:
+            return "0"
+        return f"{'B' if self.winner == 1 else 'W'}+{self.margin:g}"
+
+    def board_at(self, move_number: Optional[int] = None) -> GoBoard:
+        """重放到第 move_number 手之后的局面（默认终局）"""
+        board = GoBoard(self.size, superko=True)
+        for x, y, color in self.moves[:move_number]:
+            if (x, y) == PASS_MOVE:
+                board.pass_turn()
+            else:
+                board.play(x, y, color)
+        return board
+
+    def to_bytes(self) -> bytes:
+        size = self.size
+        codes = array("H", (
+            ((color - 1) << 15) | (_PASS_CODE if (x, y) == PASS_MOVE else y * size + x)
+            for x, y, color in self.moves
+        ))
+        offsets = array("I", [0])
+        texts = []
+        total = 0
+        # 偏移表必须正好有 手数 + 1 项：思考过程不足时补空，多余的丢弃（与 to_sgf 一致）
+        count = len(self.moves)
+        reasonings = list(self.reasonings[:count]) + [None] * (count - len(self.reasonings))
+        for text in reasonings:
+            encoded = (text or "").encode("utf-8")
+            texts.append(encoded)
+            total += len(encoded)
+            offsets.append(total)
+        meta = json.dumps(self.meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8") if self.meta else b""
+        header = _HEADER.pack(
+            RECORD_MAGIC, VERSION, size, _NO_WINNER if self.winner is None else self.winner,
+            self.komi, self.margin, len(self.moves), len(meta), total
+        )
+        return b"".join((header, meta, _to_bytes(codes), _to_bytes(offsets), *texts))
+
+    @classmethod
+    def from_bytes(cls, data, with_reasonings: bool = True) -> "GameRecord":
+        view = RecordView(memoryview(data))
+        return view.load(with_reasonings)
+
+
+class RecordView:
+    """对一段字节（通常是 mmap 的切片）的零拷贝访问，按需解析各部分"""
+
+    __slots__ = ("buf", "size", "winner", "komi", "margin", "move_count",
+                 "_meta_start", "_moves_start", "_offsets_start", "_text_start", "_text_len")
+
+    def __init__(self, buf: memoryview):
+        magic, version, size, winner, komi, margin, move_count, meta_len, text_len = _HEADER.unpack_from(buf)
+        if magic != RECORD_MAGIC or version != VERSION:
+            raise ValueError("不是有效的棋谱记录")
+        self.buf = buf
+        self.size = size
+        self.winner = None if winner == _NO_WINNER else winner
+        self.komi = komi
+        self.margin = margin
+        self.move_count = move_count
+        self._meta_start = _HEADER.size
+        self._moves_start = self._meta_start + meta_len
+        self._offsets_start = self._moves_start + 2 * move_count
+        self._text_start = self._offsets_start + 4 * (move_count + 1)
+        self._text_len = text_len
+
+    @property
+    def nbytes(self) -> int:
+        return self._text_start + self._text_len
+
+    def meta(self) -> Dict[str, object]:
+        raw = self.buf[self._meta_start:self._moves_start]
+        return json.loads(bytes(raw)) if len(raw) else {}
+
+    def move_codes(self) -> array:
+        return _to_array("H", self.buf[self._moves_start:self._offsets_start])
+
+    def moves(self, limit: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        size = self.size
+        codes = self.move_codes()
+        result = []
+        for code in codes[:limit]:
+            color = 2 if code & _COLOR_BIT else 1
+            point = code & _PASS_CODE
+            if point == _PASS_CODE:
+                result.append((*PASS_MOVE, color))
+            else:
+                result.append((point % size, point // size, color))
+        return result
+
+    def reasoning(self, index: int) -> Optional[str]:
+        """第 index 手的思考过程，只读取这一段文本"""
+        start, end = struct.unpack_from("<II", self.buf, self._offsets_start + 4 * index)
+        if start == end:
+            return None
+        return bytes(self.buf[self._text_start + start:self._text_start + end]).decode("utf-8")
+
+    def load(self, with_reasonings: bool = True) -> GameRecord:
+        reasonings = [self.reasoning(i) for i in range(self.move_count)] if with_reasonings else []
+        return GameRecord(
+            size=self.size, komi=self.komi, winner=self.winner, margin=self.margin,
+            moves=self.moves(), reasonings=reasonings, meta=self.meta(),
+        )
+
+
+class ArchiveWriter:
+    """把多局棋谱追加写入一个棋谱库文件，关闭时写入索引"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "wb")
+        self._offsets = array("Q")
+        self._position = 0
+
+    def append(self, record: GameRecord) -> int:
+        """写入一局，返回它在库中的下标"""
+        data = record.to_bytes()
+        self._offsets.append(self._position)
+        self._file.write(data)
+        self._position += len(data)
+        return len(self._offsets) - 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write(_to_bytes(self._offsets))
+        self._file.write(_FOOTER.pack(len(self._offsets), ARCHIVE_MAGIC))
+        self._file.close()
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameArchive:
+    """以 mmap 方式只读打开棋谱库，按下标随机访问任意一局"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mmap)
+        count, magic = _FOOTER.unpack_from(self._buf, len(self._buf) - _FOOTER.size)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"不是有效的棋谱库: {path}")
+        index_start = len(self._buf) - _FOOTER.size - 8 * count
+        self._offsets = _to_array("Q", self._buf[index_start:index_start + 8 * count])
+        self._data_end = index_start
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def view(self, index: int) -> RecordView:
+        """第 index 局的零拷贝视图"""
+        start = self._offsets[index]
+        end = self._offsets[index + 1] if index + 1 < len(self._offsets) else self._data_end
+        return RecordView(self._buf[start:end])
+
+    def __getitem__(self, index: int) -> GameRecord:
+        return self.view(index).load()
+
+    def __iter__(self) -> Iterator[RecordView]:
+        for index in range(len(self)):
+            yield self.view(index)
+
+    def position(self, index: int, move_number: Optional[int] = None) -> GoBoard:
+        """第 index 局第 move_number 手之后的局面，只解码需要的着手"""
+        view = self.view(index)
+        record = GameRecord(size=view.size, moves=view.moves(move_number))
+        return record.board_at()
+
+    def stats(self) -> dict:
+        """只读取每局头部的统计：局数、胜负和平均手数"""
+        wins = {1: 0, 2: 0, 0: 0, None: 0}
+        moves = 0
+        for view in self:
+            wins[view.winner] += 1
+            moves += view.move_count
+        games = len(self)
+        return {
+            "games": games,
+            "black_wins": wins[1],
+            "white_wins": wins[2],
+            "draws": wins[0],
+            "unfinished": wins[None],
+            "avg_moves": round(moves / games, 1) if games else 0,
+        }
+
+    def close(self):
+        self._offsets = array("Q")
+        try:
+            self._buf.release()
+            self._mmap.close()
+        except BufferError:
+            # 仍有 RecordView 引用着映射，等它们释放后由垃圾回收关闭
+            pass
+        self._file.close()
+
+    def __enter__(self) -> "GameArchive":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _sgf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("]", "\\]")
+
+
+def _sgf_point(x: int, y: int) -> str:
+    if (x, y) == PASS_MOVE:
+        return ""
+    return _SGF_COORDS[x] + _SGF_COORDS[y]
+
+
+def to_sgf(record: GameRecord) -> str:
+    """导出为 SGF（FF[4]），思考过程写入每手的注释 C[]"""
+    meta = record.meta
+    root = f"FF[4]GM[1]CA[UTF-8]AP[go_game]SZ[{record.size}]KM[{record.komi:g}]"
+    if record.result:
+        root += f"RE[{record.result}]"
+    for key, prop in (("black", "PB"), ("white", "PW"), ("game_id", "GN")):
+        if meta.get(key):
+            root += f"{prop}[{_sgf_escape(str(meta[key]))}]"
+    if meta.get("scoring"):
+        root += f"RU[{'Chinese' if meta['scoring'] == 'area' else 'Japanese'}]"
+    nodes = [f"(;{root}"]
+    for i, (x, y, color) in enumerate(record.moves):
+        node = f";{'B' if color == 1 else 'W'}[{_sgf_point(x, y)}]"
+        reasoning = record.reasonings[i] if i < len(record.reasonings) else None
+        if reasoning:
+            node += f"C[{_sgf_escape(reasoning)}]"
+        nodes.append(node)
+    return "\n".join(nodes) + ")\n"
+
+
+_SGF_PROPERTY = re.compile(r"([A-Z]+)((?:\s*\[(?:[^\]\\]|\\.)*\])+)", re.S)
+_SGF_VALUE = re.compile(r"\[((?:[^\]\\]|\\.)*)\]", re.S)
+_SGF_RESULT = re.compile(r"^([BW])\+([\d.]+)$")
+
+
+def _sgf_nodes(text: str) -> Iterator[Dict[str, List[str]]]:
+    """按主线逐个返回节点的属性：遇到分支时进入第一个变化，第一个变化结束即停止"""
+    i = 0
+    node: Optional[Dict[str, List[str]]] = None
+    while i < len(text):
+        ch = text[i]
+        if ch == "(":
+            i += 1
+        elif ch == ")":
+            break
+        elif ch == ";":
+            if node is not None:
+                yield node
+            node = {}
+            i += 1
+        elif ch.isupper():
+            match = _SGF_PROPERTY.match(text, i)
+            if match is None:
+                raise ValueError(f"无效的SGF属性: 位置 {i}")
+            values = [re.sub(r"\\(.)", r"\1", v, flags=re.S) for v in _SGF_VALUE.findall(match.group(2))]
+            if node is not None:
+                node[match.group(1)] = values
+            i = match.end()
+        else:
+            i += 1
+    if node is not None:
+        yield node
+
+
+def from_sgf(text: str) -> GameRecord:
+    """导入 SGF 主线，落子的注释作为思考过程"""
+    nodes = list(_sgf_nodes(text))
+    if not nodes:
+        raise ValueError("SGF中没有节点")
+    root = nodes[0]
+    record = GameRecord(size=int(root.get("SZ", [BOARD_SIZE])[0]))
+    if "KM" in root:
+        record.komi = float(root["KM"][0])
+    result = root.get("RE", [""])[0]
+    match = _SGF_RESULT.match(result)
+    if match:
+        record.winner = 1 if match.group(1) == "B" else 2
+        record.margin = float(match.group(2))
+    elif result in ("0", "Draw", "Jigo"):
+        record.winner = 0
+    for key, prop in (("black", "PB"), ("white", "PW"), ("game_id", "GN")):
+        if prop in root:
+            record.meta[key] = root[prop][0]
+    if "RU" in root:
+        record.meta["scoring"] = "area" if root["RU"][0].lower() in ("chinese", "aga") else "territory"
+    for node in nodes:
+        for prop, color in (("B", 1), ("W", 2)):
+            if prop not in node:
+                continue
+            point = node[prop][0]
+            if not point or (point == "tt" and record.size <= 19):
+                x, y = PASS_MOVE
+            else:
+                x, y = _SGF_COORDS.index(point[0]), _SGF_COORDS.index(point[1])
+            record.moves.append((x, y, color))
+            record.reasonings.append(node.get("C", [None])[0])
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="二进制棋谱库工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="统计棋谱库")
+    info.add_argument("archive")
+    export = sub.add_parser("sgf", help="把一局导出为SGF")
+    export.add_argument("archive")
+    export.add_argument("index", type=int)
+    importer = sub.add_parser("import", help="把SGF文件写入新的棋谱库")
+    importer.add_argument("archive")
+    importer.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        with GameArchive(args.archive) as archive:
+            print(json.dumps(archive.stats(), ensure_ascii=False, indent=2))
+    elif args.command == "sgf":
+        with GameArchive(args.archive) as archive:
+            sys.stdout.write(to_sgf(archive[args.index]))
+    else:
+        with ArchiveWriter(args.archive) as writer:
+            for path in args.files:
+                with open(path, encoding="utf-8") as f:
+                    writer.append(from_sgf(f.read()))
+        print(f"已写入 {len(args.files)} 局: {args.archive}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+"""游戏持久化存储
+
+GameStore 保存每局的创建配置和按顺序追加的事件（落子、聊天），可以据此
+重放出完整的 GameState。提供三种实现：
+
+- InMemoryGameStore：进程内存储，只保存紧凑的事件列表
+- SQLiteGameStore：SQLite（WAL 模式），多个 worker 可共享同一个数据库文件
+- AppendLogGameStore：单个只追加的 JSON Lines 日志文件（适合单个 worker）
+
+事件先写入缓冲区，按批量大小或定时批量落盘。GameRegistry 在此之上管理
+内存中活跃游戏的生命周期：按需从存储懒加载冷游戏；回收空闲超时的游戏，已终局
+的游戏使用更短的超时；活跃游戏数超过上限时按最近最少使用（LRU）回收。已终局的
+游戏回收后，存储可以把它压缩为更紧凑的形式（内存存储压缩为 zlib 数据块）。
+注意：配置中包含模型的 Bearer Token，存储文件需要妥善保管。
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('go_game')
+
+GameRecord = Tuple[Dict[str, Any], List[Dict[str, Any]]]  # (配置, 事件列表)
+
+
+class GameStore(ABC):
+    """游戏存储接口，事件写入带批量缓冲"""
+
+    def __init__(self, batch_size: int = 64, flush_interval: float = 1.0):
+        self.batch_size = batch_size  # 缓冲事件数达到该值时立即落盘
+        self.flush_interval = flush_interval  # 定时落盘间隔（秒）
+        self._buffer: Dict[str, List[dict]] = {}
+        self._buffered = 0
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flush_failures = 0
+        self.events_written = 0
+
+    async def start(self):
+        """启动定时落盘任务"""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"游戏事件落盘失败: {str(e)}")
+
+    async def create_game(self, game_id: str, config: Dict[str, Any]):
+        """保存新游戏的配置"""
+        await self._write_game(game_id, config)
+
+    async def append_event(self, game_id: str, event: Dict[str, Any]):
+        """追加一个事件（先进入缓冲区）"""
+        self._buffer.setdefault(game_id, []).append(event)
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """把缓冲区中的事件批量写入存储"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, {}
+            count, self._buffered = self._buffered, 0
+            try:
+                await self._write_events(batch)
+            except BaseException:
+                # 写入失败时把这批事件放回缓冲区（排在之后新增的事件之前），下次落盘重试
+                for game_id, events in self._buffer.items():
+                    batch.setdefault(game_id, []).extend(events)
+                self._buffer = batch
+                self._buffered += count
+                self.flush_failures += 1
+                raise
+            self.flushes += 1
+            self.events_written += count
+
+    async def load(self, game_id: str) -> Optional[GameRecord]:
+        """读取一局游戏的配置和完整事件列表（包含尚未落盘的事件）"""
+        # 持有落盘锁，避免读取期间缓冲区被写走导致事件丢失或重复
+        async with self._flush_lock:
+            record = await self._read_game(game_id)
+            if record is None:
+                return None
+            config, events = record
+            return config, events + list(self._buffer.get(game_id, ()))
+
+    async def compact(self, game_id: str):
+        """已终局的游戏移出内存后调用，存储可以把它压缩为更紧凑的形式（默认不处理）"""
+
+    async def close(self):
+        """停止定时任务并落盘剩余事件"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self).__name__,
+            "buffered_events": self._buffered,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "events_written": self.events_written,
+        }
+
+    @abstractmethod
+    async def _write_game(self, game_id: str, config: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def _write_events(self, batch: Dict[str, List[dict]]):
+        ...
+
+    @abstractmethod
+    async def _read_game(self, game_id: str) -> Optional[GameRecord]:
+        ...
+
+
+class InMemoryGameStore(GameStore):
+    """进程内存储，已终局的游戏压缩为 zlib 数据块"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._games: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[dict]] = {}
+        self._compacted: Dict[str, bytes] = {}
+
+    def _event_list(self, game_id: str) -> List[dict]:
+        """取出可追加的事件列表（已压缩的游戏先解压）"""
+        blob = self._compacted.pop(game_id, None)
+        if blob is not None:
+            self._events[game_id] = json.loads(zlib.decompress(blob))
+        return self._events.setdefault(game_id, [])
+
+    async def _write_game(self, game_id, config):
+        self._games[game_id] = config
+        self._events.setdefault(game_id, [])
+
+    async def _write_events(self, batch):
+        for game_id, events in batch.items():
+            self._event_list(game_id).extend(events)
+
+    async def _read_game(self, game_id):
+        if game_id not in self._games:
+            return None
+        blob = self._compacted.get(game_id)
+        if blob is not None:
+            return self._games[game_id], json.loads(zlib.decompress(blob))
+        return self._games[game_id], list(self._events.get(game_id, ()))
+
+    async def compact(self, game_id):
+        events = self._events.pop(game_id, None)
+        if events is not None:
+            data = json.dumps(events, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self._compacted[game_id] = zlib.compress(data)
+
+    def stats(self):
+        data = super().stats()
+        data["compacted_games"] = len(self._compacted)
+        data["compacted_bytes"] = sum(len(blob) for blob in self._compacted.values())
+        return data
+
+
+class SQLiteGameStore(GameStore):
+    """SQLite 存储（WAL 模式），数据库操作在线程池中执行"""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS games ("
+            "game_id TEXT PRIMARY KEY, config TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS game_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, game_id TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_game_events_game ON game_events (game_id, id)")
+        self._conn.commit()
+
+    def _insert_game(self, game_id, config):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO games VALUES (?, ?, ?)",
+                (game_id, json.dumps(config, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def _insert_events(self, batch):
+        rows = [
+            (game_id, json.dumps(event, ensure_ascii=False))
+            for game_id, events in batch.items() for event in events
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT INTO game_events (game_id, data) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def _select_game(self, game_id):
+        with self._lock:
+            row = self._conn.execute("SELECT config FROM games WHERE game_id = ?", (game_id,)).fetchone()
+            if row is None:
+                return None
+            events = self._conn.execute(
+                "SELECT data FROM game_events WHERE game_id = ? ORDER BY id", (game_id,)
+            ).fetchall()
+        return json.loads(row[0]), [json.loads(data) for (data,) in events]
+
+    async def _write_game(self, game_id, config):
+        await asyncio.to_thread(self._insert_game, game_id, config)
+
+    async def _write_events(self, batch):
+        await asyncio.to_thread(self._insert_events, batch)
+
+    async def _read_game(self, game_id):
+        return await asyncio.to_thread(self._select_game, game_id)
+
+    async def close(self):
+        await super().close()
+        with self._lock:
+            self._conn.close()
+
+
+class AppendLogGameStore(GameStore):
+    """只追加的 JSON Lines 日志存储（单进程写入），启动时扫描一次建立 game_id -> 行偏移 的索引"""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[int]] = {}
+        if os.path.exists(path):
+            self._build_index()
+        self._file = open(path, 'ab')
+
+    def _build_index(self):
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    game_id = json.loads(line)["g"]
+                except (ValueError, KeyError):
+                    logger.warning(f"跳过损坏的游戏日志记录: 偏移 {offset}")
+                else:
+                    self._index.setdefault(game_id, []).append(offset)
+                offset += len(line)
+
+    def _append(self, records: List[Tuple[str, dict]]):
+        with self._lock:
+            offset = self._file.tell()
+            for game_id, record in records:
+                line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+                self._file.write(line)
+                self._index.setdefault(game_id, []).append(offset)
+                offset += len(line)
+            self._file.flush()
+
+    def _read(self, game_id):
+        with self._lock:
+            offsets = list(self._index.get(game_id, ()))
+        if not offsets:
+            return None
+        config = None
+        events = []
+        with open(self.path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                record = json.loads(f.readline())
+                if record["t"] == "game":
+                    config = record["config"]
+                else:
+                    events.append(record["event"])
+        if config is None:
+            return None
+        return config, events
+
+    async def _write_game(self, game_id, config):
+        await asyncio.to_thread(self._append, [(game_id, {"g": game_id, "t": "game", "config": config})])
+
+    async def _write_events(self, batch):
+        records = [
+            (game_id, {"g": game_id, "t": "event", "event": event})
+            for game_id, events in batch.items() for event in events
+        ]
+        await asyncio.to_thread(self._append, records)
+
+    async def _read_game(self, game_id):
+        return await asyncio.to_thread(self._read, game_id)
+
+    async def close(self):
+        await super().close()
+        with self._lock:
+            self._file.close()
+
+
+def create_game_store(spec: str = None) -> GameStore:
+    """
+    根据配置创建存储，spec 取自 GO_GAME_STORE：
+    "memory"（默认）、"sqlite:<路径>" 或 "log:<路径>"
+    """
+    spec = spec or os.getenv("GO_GAME_STORE", "memory")
+    kwargs = {
+        "batch_size": int(os.getenv("GO_GAME_STORE_BATCH", 64)),
+        "flush_interval": float(os.getenv("GO_GAME_STORE_FLUSH_INTERVAL", 1.0)),
+    }
+    kind, _, path = spec.partition(":")
+    if kind == "sqlite":
+        return SQLiteGameStore(path or "games.sqlite", **kwargs)
+    if kind == "log":
+        return AppendLogGameStore(path or "games.log", **kwargs)
+    return InMemoryGameStore(**kwargs)
+
+
+class GameRegistry:
+    """内存中的活跃游戏表：懒加载冷游戏，按空闲时间和数量上限回收"""
+
+    def __init__(self, store: GameStore, rehydrate: Callable[[str, Dict[str, Any], List[dict]], Any],
+                 idle_ttl: float = 1800.0, finished_ttl: Optional[float] = None, max_live: int = 0,
+                 is_busy: Optional[Callable[[str], bool]] = None,
+                 on_evict: Optional[Callable[[str, Any], None]] = None):
+        """
+        rehydrate(game_id, config, events) 根据存储的记录重建游戏对象
+        is_busy(game_id) 为真的游戏（AI正在走棋、仍有观众）不会被回收
+        on_evict(game_id, game) 在游戏移出内存后调用，用于释放其占用的资源
+        """
+        self.store = store
+        self.rehydrate = rehydrate
+        self.idle_ttl = idle_ttl  # 空闲多久后从内存中回收（秒）
+        self.finished_ttl = idle_ttl if finished_ttl is None else finished_ttl  # 已终局游戏的空闲超时（秒）
+        self.max_live = max_live  # 内存中最多保留的游戏数，0 表示不限制
+        self.is_busy = is_busy
+        self.on_evict = on_evict
+        self._games: Dict[str, Any] = {}
+        # 按最近访问时间排序（最久未访问的在前），用于超时和 LRU 回收
+        self._last_access: "OrderedDict[str, float]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.loads = 0
+        self.evictions = 0
+        self.evicted_by = {"idle": 0, "finished": 0, "lru": 0}
+        self.spilled = 0  # 回收后由存储压缩的已终局游戏数
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self._games
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def items(self):
+        return self._games.items()
+
+    def _touch(self, game_id: str):
+        self._last_access[game_id] = time.monotonic()
+        self._last_access.move_to_end(game_id)
+
+    async def add(self, game, config: Dict[str, Any]):
+        """登记新游戏并持久化其配置"""
+        self._games[game.game_id] = game
+        self._touch(game.game_id)
+        await self.store.create_game(game.game_id, config)
+        await self._enforce_limit()
+
+    def peek(self, game_id: str):
+        """只在内存中查找，不触发加载"""
+        game = self._games.get(game_id)
+        if game is not None:
+            self._touch(game_id)
+        return game
+
+    async def get(self, game_id: str):
+        """查找游戏，不在内存中时从存储加载并重放"""
+        game = self.peek(game_id)
+        if game is not None:
+            return game
+        # 同一局的并发加载只执行一次
+        pending = self._loading.get(game_id)
+        if pending is not None:
+            return await pending
+        future = asyncio.get_running_loop().create_future()
+        self._loading[game_id] = future
+        try:
+            record = await self.store.load(game_id)
+            game = None
+            if record is not None:
+                config, events = record
+                game = self.rehydrate(game_id, config, events)
+                self._games[game_id] = game
+                self._touch(game_id)
+                self.loads += 1
+                logger.info(f"游戏 {game_id}: 从存储加载，重放 {len(events)} 个事件")
+            future.set_result(game)
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._loading[game_id]
+        if game is not None:
+            await self._enforce_limit(keep=game_id)
+        return game
+
+    def discard(self, game_id: str):
+        """丢弃内存中的副本（例如已与其他 worker 不一致），下次访问时从存储重新加载"""
+        self._games.pop(game_id, None)
+        self._last_access.pop(game_id, None)
+
+    async def record(self, game_id: str, event: Dict[str, Any]):
+        """记录一个落子或聊天事件"""
+        if game_id in self._last_access:
+            self._touch(game_id)
+        await self.store.append_event(game_id, event)
+
+    def _busy(self, game_id: str) -> bool:
+        return self.is_busy is not None and self.is_busy(game_id)
+
+    async def _enforce_limit(self, keep: Optional[str] = None):
+        """活跃游戏数超过上限时回收最久未访问的空闲游戏"""
+        excess = len(self._games) - self.max_live
+        if not self.max_live or excess <= 0:
+            return
+        victims = []
+        for game_id in self._last_access:
+            if len(victims) >= excess:
+                break
+            if game_id != keep and not self._busy(game_id):
+                victims.append(game_id)
+        if len(victims) < excess:
+            logger.warning(f"活跃游戏数 {len(self._games)} 超过上限 {self.max_live}，其余游戏都在使用中")
+        await self._evict(victims, "lru")
+
+    async def evict_idle(self) -> List[str]:
+        """回收空闲超时的游戏（已终局的游戏使用 finished_ttl），返回被回收的ID"""
+        now = time.monotonic()
+        shortest = min(self.idle_ttl, self.finished_ttl)
+        idle, finished = [], []
+        # 按访问时间从旧到新遍历，遇到未超过最短超时的游戏即可停止
+        for game_id, last in self._last_access.items():
+            age = now - last
+            if age <= shortest:
+                break
+            game = self._games.get(game_id)
+            is_finished = game is not None and getattr(game, "game_over", False)
+            if age <= (self.finished_ttl if is_finished else self.idle_ttl) or self._busy(game_id):
+                continue
+            (finished if is_finished else idle).append(game_id)
+        evicted_idle = await self._evict(idle, "idle")
+        evicted_finished = await self._evict(finished, "finished")
+        evicted = evicted_idle + evicted_finished
+        if evicted:
+            await self._enforce_limit()
+            logger.info(f"回收 {len(evicted)} 局空闲游戏（其中已终局 {len(evicted_finished)} 局）")
+        return evicted
+
+    async def _evict(self, game_ids: List[str], reason: str) -> List[str]:
+        """回收选中的游戏，返回实际回收的ID（落盘期间被访问或变为使用中的游戏不回收）"""
+        if not game_ids:
+            return []
+        accessed = {game_id: self._last_access.get(game_id) for game_id in game_ids}
+        # 先把这些游戏尚未落盘的事件写入存储
+        await self.store.flush()
+        evicted = []
+        for game_id in game_ids:
+            if self._last_access.get(game_id) != accessed[game_id] or self._busy(game_id):
+                continue
+            game = self._games.pop(game_id, None)
+            self._last_access.pop(game_id, None)
+            if game is None:
+                continue
+            evicted.append(game_id)
+            if self.on_evict is not None:
+                try:
+                    self.on_evict(game_id, game)
+                except Exception as e:
+                    logger.error(f"游戏 {game_id}: 释放资源失败: {str(e)}")
+            if getattr(game, "game_over", False):
+                await self.store.compact(game_id)
+                self.spilled += 1
+        self.evictions += len(evicted)
+        self.evicted_by[reason] += len(evicted)
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "live_games": len(self._games),
+            "max_live": self.max_live,
+            "idle_ttl": self.idle_ttl,
+            "finished_ttl": self.finished_ttl,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "evicted_by": dict(self.evicted_by),
+            "spilled": self.spilled,
+            "store": self.store.stats(),
+        }
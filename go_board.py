@@ -0,0 +1,324 @@
+"""围棋规则引擎
+
+棋盘使用扁平的 bytearray 存储（下标 idx = y * size + x），棋串用并查集维护，
+每个棋串的气用集合保存，在落子时增量更新。提子、禁着（自杀）和劫的判断
+只涉及受影响的棋子，而不需要扫描整个棋盘。
+
+每个局面同时维护一个 64 位 Zobrist 哈希，可用于全局同形（superko）判断，
+也可作为稳定的局面键供缓存、定式库等使用。
+
+相邻点、坐标等与局面无关的表来自 board_geometry。board.array 是 cells 的零拷贝
+NumPy 视图，供向量化查询使用；文本渲染按局面版本缓存，每次落子后失效。
+"""
+import random
+import sys
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from board_geometry import BoardGeometry, get_geometry
+from memory_usage import deep_sizeof
+
+BOARD_SIZE = 19
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+
+# 停一手（pass）在着手记录中的坐标
+PASS_MOVE = (-1, -1)
+
+_ZOBRIST_TABLES = {}
+_ZOBRIST_SEED = 0x5A0B_2157
+
+
+def get_zobrist_table(size: int) -> Tuple[Tuple[int, int, int], ...]:
+    """获取（并缓存）Zobrist 随机数表，table[idx][color]，固定种子保证跨进程稳定"""
+    table = _ZOBRIST_TABLES.get(size)
+    if table is None:
+        rng = random.Random(_ZOBRIST_SEED + size)
+        table = tuple(
+            (0, rng.getrandbits(64), rng.getrandbits(64))
+            for _ in range(size * size)
+        )
+        _ZOBRIST_TABLES[size] = table
+    return table
+
+
+def get_neighbor_table(size: int) -> Tuple[Tuple[int, ...], ...]:
+    """获取指定棋盘大小的相邻点表（见 board_geometry）"""
+    return get_geometry(size).neighbors
+
+
+class GoBoard:
+    """带增量棋串/气维护的围棋棋盘"""
+
+    __slots__ = (
+        "size", "cells", "ko_point", "ko_color", "hash", "superko", "geometry", "version",
+        "_neighbors", "_zobrist", "_seen_hashes",
+        "_parent", "_stones", "_liberties", "_empty",
+        "_array", "_renders", "_render_version",
+    )
+
+    def __init__(self, size: int = BOARD_SIZE, superko: bool = False):
+        n = size * size
+        self.size = size
+        self.cells = bytearray(n)  # 0空 1黑 2白
+        self.ko_point = -1  # 劫争禁着点
+        self.ko_color = EMPTY  # 被禁止在劫争点落子的一方
+        self.hash = 0  # 当前局面的 Zobrist 哈希（空棋盘为0）
+        self.superko = superko  # 是否启用全局同形禁着
+        self.geometry: BoardGeometry = get_geometry(size)
+        self.version = 0  # 每次落子加一，用于使缓存的渲染失效
+        self._neighbors = self.geometry.neighbors
+        self._zobrist = get_zobrist_table(size)
+        self._seen_hashes = {0}  # 本局出现过的所有局面
+        self._parent = list(range(n))
+        self._stones: List[Optional[List[int]]] = [None] * n  # 根 -> 棋串中的棋子
+        self._liberties: List[Optional[set]] = [None] * n  # 根 -> 棋串的气
+        self._empty = set(range(n))
+        self._array: Optional[np.ndarray] = None
+        self._renders: Dict[str, object] = {}
+        self._render_version = 0
+
+    def _find(self, idx: int) -> int:
+        """查找棋串的根（带路径压缩）"""
+        parent = self._parent
+        root = idx
+        while parent[root] != root:
+            root = parent[root]
+        while parent[idx] != root:
+            parent[idx], idx = root, parent[idx]
+        return root
+
+    def _union(self, a: int, b: int) -> int:
+        """合并两个棋串，小串并入大串，返回新的根"""
+        stones = self._stones
+        liberties = self._liberties
+        if len(stones[a]) < len(stones[b]):
+            a, b = b, a
+        stones[a].extend(stones[b])
+        liberties[a] |= liberties[b]
+        self._parent[b] = a
+        stones[b] = None
+        liberties[b] = None
+        return a
+
+    def _remove_group(self, root: int, captured: List[int]):
+        """移除一个没有气的棋串，并把空出的点加回相邻棋串的气"""
+        cells = self.cells
+        parent = self._parent
+        neighbors = self._neighbors
+        zobrist = self._zobrist
+        group = self._stones[root]
+        color = cells[group[0]]
+        h = self.hash
+        for p in group:
+            h ^= zobrist[p][color]
+            cells[p] = EMPTY
+            parent[p] = p
+            self._empty.add(p)
+        self.hash = h
+        for p in group:
+            for nb in neighbors[p]:
+                if cells[nb]:
+                    self._liberties[self._find(nb)].add(p)
+        self._stones[root] = None
+        self._liberties[root] = None
+        captured.extend(group)
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def get(self, x: int, y: int) -> int:
+        return self.cells[y * self.size + x]
+
+    def is_empty(self, x: int, y: int) -> bool:
+        return self.in_bounds(x, y) and self.cells[y * self.size + x] == EMPTY
+
+    def is_legal(self, x: int, y: int, color: int) -> bool:
+        """判断落子是否合法：空点、非劫争禁着、非自杀，启用 superko 时还不能重复局面"""
+        if not self.in_bounds(x, y):
+            return False
+        idx = y * self.size + x
+        return self._is_legal_index(idx, color)
+
+    def _is_legal_index(self, idx: int, color: int) -> bool:
+        cells = self.cells
+        if cells[idx] != EMPTY:
+            return False
+        if idx == self.ko_point and color == self.ko_color:
+            return False
+        liberties = self._liberties
+        legal = False
+        for nb in self._neighbors[idx]:
+            c = cells[nb]
+            if c == EMPTY:
+                legal = True
+                break
+            libs = len(liberties[self._find(nb)])
+            if c == color:
+                # 与己方棋串相连，且该棋串还有其他的气
+                if libs > 1:
+                    legal = True
+                    break
+            elif libs == 1:
+                # 可以提掉对方棋子
+                legal = True
+                break
+        if legal and self.superko:
+            return self._hash_after(idx, color) not in self._seen_hashes
+        return legal
+
+    def _hash_after(self, idx: int, color: int) -> int:
+        """计算在 idx 落子后的局面哈希（不修改棋盘），只涉及被提的棋子"""
+        zobrist = self._zobrist
+        cells = self.cells
+        opponent = 3 - color
+        h = self.hash ^ zobrist[idx][color]
+        captured_roots = set()
+        for nb in self._neighbors[idx]:
+            if cells[nb] == opponent:
+                r = self._find(nb)
+                if r not in captured_roots and len(self._liberties[r]) == 1:
+                    captured_roots.add(r)
+                    for p in self._stones[r]:
+                        h ^= zobrist[p][opponent]
+        return h
+
+    @property
+    def position_key(self) -> str:
+        """稳定的局面键（16位十六进制），与走棋顺序和进程无关"""
+        return f"{self.hash:016x}"
+
+    def has_seen(self, position_hash: int) -> bool:
+        """O(1) 判断某个局面在本局中是否出现过"""
+        return position_hash in self._seen_hashes
+
+    def is_eye(self, x: int, y: int, color: int) -> bool:
+        """粗略判断空点是否为己方的单点眼（四周都是己方棋子或边界）"""
+        idx = y * self.size + x
+        if self.cells[idx] != EMPTY:
+            return False
+        return all(self.cells[nb] == color for nb in self._neighbors[idx])
+
+    def play(self, x: int, y: int, color: int) -> List[Tuple[int, int]]:
+        """落子并返回被提掉的棋子坐标列表，非法落子抛出 ValueError"""
+        if not self.is_legal(x, y, color):
+            raise ValueError(f"非法落子: ({x}, {y})")
+        coords = self.geometry.coords
+        return [coords[p] for p in self._place(y * self.size + x, color)]
+
+    def _place(self, idx: int, color: int) -> List[int]:
+        """在合法点落子，返回被提子的下标"""
+        cells = self.cells
+        liberties = self._liberties
+        cells[idx] = color
+        self.version += 1
+        self.hash ^= self._zobrist[idx][color]
+        self._empty.discard(idx)
+        self._parent[idx] = idx
+        self._stones[idx] = [idx]
+        liberties[idx] = {nb for nb in self._neighbors[idx] if cells[nb] == EMPTY}
+
+        root = idx
+        captured: List[int] = []
+        for nb in self._neighbors[idx]:
+            c = cells[nb]
+            if c == EMPTY:
+                continue
+            r = self._find(nb)
+            if r == root:
+                continue
+            liberties[r].discard(idx)
+            if c == color:
+                root = self._union(root, r)
+            elif not liberties[r]:
+                self._remove_group(r, captured)
+
+        # 单子提单子且落子后只剩一口气（即被提的那个点）时形成劫
+        if (len(captured) == 1 and len(self._stones[root]) == 1
+                and len(liberties[root]) == 1):
+            self.ko_point = captured[0]
+            self.ko_color = 3 - color
+        else:
+            self.ko_point = -1
+            self.ko_color = EMPTY
+        self._seen_hashes.add(self.hash)
+        return captured
+
+    def pass_turn(self):
+        """停一手：局面不变，只解除劫争禁着"""
+        self.ko_point = -1
+        self.ko_color = EMPTY
+
+    def groups(self) -> List[Tuple[List[int], set]]:
+        """返回所有棋串 (棋子下标列表, 气的下标集合)，调用方不应修改"""
+        return [(stones, libs) for stones, libs in zip(self._stones, self._liberties)
+                if stones is not None]
+
+    def liberties_at(self, x: int, y: int) -> int:
+        """返回该点所在棋串的气数，空点返回0"""
+        idx = y * self.size + x
+        if self.cells[idx] == EMPTY:
+            return 0
+        return len(self._liberties[self._find(idx)])
+
+    def empty_points(self) -> List[Tuple[int, int]]:
+        coords = self.geometry.coords
+        return [coords[p] for p in self._empty]
+
+    def legal_moves(self, color: int) -> List[Tuple[int, int]]:
+        coords = self.geometry.coords
+        return [coords[p] for p in self._empty if self._is_legal_index(p, color)]
+
+    @property
+    def array(self) -> np.ndarray:
+        """cells 的只读零拷贝视图，形状为 (size, size)，array[y, x]，随落子实时变化"""
+        if self._array is None:
+            view = np.frombuffer(self.cells, dtype=np.uint8).reshape(self.size, self.size)
+            view.flags.writeable = False
+            self._array = view
+        return self._array
+
+    def empty_mask(self) -> np.ndarray:
+        """空点的布尔数组 [y, x]"""
+        return self.array == EMPTY
+
+    def stone_counts(self) -> Tuple[int, int]:
+        """(黑子数, 白子数)"""
+        counts = np.bincount(self.array.ravel(), minlength=3)
+        return int(counts[BLACK]), int(counts[WHITE])
+
+    def cached_render(self, name: str, render: Callable[["GoBoard"], object]):
+        """按名称缓存 render(board) 的结果，直到下一次落子"""
+        if self._render_version != self.version:
+            self._renders.clear()
+            self._render_version = self.version
+        value = self._renders.get(name)
+        if value is None:
+            value = self._renders[name] = render(self)
+        return value
+
+    def memory_footprint(self) -> int:
+        """估算本棋盘占用的内存（字节），不含各局共享的几何表和 Zobrist 表"""
+        seen: set = set()
+        parts = (self.cells, self._parent, self._stones, self._liberties, self._empty,
+                 self._seen_hashes, self._renders)
+        return sys.getsizeof(self) + sum(deep_sizeof(part, seen) for part in parts)
+
+    def to_rows(self) -> List[List[int]]:
+        """转换为 board[y][x] 形式的二维列表（按局面缓存，调用方不应修改）"""
+        return self.cached_render("rows", _render_rows)
+
+    def to_text(self) -> str:
+        """每行以空格分隔的 0/1/2 文本（按局面缓存）"""
+        return self.cached_render("text", _render_text)
+
+
+def _render_rows(board: GoBoard) -> List[List[int]]:
+    return board.array.tolist()
+
+
+def _render_text(board: GoBoard) -> str:
+    return "\n".join(" ".join(map(str, row)) for row in board.to_rows())
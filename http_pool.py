@@ -0,0 +1,191 @@
+"""模型接口的 HTTP 连接池
+
+按 api_url 维护长生命周期的 aiohttp.ClientSession，复用 TCP/TLS 连接，
+并统计连接池命中、新建连接和等待空闲连接的耗时，用于评估连接池大小。
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import aiohttp
+
+from metrics import MOVE_PHASE_SECONDS
+
+logger = logging.getLogger('go_game')
+
+
+@dataclass
+class PoolConfig:
+    """连接池配置"""
+    limit: int = 200  # 每个会话的最大连接数
+    limit_per_host: int = 50  # 每个主机的最大连接数
+    keepalive_timeout: float = 60.0  # 空闲连接保活时间（秒）
+    ttl_dns_cache: int = 300  # DNS 缓存时间（秒）
+    total_timeout: float = 600.0  # 单次请求总超时（秒）
+    connect_timeout: float = 10.0  # 建立连接超时（秒）
+    sock_read_timeout: float = 300.0  # 两次读取之间的超时（秒）
+    preload_urls: Tuple[str, ...] = ()  # 启动时预先创建会话的 api_url
+
+    @classmethod
+    def from_env(cls) -> "PoolConfig":
+        """从 GO_HTTP_POOL_* 环境变量读取配置"""
+        defaults = cls()
+        return cls(
+            limit=int(os.getenv("GO_HTTP_POOL_LIMIT", defaults.limit)),
+            limit_per_host=int(os.getenv("GO_HTTP_POOL_LIMIT_PER_HOST", defaults.limit_per_host)),
+            keepalive_timeout=float(os.getenv("GO_HTTP_POOL_KEEPALIVE", defaults.keepalive_timeout)),
+            ttl_dns_cache=int(os.getenv("GO_HTTP_POOL_DNS_TTL", defaults.ttl_dns_cache)),
+            total_timeout=float(os.getenv("GO_HTTP_TIMEOUT_TOTAL", defaults.total_timeout)),
+            connect_timeout=float(os.getenv("GO_HTTP_TIMEOUT_CONNECT", defaults.connect_timeout)),
+            sock_read_timeout=float(os.getenv("GO_HTTP_TIMEOUT_READ", defaults.sock_read_timeout)),
+            preload_urls=tuple(
+                url.strip() for url in os.getenv("GO_HTTP_PRELOAD_URLS", "").split(",") if url.strip()
+            ),
+        )
+
+
+class PoolStats:
+    """单个 api_url 的连接池统计"""
+
+    def __init__(self):
+        self.session_hits = 0  # 复用已有会话
+        self.session_misses = 0  # 新建会话
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.connection_waits = 0  # 因连接数达到上限而排队的次数
+        self.connection_wait_total = 0.0
+        self.connection_wait_max = 0.0
+
+    def record_wait(self, seconds: float):
+        self.connection_waits += 1
+        self.connection_wait_total += seconds
+        if seconds > self.connection_wait_max:
+            self.connection_wait_max = seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "session_hits": self.session_hits,
+            "session_misses": self.session_misses,
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "connection_waits": self.connection_waits,
+            "connection_wait_total": round(self.connection_wait_total, 4),
+            "connection_wait_max": round(self.connection_wait_max, 4),
+        }
+
+
+def _build_trace_config(stats: PoolStats) -> aiohttp.TraceConfig:
+    """创建用于统计连接复用、排队等待和获取连接耗时的 TraceConfig"""
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        stats.requests += 1
+        ctx.request_start = time.perf_counter()
+
+    def observe_connect(ctx):
+        """从发出请求到拿到连接（复用或新建）的耗时，按请求附带的模型名记录"""
+        model = (ctx.trace_request_ctx or {}).get("model", "")
+        MOVE_PHASE_SECONDS.labels("connect", model).observe(time.perf_counter() - ctx.request_start)
+
+    async def on_queued_start(session, ctx, params):
+        ctx.queued_at = time.perf_counter()
+
+    async def on_queued_end(session, ctx, params):
+        stats.record_wait(time.perf_counter() - ctx.queued_at)
+
+    async def on_create_end(session, ctx, params):
+        stats.connections_created += 1
+        observe_connect(ctx)
+
+    async def on_reuseconn(session, ctx, params):
+        stats.connections_reused += 1
+        observe_connect(ctx)
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_queued_start.append(on_queued_start)
+    trace_config.on_connection_queued_end.append(on_queued_end)
+    trace_config.on_connection_create_end.append(on_create_end)
+    trace_config.on_connection_reuseconn.append(on_reuseconn)
+    return trace_config
+
+
+class SessionRegistry:
+    """按 api_url 共享的 ClientSession 注册表"""
+
+    def __init__(self, config: PoolConfig = None):
+        self.config = config or PoolConfig()
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._stats: Dict[str, PoolStats] = {}
+
+    async def start(self, config: PoolConfig = None):
+        """
+        应用启动时调用，可替换配置
+
+        为 GO_HTTP_PRELOAD_URLS 中的 api_url 预先创建会话，首局对局无需再创建会话；
+        其余 api_url 在第一次请求时创建。TCP/TLS 连接仍在第一次请求时建立
+        """
+        if config:
+            self.config = config
+        for api_url in self.config.preload_urls:
+            self.get(api_url)
+        logger.info(f"HTTP连接池已启动，预创建 {len(self.config.preload_urls)} 个会话，配置: {self.config}")
+
+    def get(self, api_url: str) -> aiohttp.ClientSession:
+        """获取 api_url 对应的会话，不存在或已关闭时新建（必须在事件循环中调用）"""
+        stats = self._stats.get(api_url)
+        if stats is None:
+            stats = self._stats[api_url] = PoolStats()
+        session = self._sessions.get(api_url)
+        if session is not None and not session.closed:
+            stats.session_hits += 1
+            return session
+
+        stats.session_misses += 1
+        config = self.config
+        connector = aiohttp.TCPConnector(
+            limit=config.limit,
+            limit_per_host=config.limit_per_host,
+            keepalive_timeout=config.keepalive_timeout,
+            ttl_dns_cache=config.ttl_dns_cache,
+            use_dns_cache=True,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=config.total_timeout,
+            connect=config.connect_timeout,
+            sock_read=config.sock_read_timeout,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[_build_trace_config(stats)],
+        )
+        self._sessions[api_url] = session
+        logger.info(f"为 {api_url} 创建新的HTTP会话")
+        return session
+
+    async def close(self):
+        """关闭所有会话，应用关闭时调用"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+        logger.info(f"HTTP连接池已关闭，共关闭 {len(sessions)} 个会话")
+
+    def stats(self) -> Dict[str, dict]:
+        """各 api_url 的连接池统计"""
+        result = {}
+        for api_url, stats in self._stats.items():
+            data = stats.to_dict()
+            session = self._sessions.get(api_url)
+            data["open"] = session is not None and not session.closed
+            result[api_url] = data
+        return result
+
+
+# 全局共享的会话注册表
+session_registry = SessionRegistry()
@@ -0,0 +1,187 @@
+"""游戏所有权租约
+
+多 worker 部署时，同一局的AI回合只能由一个 worker 驱动。回合循环开始前先获取
+该局的租约，循环期间由心跳任务定期续约，循环结束时释放；持有者异常退出后，
+租约过期即可被其他 worker 获取。
+
+- LeaseManager：进程内实现（单 worker）
+- SQLiteLeaseManager：多个 worker 共享同一个 SQLite 数据库文件，
+  获取和续约都是一条带条件的 UPSERT，由 SQLite 保证原子性
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+logger = logging.getLogger('go_game')
+
+
+class LeaseManager:
+    """进程内的租约表"""
+
+    def __init__(self, ttl: float = 30.0, owner: Optional[str] = None):
+        self.ttl = ttl  # 租约有效期（秒），心跳间隔为其三分之一
+        self.owner = owner or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self.acquired = 0
+        self.denied = 0
+        self.lost = 0
+
+    def _try_acquire(self, game_id: str, now: float) -> bool:
+        current = self._leases.get(game_id)
+        if current is not None and current[0] != self.owner and current[1] > now:
+            return False
+        self._leases[game_id] = (self.owner, now + self.ttl)
+        return True
+
+    def _release(self, game_id: str):
+        current = self._leases.get(game_id)
+        if current is not None and current[0] == self.owner:
+            del self._leases[game_id]
+
+    def _owner_of(self, game_id: str, now: float) -> Optional[str]:
+        current = self._leases.get(game_id)
+        return current[0] if current is not None and current[1] > now else None
+
+    async def acquire(self, game_id: str) -> bool:
+        """获取或续约该局的租约，已被其他 worker 持有且未过期时返回 False"""
+        ok = self._try_acquire(game_id, time.time())
+        if ok:
+            self.acquired += 1
+        else:
+            self.denied += 1
+        return ok
+
+    async def release(self, game_id: str):
+        self._release(game_id)
+
+    async def owner_of(self, game_id: str) -> Optional[str]:
+        """当前持有该局租约的 worker，没有有效租约时返回 None"""
+        return self._owner_of(game_id, time.time())
+
+    @asynccontextmanager
+    async def hold(self, game_id: str, wait: float = 0.0) -> AsyncIterator[bool]:
+        """
+        async with leases.hold(game_id) as acquired: ...
+        租约被占用时最多等待 wait 秒（持有者可能正要释放）。获取成功时在代码块执行期间
+        定期续约，退出时释放；续约失败说明租约已被其他 worker 获取，此时取消当前任务
+        """
+        deadline = time.monotonic() + wait
+        acquired = await self.acquire(game_id)
+        while not acquired and time.monotonic() < deadline:
+            await asyncio.sleep(min(0.2, self.ttl / 3))
+            acquired = await self.acquire(game_id)
+        if not acquired:
+            yield False
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(game_id, asyncio.current_task()))
+        try:
+            yield True
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            await self.release(game_id)
+
+    async def _heartbeat(self, game_id: str, holder: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                renewed = await self.acquire(game_id)
+            except Exception as e:
+                logger.error(f"游戏 {game_id}: 续约失败: {str(e)}")
+                continue
+            if not renewed:
+                self.lost += 1
+                logger.warning(f"游戏 {game_id}: 租约已被其他 worker 获取，停止驱动该局")
+                holder.cancel()
+                return
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "owner": self.owner,
+            "ttl": self.ttl,
+            "acquired": self.acquired,
+            "denied": self.denied,
+            "lost": self.lost,
+        }
+
+
+class SQLiteLeaseManager(LeaseManager):
+    """多个 worker 共享的 SQLite 租约表，数据库操作在线程池中执行"""
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS game_leases ("
+            "game_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _try_acquire(self, game_id, now):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO game_leases VALUES (?, ?, ?) "
+                "ON CONFLICT(game_id) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE game_leases.owner = excluded.owner OR game_leases.expires <= ?",
+                (game_id, self.owner, now + self.ttl, now)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def _release(self, game_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM game_leases WHERE game_id = ? AND owner = ?", (game_id, self.owner)
+            )
+            self._conn.commit()
+
+    def _owner_of(self, game_id, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner FROM game_leases WHERE game_id = ? AND expires > ?", (game_id, now)
+            ).fetchone()
+        return row[0] if row else None
+
+    async def acquire(self, game_id: str) -> bool:
+        ok = await asyncio.to_thread(self._try_acquire, game_id, time.time())
+        if ok:
+            self.acquired += 1
+        else:
+            self.denied += 1
+        return ok
+
+    async def release(self, game_id: str):
+        await asyncio.to_thread(self._release, game_id)
+
+    async def owner_of(self, game_id: str) -> Optional[str]:
+        return await asyncio.to_thread(self._owner_of, game_id, time.time())
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_lease_manager(spec: str = None, owner: Optional[str] = None) -> LeaseManager:
+    """
+    按配置创建租约表，spec 默认取环境变量 GO_LEASES：
+    "local"（默认，单 worker）或 "sqlite:/path/to/leases.sqlite"
+    """
+    spec = spec or os.getenv("GO_LEASES", "local")
+    ttl = float(os.getenv("GO_LEASE_TTL", 30.0))
+    kind, _, path = spec.partition(":")
+    if kind == "sqlite":
+        return SQLiteLeaseManager(path or "leases.sqlite", ttl=ttl, owner=owner)
+    return LeaseManager(ttl=ttl, owner=owner)
@@ -1,71 +1,165 @@
+"""日志配置
+
+所有日志记录先放入内存队列（QueueHandler），由后台线程中的 QueueListener
+格式化并写入文件和控制台，事件循环线程不会因为磁盘I/O阻塞。
+
+- logs/go_game.log：主日志，JSON Lines 格式，按大小轮转
+- logs/moves.jsonl：所有游戏共用的走棋日志，每条记录带 game_id，按大小轮转，
+  不再为每局游戏单独打开一个文件
+- 过长的消息（例如完整的提示词和模型回复）在入队前截断
+"""
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional
 
-def setup_move_logger(game_id):
-    """设置移动日志记录器"""
-    # 创建logs目录（如果不存在）
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+LOG_DIR = 'logs'
 
-    # 创建以游戏ID命名的日志文件
-    log_filename = f'logs/moves_{game_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'
-    
-    # 创建日志记录器
-    logger = logging.getLogger(f'moves_{game_id}')
-    logger.setLevel(logging.INFO)
-    
-    # 防止日志重复
-    if logger.handlers:
-        return logger
+# 单条日志消息的最大字符数，超出部分截断
+MAX_MESSAGE_CHARS = int(os.getenv("GO_LOG_MAX_CHARS", 2000))
+# 日志队列容量，队列满时丢弃新记录而不是阻塞
+QUEUE_SIZE = int(os.getenv("GO_LOG_QUEUE_SIZE", 10000))
 
-    # 创建格式化器（只包含时间和消息）
-    formatter = logging.Formatter('%(asctime)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+_listeners: List[QueueListener] = []
+_moves_logger: Optional[logging.Logger] = None
 
-    # 创建文件处理器
-    file_handler = logging.FileHandler(log_filename, encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(formatter)
 
-    # 添加处理器到日志记录器
-    logger.addHandler(file_handler)
+def truncate(text: str, limit: int = MAX_MESSAGE_CHARS) -> str:
+    """截断过长的文本，保留开头并注明原长度"""
+    if limit and len(text) > limit:
+        return f"{text[:limit]}…（已截断，共{len(text)}字符）"
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        game_id = getattr(record, "game_id", None)
+        if game_id is not None:
+            data["game_id"] = game_id
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """只在调用线程里做廉价的工作（合并参数、截断），队列满时丢弃记录"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # 异常堆栈只能在当前线程格式化
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _start_listener(*handlers: logging.Handler) -> NonBlockingQueueHandler:
+    """启动一个后台写日志线程，返回对应的队列处理器"""
+    log_queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return NonBlockingQueueHandler(log_queue)
+
+
+def stop_logging():
+    """停止后台写日志线程：写完队列中剩余的记录并关闭文件，应用关闭时调用"""
+    while _listeners:
+        listener = _listeners.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(stop_logging)
+
+
+def setup_move_logger(game_id):
+    """获取某局游戏的走棋日志记录器（共用一个文件，记录中带 game_id）"""
+    global _moves_logger
+    if _moves_logger is None:
+        if not os.path.exists(LOG_DIR):
+            os.makedirs(LOG_DIR)
+        _moves_logger = logging.getLogger('go_game.moves')
+        _moves_logger.setLevel(logging.INFO)
+        _moves_logger.propagate = False
+        if not _moves_logger.handlers:
+            file_handler = RotatingFileHandler(
+                os.path.join(LOG_DIR, 'moves.jsonl'),
+                maxBytes=50*1024*1024,  # 50MB
+                backupCount=5,
+                encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonFormatter())
+            _moves_logger.addHandler(_start_listener(file_handler))
+    return logging.LoggerAdapter(_moves_logger, {"game_id": game_id})
 
-    return logger
 
 def setup_logger():
     """设置日志记录器"""
     # 创建logs目录（如果不存在）
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+    if not os.path.exists(LOG_DIR):
+        os.makedirs(LOG_DIR)
 
     # 创建日志记录器
     logger = logging.getLogger('go_game')
     logger.setLevel(logging.DEBUG)
+    if logger.handlers:
+        return logger
 
-    # 创建格式化器
-    formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-
-    # 创建文件处理器（带有文件轮转）
+    # 创建文件处理器（带有文件轮转，JSON Lines 格式）
     file_handler = RotatingFileHandler(
-        'logs/go_game.log',
+        os.path.join(LOG_DIR, 'go_game.log'),
         maxBytes=10*1024*1024,  # 10MB
         backupCount=5,
         encoding='utf-8'
     )
     file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
+    file_handler.setFormatter(JsonFormatter())
 
     # 创建控制台处理器
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(formatter)
+    console_handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
 
-    # 添加处理器到日志记录器
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # 写文件和控制台都在后台线程中进行
+    logger.addHandler(_start_listener(file_handler, console_handler))
 
     return logger
+
+
+def logging_stats() -> dict:
+    """各日志队列的积压和丢弃数"""
+    handlers = [h for name in ('go_game', 'go_game.moves')
+                for h in logging.getLogger(name).handlers
+                if isinstance(h, NonBlockingQueueHandler)]
+    return {
+        "queued": sum(h.queue.qsize() for h in handlers),
+        "dropped": sum(h.dropped for h in handlers),
+    }
@@ -1,13 +1,36 @@
-from fastapi import FastAPI, HTTPException, WebSocket, BackgroundTasks
+from fastapi import FastAPI, HTTPException, WebSocket, BackgroundTasks, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Tuple
+from typing import List, Literal, Optional, Dict, Tuple
+from collections import deque
 import uuid
 import asyncio
+import os
+import time
 import json
 from ai_player import AIPlayer
-from logger_config import setup_logger, setup_move_logger
+from go_board import PASS_MOVE, GoBoard
+from http_pool import PoolConfig, session_registry
+from scheduler import TurnScheduler
+from protocol import build_chat_delta, build_game_over, build_move_delta, build_snapshot, build_thinking_start
+from broadcaster import Broadcaster, serialize
+from pubsub import create_pubsub
+from leases import create_lease_manager
+from resilience import resilient_caller
+from response_cache import response_cache
+from batching import batch_registry
+from mcts import mcts_engine
+from opening_book import opening_book
+from game_store import GameRegistry, create_game_store
+from scoring import AREA_SCORING, DEFAULT_KOMI, score_board
+from game_record import GameRecord, to_sgf
+from snapshot import (
+    batch_etag, build_compact_snapshot, compress, etag_matches, game_etag, join_fragments, snapshot_cache
+)
+from metrics import ACTIVE_GAMES, CONTENT_TYPE, WEBSOCKET_CONNECTIONS, registry as metrics_registry
+from logger_config import logging_stats, setup_logger, setup_move_logger, stop_logging, truncate
+from memory_usage import deep_sizeof, process_rss
 
 # 设置日志记录器
 logger = setup_logger()
@@ -18,15 +41,91 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # 定义棋盘大小
 BOARD_SIZE = 19
 
+# 所有WebSocket断开后，等待多久仍无人观看则取消该局的AI回合（秒）
+ABANDON_GRACE_SECONDS = 60
+
+# 游戏空闲多久后从内存中回收（秒），回收后可从存储重新加载
+GAME_IDLE_TTL = float(os.getenv("GO_GAME_IDLE_TTL", 1800))
+# 已终局的游戏空闲多久后移出内存（秒）
+FINISHED_GAME_TTL = float(os.getenv("GO_FINISHED_GAME_TTL", 300))
+# 内存中最多保留的游戏数，超出时回收最久未访问的游戏（0 表示不限制）
+MAX_LIVE_GAMES = int(os.getenv("GO_MAX_LIVE_GAMES", 0))
+# 检查空闲游戏的间隔（秒）
+EVICTION_INTERVAL = 60
+
+# 每局内存中保留的聊天记录条数（更早的记录仍在存储中）
+CHAT_HISTORY_LIMIT = int(os.getenv("GO_CHAT_HISTORY_LIMIT", 200))
+# 内存中每条思考过程/聊天消息保留的最大字符数（存储中保留完整内容）
+REASONING_MAX_CHARS = int(os.getenv("GO_REASONING_MAX_CHARS", 4000))
+
+# 一次批量快照请求最多包含的游戏数
+SNAPSHOT_BATCH_LIMIT = int(os.getenv("GO_SNAPSHOT_BATCH_LIMIT", 1000))
+
+background_jobs = set()
+
+@app.on_event("startup")
+async def on_startup():
+    """启动共享的HTTP连接池、游戏存储和空闲游戏回收"""
+    await session_registry.start(PoolConfig.from_env())
+    await game_store.start()
+    await bus.start(on_bus_message)
+    task = asyncio.create_task(evict_idle_games())
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """停止所有AI回合，落盘游戏事件并关闭共享的HTTP连接池"""
+    for task in list(background_jobs):
+        task.cancel()
+    await scheduler.shutdown()
+    await bus.close()
+    await leases.close()
+    await broadcaster.close_all()
+    await game_store.close()
+    mcts_engine.close()
+    await session_registry.close()
+    response_cache.close()
+    stop_logging()
+
 class GameState:
+    __slots__ = (
+        "config", "board", "current_player", "game_id", "moves_history", "move_reasonings",
+        "chat_history", "black_model_type", "white_model_type", "black_model_url", "white_model_url",
+        "black_ai", "white_ai", "last_move", "last_captured", "captures", "passes", "scoring", "komi",
+        "result", "current_thinking", "seq", "moves_logger",
+    )
+
     def __init__(self, black_model_type=None, black_model_url=None, black_model_name=None, 
                  white_model_type=None, white_model_url=None, white_model_name=None, 
-                 first_player=1, black_bearer_token=None, white_bearer_token=None):
-        self.board = [[0 for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+                 first_player=1, black_bearer_token=None, white_bearer_token=None,
+                 black_stream=False, white_stream=False, scoring=AREA_SCORING, komi=None,
+                 black_hedge_url=None, white_hedge_url=None, game_id=None, replaying=False):
+        """replaying 为真时表示根据存储的记录重建已有的游戏，不再记录“创建新游戏”日志"""
+        # 创建配置，持久化后可据此重建游戏
+        self.config = {
+            "black_model_type": black_model_type,
+            "black_model_url": black_model_url,
+            "black_model_name": black_model_name,
+            "white_model_type": white_model_type,
+            "white_model_url": white_model_url,
+            "white_model_name": white_model_name,
+            "first_player": first_player,
+            "black_bearer_token": black_bearer_token,
+            "white_bearer_token": white_bearer_token,
+            "black_stream": black_stream,
+            "white_stream": white_stream,
+            "scoring": scoring,
+            "komi": komi,
+            "black_hedge_url": black_hedge_url,
+            "white_hedge_url": white_hedge_url
+        }
+        self.board = GoBoard(BOARD_SIZE, superko=True)  # 使用全局同形禁着
         self.current_player = first_player  # 1代表黑棋，2代表白棋
-        self.game_id = str(uuid.uuid4())
+        self.game_id = game_id or str(uuid.uuid4())
         self.moves_history = []
-        self.chat_history = []
+        self.move_reasonings: List[Optional[str]] = []  # 与 moves_history 一一对应的思考过程
+        self.chat_history = deque(maxlen=CHAT_HISTORY_LIMIT)  # 最近的聊天记录（环形缓冲）
         self.black_model_type = black_model_type
         self.white_model_type = white_model_type
         self.black_model_url = black_model_url
@@ -37,37 +136,54 @@ class GameState:
             model_type=black_model_type,
             api_url=black_model_url,
             model_name=black_model_name,
-            bearer_token=black_bearer_token
+            bearer_token=black_bearer_token,
+            stream=black_stream,
+            hedge_api_url=black_hedge_url
         ) if black_model_type else None
         
         self.white_ai = AIPlayer(
             model_type=white_model_type,
             api_url=white_model_url,
             model_name=white_model_name,
-            bearer_token=white_bearer_token
+            bearer_token=white_bearer_token,
+            stream=white_stream,
+            hedge_api_url=white_hedge_url
         ) if white_model_type else None
         self.last_move: Optional[Tuple[int, int, str]] = None  # (x, y, reasoning)
+        self.last_captured: List[Tuple[int, int]] = []  # 上一手提掉的棋子
+        self.captures = {1: 0, 2: 0}  # 双方累计提子数
+        self.passes = 0  # 连续停一手的次数，双方各停一手后终局
+        self.scoring = scoring  # 计分规则："area" 数子法或 "territory" 数目法
+        self.komi = komi  # 贴目，None 表示使用计分规则的默认值
+        self.result: Optional[dict] = None  # 终局计分结果
         self.current_thinking = ""  # 当前棋手的思考过程
+        self.seq = 0  # 状态变化序号（落子、聊天），用于WebSocket增量协议
         # 设置两个日志记录器
-        logger.info(f"创建新游戏 {self.game_id}, 黑方模型地址: {black_model_url}, 白方模型地址: {white_model_url}, 先手: {'黑方' if first_player == 1 else '白方'}")
+        if not replaying:
+            logger.info(f"创建新游戏 {self.game_id}, 黑方模型地址: {black_model_url}, 白方模型地址: {white_model_url}, 先手: {'黑方' if first_player == 1 else '白方'}")
         self.moves_logger = setup_move_logger(self.game_id)
 
+    @property
+    def game_over(self) -> bool:
+        return self.result is not None
+
     def is_valid_move(self, x: int, y: int) -> bool:
-        if not (0 <= x < BOARD_SIZE and 0 <= y < BOARD_SIZE):
-            return False
-        if self.board[y][x] != 0:
-            return False
-        return True
+        return not self.game_over and self.board.is_legal(x, y, self.current_player)
 
     def make_move(self, x: int, y: int) -> bool:
         if not self.is_valid_move(x, y):
             logger.warning(f"游戏 {self.game_id}: 无效的移动 ({x}, {y})")
             return False
         
-        self.board[y][x] = self.current_player
+        self.last_captured = self.board.play(x, y, self.current_player)
+        self.captures[self.current_player] += len(self.last_captured)
+        self.passes = 0
         self.moves_history.append((x, y, self.current_player))
+        self.move_reasonings.append(None)
         # 记录到主日志
         logger.info(f"游戏 {self.game_id}: {'黑方' if self.current_player == 1 else '白方'} 在 ({x}, {y}) 落子")
+        if self.last_captured:
+            logger.info(f"游戏 {self.game_id}: 提子 {len(self.last_captured)} 枚 {self.last_captured}")
         # 记录到移动日志，只记录move字段
         self.moves_logger.info(f"Move: ({x}, {y})")
         
@@ -75,19 +191,188 @@ class GameState:
         self.current_thinking = ""  # 清空上个棋手的思考过程
         return True
 
+    def pass_turn(self) -> bool:
+        """当前棋手停一手，双方连续停一手后终局计分"""
+        if self.game_over:
+            return False
+        self.board.pass_turn()
+        self.last_captured = []
+        self.moves_history.append((*PASS_MOVE, self.current_player))
+        self.move_reasonings.append(None)
+        self.passes += 1
+        logger.info(f"游戏 {self.game_id}: {'黑方' if self.current_player == 1 else '白方'} 停一手")
+        self.moves_logger.info("Move: pass")
+        self.current_player = 3 - self.current_player
+        self.current_thinking = ""
+        if self.passes >= 2:
+            self.finish()
+        return True
+
+    def finish(self, log: bool = True):
+        """终局：按计分规则计算结果，重放或同步其他 worker 的终局时 log 为假，不重复写日志"""
+        score = score_board(self.board, self.scoring, self.komi, self.captures)
+        self.result = score.to_dict()
+        if log:
+            logger.info(f"游戏 {self.game_id}: 终局 {score.summary}，黑 {score.black} 白 {score.white}")
+            self.moves_logger.info(f"Result: {score.summary}")
+        self.release()
+
+    def release(self):
+        """释放对局结束或移出内存后不再需要的资源（AI棋手及其提示词缓存）"""
+        self.black_ai = None
+        self.white_ai = None
+
+    def add_chat(self, player: int, message: str) -> Dict:
+        """追加一条聊天记录（过长的内容截断），返回该记录"""
+        entry = {"type": "chat", "player": player, "message": truncate(message, REASONING_MAX_CHARS)}
+        self.chat_history.append(entry)
+        return entry
+
+    def set_reasoning(self, reasoning: Optional[str]):
+        """记录最近一手的思考过程（过长的内容截断）"""
+        if reasoning is not None:
+            reasoning = truncate(reasoning, REASONING_MAX_CHARS)
+        self.move_reasonings[-1] = reasoning
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """估算本局各部分占用的内存（字节），不含各局共享的表"""
+        seen = set()
+        return {
+            "board": self.board.memory_footprint(),
+            "history": deep_sizeof(self.moves_history, seen) + deep_sizeof(self.move_reasonings, seen),
+            "chat": deep_sizeof(self.chat_history, seen),
+            "ai_players": sum(ai.memory_footprint() for ai in (self.black_ai, self.white_ai) if ai),
+            "state": sum(deep_sizeof(value, seen) for value in (
+                self.config, self.last_move, self.last_captured, self.result, self.current_thinking
+            )),
+        }
+
+    def play(self, x: int, y: int) -> bool:
+        """落子或停一手（坐标为 PASS_MOVE）"""
+        if (x, y) == PASS_MOVE:
+            return self.pass_turn()
+        return self.make_move(x, y)
+
+    def apply_event(self, event: dict):
+        """应用一个已存储的落子或聊天事件（用于重放和同步其他 worker 上的变化，不重复写日志）"""
+        if event["kind"] == "move":
+            x, y, player = event["x"], event["y"], event["player"]
+            self.moves_history.append((x, y, player))
+            self.move_reasonings.append(None)
+            self.set_reasoning(event.get("reasoning"))
+            self.current_player = 3 - player
+            self.current_thinking = ""
+            if (x, y) == PASS_MOVE:
+                self.board.pass_turn()
+                self.last_captured = []
+                self.passes += 1
+            else:
+                self.last_captured = self.board.play(x, y, player)
+                self.captures[player] += len(self.last_captured)
+                self.passes = 0
+            if event.get("reasoning") is not None:
+                # AI的落子同时带有思考过程
+                self.last_move = (x, y, self.move_reasonings[-1], event.get("elapsed"))
+                self.add_chat(player, f"{event['reasoning']}")
+        elif event["kind"] == "chat":
+            self.add_chat(event["player"], event["message"])
+
+    def replay_events(self, events: List[dict]):
+        """根据存储的落子和聊天事件重建对局状态（不重复写日志）"""
+        for event in events:
+            self.apply_event(event)
+        # 每个事件在直播时都占用一个序号，终局消息另占一个
+        self.seq = len(events)
+        if self.passes >= 2:
+            self.finish(log=False)
+            self.seq += 1
+
+    def to_record(self) -> GameRecord:
+        """导出为棋谱记录（可写入二进制棋谱库或导出SGF）"""
+        result = self.result or {}
+        return GameRecord(
+            size=BOARD_SIZE,
+            komi=result.get("komi", self.komi if self.komi is not None else DEFAULT_KOMI[self.scoring]),
+            winner=result.get("winner"),
+            margin=result.get("margin", 0.0),
+            moves=list(self.moves_history),
+            reasonings=list(self.move_reasonings),
+            meta={
+                "game_id": self.game_id,
+                "black": self.config["black_model_name"] or self.black_model_type or "human",
+                "white": self.config["white_model_name"] or self.white_model_type or "human",
+                "scoring": self.scoring,
+            },
+        )
+
+    @property
+    def position_key(self) -> str:
+        """当前局面的稳定键（Zobrist 哈希），供缓存、去重等使用"""
+        return self.board.position_key
+
     def get_board_state(self) -> List[List[int]]:
-        return self.board
+        return self.board.to_rows()
 
     def get_current_player(self) -> int:
         return self.current_player
 
-# 存储游戏状态
-games = {}
+    def next_seq(self) -> int:
+        """分配下一个状态变化序号"""
+        self.seq += 1
+        return self.seq
+
+def rehydrate_game(game_id: str, config: dict, events: List[dict]) -> GameState:
+    """根据存储的配置和事件重建游戏"""
+    game = GameState(game_id=game_id, replaying=True, **config)
+    game.replay_events(events)
+    return game
+
+def stored_version(events: List[dict]) -> int:
+    """不重放即可得到的游戏版本（与 replay_events 之后的 seq 相同）"""
+    passes = 0
+    for event in events:
+        if event["kind"] == "move":
+            passes = passes + 1 if (event["x"], event["y"]) == PASS_MOVE else 0
+    return len(events) + (1 if passes >= 2 else 0)
+
+def cold_snapshot(game_id: str, config: dict, events: List[dict]) -> dict:
+    """为不在内存中的游戏生成紧凑快照：在临时副本上重放，不创建AI棋手，也不放入内存"""
+    config = dict(config, black_model_type=None, white_model_type=None)
+    return build_compact_snapshot(rehydrate_game(game_id, config, events))
+
+# 游戏存储（GO_GAME_STORE 选择内存、SQLite或追加日志实现）
+game_store = create_game_store()
+
+def release_game(game_id: str, game: GameState):
+    """游戏移出内存后释放它的缓存和AI棋手"""
+    snapshot_cache.retire(game_id)
+    game.release()
+
+# 存储游戏状态：内存中的活跃游戏，冷游戏按需从存储加载；
+# AI正在走棋或仍有观众的游戏不会被回收
+games = GameRegistry(
+    game_store, rehydrate_game,
+    idle_ttl=GAME_IDLE_TTL,
+    finished_ttl=FINISHED_GAME_TTL,
+    max_live=MAX_LIVE_GAMES,
+    is_busy=lambda game_id: scheduler.is_running(game_id) or broadcaster.has_connections(game_id),
+    on_evict=release_game,
+)
+
+async def evict_idle_games():
+    """定期回收空闲的游戏"""
+    while True:
+        await asyncio.sleep(EVICTION_INTERVAL)
+        try:
+            await games.evict_idle()
+        except Exception as e:
+            logger.error(f"回收空闲游戏失败: {str(e)}")
 
 class MoveRequest(BaseModel):
     game_id: Optional[str] = None
     x: int
     y: int
+    pass_turn: bool = False  # 停一手（此时忽略 x, y）
     expected_format: Optional[str] = "json"  # 支持不同的返回格式
 
 class GameResponse(BaseModel):
@@ -96,18 +381,25 @@ class GameResponse(BaseModel):
     current_player: int
     message: str
     status: str
+    result: Optional[dict] = None  # 终局计分结果
 
 class GameConfig(BaseModel):
     player_type: str = "ai"  # "ai" 或 "human"
-    black_model_type: Optional[str] = None  # "deepseek", "openai", 或 "compatible"
+    black_model_type: Optional[str] = None  # "deepseek", "openai", "compatible", 或 "mcts"（本地搜索）
     black_model_url: Optional[str] = None
     black_model_name: Optional[str] = None
-    white_model_type: Optional[str] = None  # "deepseek", "openai", 或 "compatible"
+    white_model_type: Optional[str] = None  # "deepseek", "openai", "compatible", 或 "mcts"（本地搜索）
     white_model_url: Optional[str] = None
     white_model_name: Optional[str] = None
     first_player: Optional[int] = 1  # 1代表黑棋，2代表白棋
     black_bearer_token: Optional[str] = None  # 黑方Bearer Token认证
     white_bearer_token: Optional[str] = None  # 白方Bearer Token认证
+    black_stream: bool = False  # 黑方是否使用流式响应
+    white_stream: bool = False  # 白方是否使用流式响应
+    scoring: Literal["area", "territory"] = AREA_SCORING  # 计分规则："area" 数子法或 "territory" 数目法
+    komi: Optional[float] = None  # 贴目，默认按计分规则取 7.5 或 6.5
+    black_hedge_url: Optional[str] = None  # 黑方备用接口（主接口过慢或熔断时使用）
+    white_hedge_url: Optional[str] = None  # 白方备用接口（主接口过慢或熔断时使用）
 
 @app.post("/start_game")
 async def start_game(config: GameConfig, background_tasks: BackgroundTasks):
@@ -124,16 +416,22 @@ async def start_game(config: GameConfig, background_tasks: BackgroundTasks):
         white_model_name=config.white_model_name,
         first_player=config.first_player,
         black_bearer_token=config.black_bearer_token,
-        white_bearer_token=config.white_bearer_token
+        white_bearer_token=config.white_bearer_token,
+        black_stream=config.black_stream,
+        white_stream=config.white_stream,
+        scoring=config.scoring,
+        komi=config.komi,
+        black_hedge_url=config.black_hedge_url,
+        white_hedge_url=config.white_hedge_url
     )
-    games[game.game_id] = game
+    await games.add(game, game.config)
     
     # 如果是AI对战且当前玩家有AI，立即让AI走第一步
     if config.player_type == "ai" and (
         (game.current_player == 1 and game.black_ai) or 
         (game.current_player == 2 and game.white_ai)
     ):
-        background_tasks.add_task(ai_move, game.game_id)
+        background_tasks.add_task(trigger_ai, game.game_id)
     
     return {
         "game_id": game.game_id,
@@ -143,90 +441,119 @@ async def start_game(config: GameConfig, background_tasks: BackgroundTasks):
         "last_move": game.last_move
     }
 
-async def ai_move(game_id: str):
-    """AI走棋"""
-    game = games.get(game_id)
+async def ai_move(game_id: str) -> bool:
+    """AI走一步棋，返回下一手是否仍由AI走（由调度器循环调用）"""
+    game = await games.get(game_id)
     if not game:
         logger.error(f"游戏 {game_id} 不存在")
-        return
+        return False
     
+    if game.game_over:
+        return False
+
     current_ai = game.black_ai if game.current_player == 1 else game.white_ai
     if not current_ai:
         logger.warning(f"游戏 {game_id}: 当前玩家没有配置AI模型")
-        return
+        return False
 
     logger.info(f"游戏 {game_id}: AI开始思考...")
     
     # 通知所有连接的客户端AI开始思考
-    if game_id in websocket_connections:
-        message = {
-            "type": "thinking_start",
-            "player": game.current_player,
-            "board": game.get_board_state(),
-            "current_player": game.get_current_player(),
-            "moves_history": game.moves_history
-        }
-        await broadcast_message(game_id, message)
+    if has_audience(game_id):
+        await broadcast_message(game_id, build_thinking_start(game))
     
-    # 获取AI的移动
-    x, y, reasoning, elapsed_time = await current_ai.get_move(
-        game.get_board_state(),
-        game.get_current_player(),
-        game.moves_history,
-        game.chat_history
-    )
+    thinking_player = game.current_player
+
+    async def relay_thinking(delta: str):
+        """把流式思考过程增量转发给客户端"""
+        if has_audience(game_id):
+            await broadcast_message(game_id, {
+                "type": "thinking_delta",
+                "player": thinking_player,
+                "delta": delta
+            })
+
+    # 获取AI的移动（受全局/单接口并发限制和单步超时约束）
+    start_time = time.time()
+    try:
+        x, y, reasoning, elapsed_time = await scheduler.call_model(
+            current_ai.api_url,
+            lambda: current_ai.get_move(
+                game.board,
+                game.get_current_player(),
+                game.moves_history,
+                game.chat_history,
+                on_thinking=relay_thinking,
+                scoring=game.scoring,
+                komi=game.komi,
+                captures=game.captures
+            )
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"游戏 {game_id}: AI思考超过 {scheduler.move_timeout} 秒，使用随机移动")
+        x, y, reasoning, elapsed_time = current_ai.fallback_move(
+            game.board, game.current_player, start_time, reason="timeout"
+        )
     
     if x is not None and y is not None:
         # 记录当前玩家编号，用于后续通知
         current_player = game.current_player
         
-        game.make_move(x, y)
-        game.last_move = (x, y, reasoning, elapsed_time)
-        game.current_thinking = reasoning
+        if not game.play(x, y):
+            return False
+        game.set_reasoning(reasoning)
+        game.last_move = (x, y, game.move_reasonings[-1], elapsed_time)
+        game.current_thinking = game.move_reasonings[-1]
         
         # 记录AI的思考过程到moves日志，只记录reason字段
         if reasoning:
             game.moves_logger.info(f"Reason: {reasoning}")
         
-        # 将思考过程添加到聊天历史
-        chat_data = {
-            "type": "chat",
-            "player": current_player,  # 使用当前玩家的编号
-            "message": f"{reasoning}"
+        # 将思考过程添加到聊天历史（与 apply_event 一致，没有思考过程时不记录）
+        chat_entries = []
+        if reasoning is not None:
+            chat_entries.append(game.add_chat(current_player, f"{reasoning}"))
+        event = {
+            "kind": "move", "x": x, "y": y, "player": current_player,
+            "reasoning": reasoning, "elapsed": elapsed_time
         }
-        game.chat_history.append(chat_data)
+        await games.record(game_id, event)
         
-        # 通知所有连接的客户端移动完成
-        move_message = {
-            "type": "move_complete",
-            "board": game.get_board_state(),
-            "current_player": game.get_current_player(),
-            "last_move": game.last_move,
-            "thinking": game.current_thinking,
-            "chat_history": game.chat_history,
-            "moves_history": game.moves_history
-        }
-        await broadcast_message(game_id, move_message)
+        # 通知所有连接的客户端移动完成（只发送本手的增量）
+        move_message = build_move_delta(game, x, y, current_player, chat_entries, elapsed_time)
+        await broadcast_message(game_id, move_message, event)
+        if game.game_over:
+            await broadcast_message(game_id, build_game_over(game))
+            return False
         
-        # 如果下一个玩家也是AI，则自动触发AI移动
+        # 如果下一个玩家也是AI，则由调度器继续下一回合
         next_ai = game.black_ai if game.current_player == 1 else game.white_ai
-        if next_ai:
-            await asyncio.sleep(1)  # 添加短暂延迟，使界面更新更自然
-            await ai_move(game_id)
+        return next_ai is not None
+    return False
+
+# 多 worker 之间的消息总线（GO_PUBSUB）和AI回合租约（GO_LEASES）
+bus = create_pubsub()
+leases = create_lease_manager(owner=bus.worker_id)
+
+# AI回合调度器：每局一个回合循环（持有该局租约），并限制同时进行的LLM调用数
+scheduler = TurnScheduler.from_env(ai_move, leases)
+
+async def trigger_ai(game_id: str):
+    """触发该局的AI回合（重复触发会被去重）"""
+    scheduler.trigger(game_id)
 
 @app.post("/make_move")
 async def make_move(move: MoveRequest, background_tasks: BackgroundTasks):
     """
     在指定位置落子
     """
-    if not move.game_id or move.game_id not in games:
+    game = await games.get(move.game_id) if move.game_id else None
+    if not game:
         raise HTTPException(status_code=404, detail="游戏不存在")
-
-    game = games[move.game_id]
     
     # 处理特殊的AI触发请求
     if move.x == -1 and move.y == -1:
-        background_tasks.add_task(ai_move, game.game_id)
+        background_tasks.add_task(trigger_ai, game.game_id)
         return {
             "game_id": game.game_id,
             "board": game.get_board_state(),
@@ -236,39 +563,37 @@ async def make_move(move: MoveRequest, background_tasks: BackgroundTasks):
             "last_move": game.last_move
         }
     
-    if not game.make_move(move.x, move.y):
-        raise HTTPException(status_code=400, detail="无效的移动")
+    player = game.current_player
+    x, y = PASS_MOVE if move.pass_turn else (move.x, move.y)
+    if not game.play(x, y):
+        raise HTTPException(status_code=400, detail="游戏已结束" if game.game_over else "无效的移动")
+    event = {"kind": "move", "x": x, "y": y, "player": player, "reasoning": None}
+    await games.record(game.game_id, event)
 
-    # 通知所有连接的客户端移动完成
-    move_message = {
-        "type": "move_complete",
-        "board": game.get_board_state(),
-        "current_player": game.get_current_player(),
-        "last_move": game.last_move,
-        "thinking": game.current_thinking,
-        "chat_history": game.chat_history,
-        "moves_history": game.moves_history
-    }
-    background_tasks.add_task(broadcast_message, game.game_id, move_message)
+    # 通知所有连接的客户端移动完成（只发送本手的增量）
+    move_message = build_move_delta(game, x, y, player)
+    background_tasks.add_task(broadcast_message, game.game_id, move_message, event)
+    if game.game_over:
+        background_tasks.add_task(broadcast_message, game.game_id, build_game_over(game))
 
     # 如果下一个玩家是AI，自动触发AI移动
     next_ai = game.black_ai if game.current_player == 1 else game.white_ai
-    if next_ai:
-        background_tasks.add_task(ai_move, game.game_id)
+    if next_ai and not game.game_over:
+        background_tasks.add_task(trigger_ai, game.game_id)
 
     response_data = {
         "game_id": game.game_id,
         "board": game.get_board_state(),
         "current_player": game.get_current_player(),
-        "message": f"移动成功: ({move.x}, {move.y})",
-        "status": "success",
-        "last_move": game.last_move
+        "message": "停一手" if move.pass_turn else f"移动成功: ({move.x}, {move.y})",
+        "status": "finished" if game.game_over else "success",
+        "last_move": game.last_move,
+        "result": game.result
     }
 
     # 根据请求的格式返回不同形式的响应
     if move.expected_format == "text":
-        board_str = "\n".join([" ".join(map(str, row)) for row in game.get_board_state()])
-        return f"Game ID: {game.game_id}\nBoard State:\n{board_str}\nCurrent Player: {game.get_current_player()}"
+        return f"Game ID: {game.game_id}\nBoard State:\n{game.board.to_text()}\nCurrent Player: {game.get_current_player()}"
     
     return GameResponse(**response_data)
 
@@ -277,27 +602,258 @@ async def get_game_state(game_id: str):
     """
     获取当前游戏状态
     """
-    if game_id not in games:
+    game = await games.get(game_id)
+    if not game:
         raise HTTPException(status_code=404, detail="游戏不存在")
     
-    game = games[game_id]
     return {
         "game_id": game_id,
         "board": game.get_board_state(),
-        "current_player": game.get_current_player()
+        "current_player": game.get_current_player(),
+        "result": game.result
     }
 
-# 存储WebSocket连接，包含玩家身份信息
-websocket_connections: Dict[str, Dict[WebSocket, int]] = {}  # {game_id: {websocket: player_number}}
+class SnapshotBatchRequest(BaseModel):
+    game_ids: List[str]
+    versions: Dict[str, int] = {}  # 客户端已有的版本，版本未变化的游戏不再返回
 
-async def broadcast_message(game_id: str, message: dict):
-    """广播消息给指定游戏的所有连接的客户端"""
-    if game_id in websocket_connections:
-        for conn in websocket_connections[game_id].keys():
-            try:
-                await conn.send_json(message)
-            except:
-                logger.error(f"发送消息到WebSocket失败")
+def snapshot_response(body: bytes, request: Request, etag: str) -> Response:
+    """带 ETag 的快照响应，按 Accept-Encoding 压缩"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body, encoding = compress(body, request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/games/{game_id}/snapshot")
+async def get_snapshot(game_id: str, request: Request):
+    """
+    获取一局的紧凑快照（棋盘每点2位打包），支持 If-None-Match 条件请求
+    """
+    game = await games.get(game_id)
+    if not game:
+        raise HTTPException(status_code=404, detail="游戏不存在")
+    return snapshot_response(snapshot_cache.fragment(game), request, game_etag(game))
+
+async def batch_snapshot_response(game_ids: List[str], versions: Dict[str, int], request: Request) -> Response:
+    """
+    批量快照：只返回版本与客户端不同的游戏，所有游戏都没有变化时返回 304
+
+    内存中的游戏直接取片段；其余游戏只读取存储中的事件得到版本，使用冷缓存中的片段，
+    不加载进内存，避免看板轮询挤掉正在进行的对局
+    """
+    if len(game_ids) > SNAPSHOT_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"一次最多请求 {SNAPSHOT_BATCH_LIMIT} 局")
+    live = {game_id: games.peek(game_id) for game_id in game_ids}
+    cold_ids = [game_id for game_id, game in live.items() if game is None]
+    records = dict(zip(cold_ids, await asyncio.gather(*(game_store.load(game_id) for game_id in cold_ids))))
+    current: Dict[str, Optional[int]] = {}
+    for game_id, game in live.items():
+        if game is not None:
+            current[game_id] = game.seq
+        elif records[game_id] is not None:
+            current[game_id] = stored_version(records[game_id][1])
+        else:
+            current[game_id] = None
+    etag = batch_etag((game_id, current[game_id], versions.get(game_id)) for game_id in game_ids)
+    fragments, missing = [], []
+    for game_id in game_ids:
+        version = current[game_id]
+        if version is None:
+            missing.append(game_id)
+        elif versions.get(game_id) != version:
+            game = live[game_id]
+            if game is not None:
+                fragments.append(snapshot_cache.fragment(game))
+            else:
+                config, events = records[game_id]
+                fragments.append(snapshot_cache.cold_fragment(
+                    game_id, version, lambda: cold_snapshot(game_id, config, events)
+                ))
+    return snapshot_response(join_fragments(fragments, missing), request, etag)
+
+@app.get("/snapshots")
+async def get_snapshots(ids: str, request: Request):
+    """
+    批量获取紧凑快照，ids 为逗号分隔的游戏ID
+    """
+    return await batch_snapshot_response([i for i in ids.split(",") if i], {}, request)
+
+@app.post("/snapshots")
+async def post_snapshots(batch: SnapshotBatchRequest, request: Request):
+    """
+    批量获取紧凑快照（游戏较多、URL过长时使用），可附带客户端已有的各局版本
+    """
+    return await batch_snapshot_response(batch.game_ids, batch.versions, request)
+
+@app.get("/games/{game_id}/sgf")
+async def export_sgf(game_id: str):
+    """
+    以SGF格式导出棋谱（思考过程写在每手的注释中）
+    """
+    game = await games.get(game_id)
+    if not game:
+        raise HTTPException(status_code=404, detail="游戏不存在")
+    return PlainTextResponse(to_sgf(game.to_record()), media_type="application/x-go-sgf")
+
+def snapshot_for(game_id: str, player_number: int) -> Optional[dict]:
+    """生成指定连接的完整快照，用于落后连接的降级"""
+    game = games.peek(game_id)
+    return build_snapshot(game, player_number) if game else None
+
+# 存储WebSocket连接（包含玩家身份信息）并负责消息扇出
+broadcaster = Broadcaster.from_env(snapshot_for)
+
+def has_audience(game_id: str) -> bool:
+    """本 worker 或其他 worker 上是否可能有该局的观众"""
+    return broadcaster.has_connections(game_id) or bus.has_peers
+
+async def broadcast_message(game_id: str, message: dict, event: Optional[dict] = None):
+    """
+    广播消息给指定游戏的所有连接的客户端：先扇出给本 worker 的连接，
+    再通过总线发给其他 worker（event 为对应的存储事件，供其他 worker 同步游戏副本）
+    """
+    if not has_audience(game_id):
+        return
+    text = serialize(message)
+    await broadcaster.publish_text(game_id, text)
+    if bus.has_peers:
+        await bus.publish(game_id, text, event)
+
+async def on_bus_message(game_id: str, text: str, event: Optional[dict]):
+    """处理其他 worker 发来的消息：同步内存中的游戏副本，并扇出给本 worker 的连接"""
+    game = games.peek(game_id)
+    if game is not None:
+        seq = json.loads(text).get("seq")
+        if seq is not None:
+            if seq != game.seq + 1:
+                # 漏掉了变化（例如副本加载时对方的事件尚未落盘），下次访问时重新加载
+                logger.info(f"游戏 {game_id}: 副本序号 {game.seq} 与总线消息 {seq} 不连续，丢弃副本")
+                games.discard(game_id)
+            else:
+                if event is not None:
+                    game.apply_event(event)
+                    if game.passes >= 2 and not game.game_over:
+                        game.finish(log=False)  # 终局日志由驱动该局的 worker 记录
+                game.seq = seq
+    await broadcaster.publish_text(game_id, text)
+
+ACTIVE_GAMES.set_function(lambda: len(games))
+WEBSOCKET_CONNECTIONS.set_function(broadcaster.connection_count)
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus 格式的运行指标：落子各阶段耗时、活跃游戏/连接/进行中的AI请求数和兜底落子数
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/debug/http_pool")
+async def get_http_pool_stats():
+    """
+    获取各模型接口的连接池统计
+    """
+    return session_registry.stats()
+
+@app.get("/debug/scheduler")
+async def get_scheduler_stats():
+    """
+    获取AI回合调度的排队和并发统计
+    """
+    return scheduler.stats()
+
+@app.get("/debug/pubsub")
+async def get_pubsub_stats():
+    """
+    获取多 worker 消息总线的发布、接收和连接状态
+    """
+    return bus.stats()
+
+@app.get("/debug/broadcaster")
+async def get_broadcaster_stats():
+    """
+    获取WebSocket扇出统计
+    """
+    return broadcaster.stats()
+
+@app.get("/debug/snapshots")
+async def get_snapshot_stats():
+    """
+    获取快照片段缓存的命中情况
+    """
+    return snapshot_cache.stats()
+
+@app.get("/debug/batching")
+async def get_batching_stats():
+    """
+    获取合并请求的批次数、平均装填率和增加的排队时间
+    """
+    return batch_registry.stats()
+
+@app.get("/debug/mcts")
+async def get_mcts_stats():
+    """
+    获取本地 MCTS 棋手的搜索次数、平均模拟次数和每秒模拟数
+    """
+    return mcts_engine.stats()
+
+@app.get("/debug/response_cache")
+async def get_response_cache_stats():
+    """
+    获取落子缓存的命中率和节省的模型调用时间
+    """
+    return response_cache.stats()
+
+@app.get("/debug/resilience")
+async def get_resilience_stats():
+    """
+    获取各模型接口的请求、重试、对冲、纠正次数和熔断状态
+    """
+    return resilient_caller.stats()
+
+@app.get("/debug/opening_book")
+async def get_opening_book_stats():
+    """
+    获取定式库的条目数、收录手数和命中次数
+    """
+    return opening_book.stats()
+
+@app.get("/debug/logging")
+async def get_logging_stats():
+    """
+    获取日志队列的积压和丢弃数
+    """
+    return logging_stats()
+
+@app.get("/debug/games")
+async def get_games_stats():
+    """
+    获取活跃游戏、懒加载/回收次数和存储落盘统计
+    """
+    return games.stats()
+
+@app.get("/debug/memory")
+async def get_memory_stats(limit: int = 20):
+    """
+    获取进程内存、内存中的游戏数和占用最多的几局游戏的估算内存（字节）
+    """
+    footprints = []
+    for game_id, game in list(games.items()):
+        parts = game.memory_footprint()
+        footprints.append({"game_id": game_id, "total": sum(parts.values()),
+                           "finished": game.game_over, "moves": len(game.moves_history), **parts})
+    footprints.sort(key=lambda item: item["total"], reverse=True)
+    total = sum(item["total"] for item in footprints)
+    return {
+        "rss": process_rss(),
+        "live_games": len(footprints),
+        "games_total": total,
+        "games_average": total // len(footprints) if footprints else 0,
+        "largest": footprints[:limit],
+        "registry": games.stats(),
+    }
 
 @app.get("/")
 async def root():
@@ -308,51 +864,55 @@ async def websocket_endpoint(websocket: WebSocket, game_id: str):
     await websocket.accept()
     logger.info(f"新的WebSocket连接: 游戏 {game_id}")
     
-    if game_id not in websocket_connections:
-        websocket_connections[game_id] = {}
-    
     # 分配玩家编号（1为黑棋，2为白棋）
-    player_number = 1 if len(websocket_connections[game_id]) == 0 else 2
-    websocket_connections[game_id][websocket] = player_number
+    player_number = 1 if broadcaster.connection_count(game_id) == 0 else 2
     
-    # 发送初始化数据给新连接的玩家
-    game = games.get(game_id)
-    if game:
-        init_data = {
-            "type": "init",
-            "player_number": player_number,
-            "board": game.get_board_state(),
-            "current_player": game.get_current_player(),
-            "moves_history": game.moves_history,
-            "chat_history": game.chat_history,
-            "last_move": game.last_move
-        }
-        await websocket.send_json(init_data)
+    # 注册连接，并把初始化数据（完整快照）作为第一条消息发送给新连接的玩家
+    game = await games.get(game_id)
+    broadcaster.add(
+        game_id, websocket, player_number,
+        initial=build_snapshot(game, player_number) if game else None
+    )
     
     try:
         while True:
             data = await websocket.receive_json()
             if data["type"] == "chat":
-                player_number = websocket_connections[game_id][websocket]
+                player_number = broadcaster.player_number(game_id, websocket)
                 message = {
                     "type": "chat",
                     "player": player_number,
                     "message": data["message"]
                 }
                 # 保存聊天记录
-                game = games.get(game_id)
+                game = await games.get(game_id)
                 if game:
-                    game.chat_history.append(message)
+                    message = game.add_chat(player_number, data["message"])
                     logger.info(f"游戏 {game_id}: 新的聊天消息 - {message}")
-                
+                    event = {"kind": "chat", "player": player_number, "message": data["message"]}
+                    await games.record(game_id, event)
+                    message = build_chat_delta(game, message)
+                else:
+                    event = None
+
                 # 广播消息给所有连接的客户端
-                await broadcast_message(game_id, message)
+                await broadcast_message(game_id, message, event)
+            elif data["type"] == "resync":
+                # 客户端发现序号断档，重新发送完整快照
+                game = await games.get(game_id)
+                if game:
+                    player_number = broadcaster.player_number(game_id, websocket)
+                    await broadcaster.send(game_id, websocket, build_snapshot(game, player_number))
     except Exception as e:
         logger.error(f"WebSocket错误: {str(e)}")
-        if websocket in websocket_connections[game_id]:
-            del websocket_connections[game_id][websocket]
-        if not websocket_connections[game_id]:
-            del websocket_connections[game_id]
+        broadcaster.remove(game_id, websocket)
+        if not broadcaster.has_connections(game_id):
+            # 所有观众都离开后，超过宽限期仍无人重连则视为放弃，取消AI回合
+            scheduler.cancel_later(
+                game_id,
+                ABANDON_GRACE_SECONDS,
+                lambda: not broadcaster.has_connections(game_id)
+            )
 
 if __name__ == "__main__":
     import uvicorn
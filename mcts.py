@@ -0,0 +1,503 @@
+"""本地蒙特卡洛树搜索（MCTS）棋手
+
+供压测和低成本的陪练对局使用，完全在本地运行，不调用模型接口。
+
+- PlayoutBoard：为随机模拟专门设计的紧凑棋盘。带一圈边界的扁平列表，棋串用
+  循环链表串起，气用伪气维护（气数、气位置之和、气位置平方和），落子和提子都是
+  增量更新；当 气数 * 平方和 == 和 * 和 时所有伪气都是同一个点，即被叫吃。
+  模拟中不下自己的真眼，不检查全局同形，双方都无子可下时按数子法判断胜负
+- 搜索为 UCT：根节点只展开本地评估策略给出的候选点，更深的节点展开所有合法点
+- 每一手的预算为模拟次数和/或时间（先到为准）。搜索在进程池中执行，不阻塞事件
+  循环；workers > 1 时使用根并行：多个进程用不同的随机种子独立搜索同一局面，
+  合并根节点各着手的访问次数后选访问最多的一手
+- 统计每次搜索的模拟次数和每秒模拟数，通过 /debug/mcts 和 /metrics 查看
+
+子进程中只运行 PlayoutBoard 和 search()（纯计算，不记日志、不持有锁），因此支持时
+用 fork 启动进程池：spawn 会在每个子进程中重新导入入口脚本，以 python main.py 启动
+时会重复设置日志和存储。
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import registry
+
+logger = logging.getLogger('go_game')
+
+MCTS_PLAYOUTS = registry.counter("go_mcts_playouts_total", "MCTS 随机模拟次数")
+MCTS_SEARCH_SECONDS = registry.counter("go_mcts_search_seconds_total", "MCTS 搜索耗时（秒，墙钟时间）")
+
+EMPTY, BLACK, WHITE, BORDER = 0, 1, 2, 3
+PASS = -1
+
+# 根节点每个着手的统计：{着手下标(y * size + x，停一手为 -1): (访问次数, 胜局数)}
+RootStats = Dict[int, Tuple[int, int]]
+
+
+class PlayoutBoard:
+    """带边界的紧凑棋盘，只支持随机模拟需要的操作"""
+
+    __slots__ = ("size", "stride", "color", "head", "next_stone", "chain_size",
+                 "libs", "lib_sum", "lib_sq", "empty", "empty_pos", "ko", "to_move", "passes",
+                 "offsets", "diagonals")
+
+    def __init__(self, size: int):
+        stride = size + 2
+        n = stride * stride
+        self.size = size
+        self.stride = stride
+        self.color = [BORDER] * n
+        self.head = list(range(n))  # 棋子所在棋串的代表点
+        self.next_stone = list(range(n))  # 棋串内的循环链表
+        self.chain_size = [0] * n
+        self.libs = [0] * n  # 以下三项只对代表点有效
+        self.lib_sum = [0] * n
+        self.lib_sq = [0] * n
+        self.empty: List[int] = []
+        self.empty_pos = [-1] * n  # 空点在 empty 中的位置，便于 O(1) 删除
+        for y in range(size):
+            for x in range(size):
+                p = (y + 1) * stride + x + 1
+                self.color[p] = EMPTY
+                self.empty_pos[p] = len(self.empty)
+                self.empty.append(p)
+        self.ko = -1
+        self.to_move = BLACK
+        self.passes = 0
+        self.offsets = (1, -1, stride, -stride)
+        self.diagonals = (stride + 1, stride - 1, -stride + 1, -stride - 1)
+
+    @classmethod
+    def from_cells(cls, size: int, cells: bytes, to_move: int, ko: int = -1) -> "PlayoutBoard":
+        """由规则引擎的扁平棋盘（idx = y * size + x）构造，ko 为劫争禁着点下标"""
+        board = cls(size)
+        board.to_move = to_move
+        for idx, c in enumerate(cells):
+            if c:
+                board._place(board.point(idx % size, idx // size), c)
+        board.ko = board.point(ko % size, ko // size) if ko >= 0 else -1
+        return board
+
+    def copy(self) -> "PlayoutBoard":
+        other = PlayoutBoard.__new__(PlayoutBoard)
+        other.size = self.size
+        other.stride = self.stride
+        other.color = self.color[:]
+        other.head = self.head[:]
+        other.next_stone = self.next_stone[:]
+        other.chain_size = self.chain_size[:]
+        other.libs = self.libs[:]
+        other.lib_sum = self.lib_sum[:]
+        other.lib_sq = self.lib_sq[:]
+        other.empty = self.empty[:]
+        other.empty_pos = self.empty_pos[:]
+        other.ko = self.ko
+        other.to_move = self.to_move
+        other.passes = self.passes
+        other.offsets = self.offsets
+        other.diagonals = self.diagonals
+        return other
+
+    def point(self, x: int, y: int) -> int:
+        return (y + 1) * self.stride + x + 1
+
+    def index(self, p: int) -> int:
+        """带边界的点转换为规则引擎的下标"""
+        y, x = divmod(p, self.stride)
+        return (y - 1) * self.size + x - 1
+
+    def _in_atari(self, h: int) -> bool:
+        libs = self.libs[h]
+        return libs * self.lib_sq[h] == self.lib_sum[h] * self.lib_sum[h]
+
+    def is_legal(self, p: int, c: int) -> bool:
+        """空点上的落子是否合法（劫、自杀），不检查全局同形"""
+        if p == self.ko:
+            return False
+        color = self.color
+        for d in self.offsets:
+            if color[p + d] == EMPTY:
+                return True
+        head = self.head
+        for d in self.offsets:
+            q = p + d
+            cq = color[q]
+            if cq == c:
+                if not self._in_atari(head[q]):
+                    return True
+            elif cq != BORDER and self._in_atari(head[q]):
+                return True
+        return False
+
+    def is_eye(self, p: int, c: int) -> bool:
+        """p 是否为 c 方的真眼（四周都是己方或边界，斜角的对方棋子不足以破眼）"""
+        color = self.color
+        for d in self.offsets:
+            cq = color[p + d]
+            if cq != c and cq != BORDER:
+                return False
+        opponent = 3 - c
+        bad = 0
+        edge = False
+        for d in self.diagonals:
+            cq = color[p + d]
+            if cq == opponent:
+                bad += 1
+            elif cq == BORDER:
+                edge = True
+        return bad == 0 if edge else bad < 2
+
+    def play(self, p: int):
+        """当前行棋方在 p 落子（PASS 为停一手），调用方保证合法"""
+        if p == PASS:
+            self.ko = -1
+            self.passes += 1
+        else:
+            self._place(p, self.to_move)
+            self.passes = 0
+        self.to_move = 3 - self.to_move
+
+    def _place(self, p: int, c: int):
+        color = self.color
+        head = self.head
+        libs = self.libs
+        lib_sum = self.lib_sum
+        lib_sq = self.lib_sq
+        offsets = self.offsets
+        color[p] = c
+        # 从空点列表中删除（与末尾交换）
+        i = self.empty_pos[p]
+        last = self.empty.pop()
+        if last != p:
+            self.empty[i] = last
+            self.empty_pos[last] = i
+        self.empty_pos[p] = -1
+        head[p] = p
+        self.next_stone[p] = p
+        self.chain_size[p] = 1
+        n = s = sq = 0
+        for d in offsets:
+            q = p + d
+            cq = color[q]
+            if cq == EMPTY:
+                n += 1
+                s += q
+                sq += q * q
+            elif cq != BORDER:
+                h = head[q]
+                libs[h] -= 1
+                lib_sum[h] -= p
+                lib_sq[h] -= p * p
+        libs[p] = n
+        lib_sum[p] = s
+        lib_sq[p] = sq
+        opponent = 3 - c
+        captured = 0
+        captured_point = -1
+        for d in offsets:
+            q = p + d
+            cq = color[q]
+            if cq == c:
+                h, hp = head[q], head[p]
+                if h != hp:
+                    self._merge(hp, h)
+            elif cq == opponent and libs[head[q]] == 0:
+                captured += self._remove(head[q])
+                captured_point = q
+        hp = head[p]
+        if captured == 1 and self.chain_size[hp] == 1 and libs[hp] == 1:
+            self.ko = captured_point
+        else:
+            self.ko = -1
+
+    def _merge(self, a: int, b: int):
+        """合并两个棋串，较小的棋串并入较大的"""
+        chain_size = self.chain_size
+        if chain_size[a] < chain_size[b]:
+            a, b = b, a
+        head = self.head
+        next_stone = self.next_stone
+        s = b
+        while True:
+            head[s] = a
+            s = next_stone[s]
+            if s == b:
+                break
+        next_stone[a], next_stone[b] = next_stone[b], next_stone[a]
+        chain_size[a] += chain_size[b]
+        self.libs[a] += self.libs[b]
+        self.lib_sum[a] += self.lib_sum[b]
+        self.lib_sq[a] += self.lib_sq[b]
+
+    def _remove(self, h: int) -> int:
+        """提掉整个棋串，返回提子数"""
+        color = self.color
+        head = self.head
+        next_stone = self.next_stone
+        empty = self.empty
+        empty_pos = self.empty_pos
+        stones = []
+        s = h
+        while True:
+            stones.append(s)
+            color[s] = EMPTY
+            empty_pos[s] = len(empty)
+            empty.append(s)
+            s = next_stone[s]
+            if s == h:
+                break
+        libs = self.libs
+        lib_sum = self.lib_sum
+        lib_sq = self.lib_sq
+        for s in stones:
+            for d in self.offsets:
+                cq = color[s + d]
+                if cq == BLACK or cq == WHITE:
+                    hq = head[s + d]
+                    libs[hq] += 1
+                    lib_sum[hq] += s
+                    lib_sq[hq] += s * s
+        return len(stones)
+
+    def candidate_moves(self, c: int) -> List[int]:
+        """c 方所有合法且不填己方真眼的点"""
+        return [p for p in self.empty if self.is_legal(p, c) and not self.is_eye(p, c)]
+
+    def random_move(self, rng: random.Random) -> int:
+        """随机选一个合法且不填己方真眼的点，没有时返回 PASS"""
+        empty = self.empty
+        n = len(empty)
+        if not n:
+            return PASS
+        c = self.to_move
+        start = int(rng.random() * n)
+        for i in range(start, n):
+            p = empty[i]
+            if not self.is_eye(p, c) and self.is_legal(p, c):
+                return p
+        for i in range(start):
+            p = empty[i]
+            if not self.is_eye(p, c) and self.is_legal(p, c):
+                return p
+        return PASS
+
+    def playout(self, rng: random.Random, max_moves: int):
+        """从当前局面随机下到双方都停一手（或达到手数上限）"""
+        moves = 0
+        while self.passes < 2 and moves < max_moves:
+            self.play(self.random_move(rng))
+            moves += 1
+
+    def score(self, komi: float) -> float:
+        """数子法：棋子数加只与一方相邻的空点，黑减白再减贴目"""
+        color = self.color
+        counts = [0, 0, 0, 0]
+        for p in range(self.stride + 1, len(color) - self.stride - 1):
+            c = color[p]
+            if c == EMPTY:
+                owner = 0
+                for d in self.offsets:
+                    cq = color[p + d]
+                    if cq != BORDER:
+                        owner |= cq
+                if owner == BLACK or owner == WHITE:
+                    counts[owner] += 1
+            else:
+                counts[c] += 1
+        return counts[BLACK] - counts[WHITE] - komi
+
+
+class _Node:
+    __slots__ = ("move", "player", "parent", "children", "untried", "visits", "wins")
+
+    def __init__(self, move: int, player: int, parent: Optional["_Node"]):
+        self.move = move
+        self.player = player  # 走出这一手的一方
+        self.parent = parent
+        self.children: List["_Node"] = []
+        self.untried: Optional[List[int]] = None
+        self.visits = 0
+        self.wins = 0
+
+
+def search(size: int, cells: bytes, to_move: int, ko: int, komi: float,
+           root_moves: Sequence[int], playouts: int, time_budget: float,
+           exploration: float = 0.7, seed: Optional[int] = None) -> dict:
+    """
+    在一个进程中做一次 UCT 搜索（进程池中执行的函数）
+
+    root_moves 为根节点考虑的着手（规则引擎下标），playouts 和 time_budget（秒，
+    0 表示不限）中先达到的为准。返回根节点统计、模拟次数和耗时
+    """
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    root_board = PlayoutBoard.from_cells(size, cells, to_move, ko)
+    player = root_board.to_move
+    root = _Node(PASS, 3 - player, None)
+    root.untried = [root_board.point(idx % size, idx // size) for idx in root_moves]
+    max_moves = size * size * 3
+    done = 0
+    deadline = start + time_budget if time_budget > 0 else None
+    log = math.log
+    sqrt = math.sqrt
+    while done < playouts:
+        if deadline is not None and done % 16 == 0 and time.perf_counter() >= deadline:
+            break
+        board = root_board.copy()
+        node = root
+        # 选择：所有着手都已展开的节点按 UCT 选子节点
+        while not node.untried and node.children:
+            scale = exploration * sqrt(log(node.visits))
+            best, best_value = None, -1.0
+            for child in node.children:
+                value = child.wins / child.visits + scale / sqrt(child.visits)
+                if value > best_value:
+                    best, best_value = child, value
+            node = best
+            board.play(node.move)
+        # 展开一个未尝试的着手
+        if node.untried is None:
+            node.untried = board.candidate_moves(board.to_move) if board.passes < 2 else []
+        if node.untried:
+            untried = node.untried
+            i = int(rng.random() * len(untried))
+            untried[i], untried[-1] = untried[-1], untried[i]
+            move = untried.pop()
+            child = _Node(move, board.to_move, node)
+            node.children.append(child)
+            node = child
+            board.play(move)
+        # 模拟并回传结果
+        board.playout(rng, max_moves)
+        winner = BLACK if board.score(komi) > 0 else WHITE
+        while node is not None:
+            node.visits += 1
+            if node.player == winner:
+                node.wins += 1
+            node = node.parent
+        done += 1
+    stats: RootStats = {
+        root_board.index(child.move): (child.visits, child.wins) for child in root.children
+    }
+    return {"root": stats, "playouts": done, "seconds": time.perf_counter() - start}
+
+
+@dataclass
+class MCTSConfig:
+    """MCTS 棋手的配置"""
+    playouts: int = 2000  # 每手的模拟次数上限（根并行时为所有进程之和）
+    time_budget: float = 2.0  # 每手的时间上限（秒），0 表示只按模拟次数
+    workers: int = 1  # 每手使用的进程数（根并行）
+    pool_size: int = 0  # 进程池大小，0 表示 CPU 核数
+    candidates: int = 24  # 根节点考虑的候选点数
+    exploration: float = 0.7  # UCT 探索系数
+
+    @classmethod
+    def from_env(cls) -> "MCTSConfig":
+        """从 GO_MCTS_* 环境变量读取配置"""
+        return cls(
+            playouts=int(os.getenv("GO_MCTS_PLAYOUTS", 2000)),
+            time_budget=float(os.getenv("GO_MCTS_TIME_MS", 2000)) / 1000,
+            workers=int(os.getenv("GO_MCTS_WORKERS", 1)),
+            pool_size=int(os.getenv("GO_MCTS_POOL_SIZE", 0)),
+            candidates=int(os.getenv("GO_MCTS_CANDIDATES", 24)),
+            exploration=float(os.getenv("GO_MCTS_EXPLORATION", 0.7)),
+        )
+
+
+@dataclass
+class SearchResult:
+    """一次（合并后的）搜索结果，moves 按访问次数从多到少排列"""
+    moves: List[Tuple[int, int, int, int]]  # (x, y, 访问次数, 胜局数)
+    playouts: int
+    seconds: float  # 墙钟时间
+    workers: int
+
+    @property
+    def playouts_per_second(self) -> float:
+        return self.playouts / self.seconds if self.seconds > 0 else 0.0
+
+
+class MCTSEngine:
+    """管理搜索进程池并汇总统计"""
+
+    def __init__(self, config: Optional[MCTSConfig] = None):
+        self.config = config or MCTSConfig()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.searches = 0
+        self.playouts = 0
+        self.seconds = 0.0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            size = self.config.pool_size or os.cpu_count() or 1
+            method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context(method))
+            logger.info(f"MCTS 进程池已启动，{size} 个进程")
+        return self._pool
+
+    async def search(self, size: int, cells: bytes, to_move: int, ko: int, komi: float,
+                     root_moves: Sequence[int], seed: Optional[int] = None) -> SearchResult:
+        """在进程池中搜索，workers > 1 时各进程平分模拟次数并合并根节点统计"""
+        config = self.config
+        workers = max(1, config.workers)
+        per_worker = max(1, config.playouts // workers)
+        base_seed = seed if seed is not None else random.getrandbits(32)
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(
+                pool, search, size, cells, to_move, ko, komi, list(root_moves),
+                per_worker, config.time_budget, config.exploration, base_seed + i
+            )
+            for i in range(workers)
+        ))
+        seconds = time.perf_counter() - start
+        merged: Dict[int, List[int]] = {}
+        playouts = 0
+        for result in results:
+            playouts += result["playouts"]
+            for idx, (visits, wins) in result["root"].items():
+                entry = merged.setdefault(idx, [0, 0])
+                entry[0] += visits
+                entry[1] += wins
+        moves = sorted(
+            ((idx % size, idx // size, visits, wins) for idx, (visits, wins) in merged.items()),
+            key=lambda move: move[2], reverse=True
+        )
+        self.searches += 1
+        self.playouts += playouts
+        self.seconds += seconds
+        MCTS_PLAYOUTS.inc(playouts)
+        MCTS_SEARCH_SECONDS.inc(seconds)
+        return SearchResult(moves, playouts, seconds, workers)
+
+    def stats(self) -> dict:
+        return {
+            "playouts_budget": self.config.playouts,
+            "time_budget": self.config.time_budget,
+            "workers": self.config.workers,
+            "pool_size": self.config.pool_size or os.cpu_count(),
+            "pool_started": self._pool is not None,
+            "searches": self.searches,
+            "playouts": self.playouts,
+            "avg_playouts": round(self.playouts / self.searches, 1) if self.searches else 0,
+            "playouts_per_second": round(self.playouts / self.seconds, 1) if self.seconds else 0,
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# 全局共享的 MCTS 引擎（进程池在第一次搜索时启动）
+mcts_engine = MCTSEngine(MCTSConfig.from_env())
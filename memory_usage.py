@@ -0,0 +1,47 @@
+"""内存占用估算
+
+供 /debug/memory 报告每局游戏的大致内存占用。只递归统计内置容器
+（dict/list/tuple/set/deque）及其中的值，不深入其他对象，因此各局共享的表
+（相邻点表、Zobrist 表、指标等）不会被重复计入；调用方负责列出需要统计的部分。
+"""
+import os
+import sys
+from collections import deque
+from typing import Optional, Set
+
+_SEQUENCES = (list, tuple, set, frozenset, deque)
+
+
+def deep_sizeof(obj, seen: Optional[Set[int]] = None) -> int:
+    """obj 及其包含的内置容器和值占用的字节数，seen 用于在多次调用之间去重"""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, _SEQUENCES):
+            stack.extend(item)
+    return total
+
+
+def process_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节），无法读取时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # Linux 以 KB 为单位，macOS 以字节为单位；这里是峰值而不是当前值
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
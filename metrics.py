@@ -0,0 +1,261 @@
+"""Prometheus 文本格式的运行指标
+
+不依赖 prometheus_client，只实现本项目需要的计数器、仪表和直方图：
+
+- 直方图按标签组合预先绑定（labels() 返回的子指标可以缓存在调用方），
+  热路径上的一次 observe 只是一次二分查找加两次加法，没有锁和字典查找
+- 仪表可以绑定回调函数，在抓取时才读取当前值（如活跃游戏数），热路径零开销
+- render() 生成 /metrics 接口返回的文本（text/plain; version=0.0.4）
+
+单线程事件循环中使用，不做线程同步。
+"""
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # 响应时会自动补上 charset=utf-8
+
+# 落子各阶段耗时的分桶（秒）：覆盖从微秒级的解析到分钟级的模型调用
+PHASE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5,
+                 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """带标签的指标族"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """按标签值取子指标（不存在时创建），调用方可以缓存返回值"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in self._children.items()]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "fn")
+
+    def __init__(self):
+        self.value = 0.0
+        self.fn: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, fn: Callable[[], float]):
+        """抓取时调用 fn() 读取当前值"""
+        self.fn = fn
+
+    def get(self) -> float:
+        return self.fn() if self.fn is not None else self.value
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set_function(self, fn: Callable[[], float]):
+        self.labels().set_function(fn)
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for key, child in self._children.items():
+            try:
+                value = child.get()
+            except Exception:
+                continue
+            samples.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return samples
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> "_Timer":
+        """with metric.time(): ... 记录代码块耗时"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    """累计分桶直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = PHASE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._le_values = [_format_value(bound) for bound in self.buckets + (math.inf,)]
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for key, child in self._children.items():
+            # 各分桶只有 le 不同，标签前缀只格式化一次
+            prefix = _format_labels(self.labelnames, key, "le=")[:-1]
+            bucket = f"{self.name}_bucket{prefix}"
+            cumulative = 0
+            for le, count in zip(self._le_values, child.counts):
+                cumulative += count
+                samples.append(f'{bucket}"{le}"}} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            samples.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            samples.append(f"{self.name}_count{labels} {child.count}")
+        return samples
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = PHASE_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表和本项目使用的指标
+registry = MetricsRegistry()
+
+# 落子各阶段耗时：prompt（构建提示词）、connect（等待/建立连接）、ttfb（模型首字节，
+# 流式为首个token）、llm（单次模型请求总耗时）、parse（解析回复）、validate（规则校验）
+MOVE_PHASE_SECONDS = registry.histogram(
+    "go_move_phase_seconds", "AI落子各阶段耗时（秒）", ("phase", "model"))
+BROADCAST_SECONDS = registry.histogram(
+    "go_broadcast_fanout_seconds", "一条消息序列化并放入所有连接发送队列的耗时（秒）")
+AI_MOVES = registry.counter(
+    "go_ai_moves_total", "AI落子数（source: llm/cache/book/mcts/fallback）", ("model", "source"))
+FALLBACK_MOVES = registry.counter(
+    "go_fallback_moves_total", "使用本地策略兜底的落子数（reason: error/timeout）", ("model", "reason"))
+AI_CALLS_IN_FLIGHT = registry.gauge(
+    "go_ai_calls_in_flight", "进行中的AI落子请求数", ("model",))
+ACTIVE_GAMES = registry.gauge("go_active_games", "内存中的游戏数")
+WEBSOCKET_CONNECTIONS = registry.gauge("go_websocket_connections", "WebSocket连接数")
@@ -0,0 +1,281 @@
+"""开局定式库
+
+从二进制棋谱库（见 game_record.py）离线统计前 N 手每个局面下各着手的出现次数和
+胜局数，对局时前 N 手直接从库中取一手，不必调用模型。
+
+- 局面在 8 种棋盘对称（旋转、翻转）下规范化：对 8 种变换分别计算 Zobrist 哈希，
+  取最小值作为局面键（再区分行棋方），着手也变换到同一规范坐标系中统计，
+  因此四个角上的同一个定式会合并计数
+- 库文件按列存储：头部 | 局面键 u64[n] | 局数 u32[n] | 胜局 u32[n] | 着手 u16[n]，
+  按 (局面键, 着手) 排序；读取时 mmap 整个文件，对局面键列二分查找，查询为微秒级
+- 着手编码为 y * size + x，0x7FFF 表示停一手（库中不收录停一手）
+
+用法:
+    python opening_book.py build book.gob games1.gor games2.gor --plies 20 --min-games 2
+    python opening_book.py query book.gob
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from board_geometry import get_geometry
+from go_board import BOARD_SIZE, PASS_MOVE, WHITE, GoBoard, get_zobrist_table
+from game_record import GameArchive, _to_array, _to_bytes
+
+logger = logging.getLogger('go_game')
+
+BOOK_MAGIC = b"GOB1"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sBBHI4x")  # magic | 版本 | 棋盘大小 | 收录手数 | 条目数，补齐到16字节
+# 白方行棋时与局面键异或的常量，使同一局面黑白行棋方的键不同
+_WHITE_TO_MOVE = 0x9E37_79B9_7F4A_7C15
+
+_SYMMETRIC_ZOBRIST: Dict[int, np.ndarray] = {}
+
+
+def _symmetric_zobrist(size: int) -> np.ndarray:
+    """按棋盘大小缓存 zobrist[t, color, idx]：第 t 种对称变换后位置的 Zobrist 值"""
+    cached = _SYMMETRIC_ZOBRIST.get(size)
+    if cached is None:
+        perms = get_geometry(size).symmetries
+        table = np.array(get_zobrist_table(size), dtype=np.uint64).T  # (3, n)
+        cached = table[:, perms].transpose(1, 0, 2).copy()  # (8, 3, n)
+        _SYMMETRIC_ZOBRIST[size] = cached
+    return cached
+
+
+def canonical_key(board: GoBoard, color: int) -> Tuple[int, np.ndarray]:
+    """局面在 8 种对称下的规范键，以及变换到规范局面的所有变换编号"""
+    zobrist = _symmetric_zobrist(board.size)
+    cells = board.array.ravel()
+    stones = np.flatnonzero(cells)
+    if stones.size:
+        hashes = np.bitwise_xor.reduce(zobrist[:, cells[stones], stones], axis=1)
+    else:
+        hashes = np.zeros(8, dtype=np.uint64)
+    key = hashes.min()
+    transforms = np.flatnonzero(hashes == key)
+    key = int(key)
+    if color == WHITE:
+        key ^= _WHITE_TO_MOVE
+    return key, transforms
+
+
+def canonical_move(size: int, transforms: np.ndarray, x: int, y: int) -> int:
+    """把实际着手变换到规范坐标系（局面自身对称时取编号最小的等价着手）"""
+    perms = get_geometry(size).symmetries
+    return int(perms[transforms, y * size + x].min())
+
+
+@dataclass
+class BookMove:
+    """定式库中的一个候选着手（已变换回实际坐标）"""
+    x: int
+    y: int
+    games: int
+    wins: int
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+
+def build_book(archives: Iterable[str], path: str, max_plies: int = 20, min_games: int = 2,
+               size: int = BOARD_SIZE) -> int:
+    """从棋谱库统计前 max_plies 手并写入定式库文件，返回条目数"""
+    stats: Dict[Tuple[int, int], List[int]] = {}
+    games = 0
+    for archive_path in archives:
+        with GameArchive(archive_path) as archive:
+            for view in archive:
+                if view.size != size:
+                    continue
+                games += 1
+                board = GoBoard(size)
+                for ply, (x, y, color) in enumerate(view.moves(max_plies)):
+                    if (x, y) == PASS_MOVE:
+                        break
+                    # 含让子、摆子等无法从空棋盘重放的棋谱，只统计到第一手非法着手之前
+                    if not board.is_legal(x, y, color):
+                        logger.warning(f"{archive_path}: 第 {games} 局第 {ply + 1} 手 ({x}, {y}) 无法重放，跳过其余着手")
+                        break
+                    key, transforms = canonical_key(board, color)
+                    entry = stats.setdefault((key, canonical_move(size, transforms, x, y)), [0, 0])
+                    entry[0] += 1
+                    if view.winner == color:
+                        entry[1] += 1
+                    board.play(x, y, color)
+
+    items = sorted((k, v) for k, v in stats.items() if v[0] >= min_games)
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(BOOK_MAGIC, VERSION, size, max_plies, len(items)))
+        f.write(_to_bytes(array("Q", (key for (key, _), _ in items))))
+        f.write(_to_bytes(array("I", (counts[0] for _, counts in items))))
+        f.write(_to_bytes(array("I", (counts[1] for _, counts in items))))
+        f.write(_to_bytes(array("H", (move for (_, move), _ in items))))
+    logger.info(f"定式库已写入 {path}: {games} 局, {len(items)} 个条目")
+    return len(items)
+
+
+class OpeningBook:
+    """只读的开局定式库，未加载库文件时 enabled 为 False"""
+
+    def __init__(self, path: Optional[str] = None, max_plies: Optional[int] = None,
+                 min_games: int = 1):
+        """
+        max_plies 为使用定式库的最大手数（不超过建库时收录的手数），
+        min_games 为候选着手至少出现的局数
+        """
+        self.path = path
+        self.min_games = min_games
+        self.size = BOARD_SIZE
+        self.max_plies = 0
+        self.lookups = 0
+        self.hits = 0
+        self._keys = self._games = self._wins = self._moves = ()
+        self._file = self._mmap = None
+        if path:
+            self._load(path)
+            if max_plies is not None:
+                self.max_plies = min(self.max_plies, max_plies)
+
+    @classmethod
+    def from_env(cls) -> "OpeningBook":
+        """从 GO_OPENING_BOOK_* 环境变量读取配置，文件不存在时返回未启用的空库"""
+        path = os.getenv("GO_OPENING_BOOK_PATH")
+        plies = os.getenv("GO_OPENING_BOOK_PLIES")
+        min_games = int(os.getenv("GO_OPENING_BOOK_MIN_GAMES", 1))
+        if path and not os.path.exists(path):
+            logger.warning(f"定式库文件不存在: {path}")
+            path = None
+        return cls(path, int(plies) if plies else None, min_games)
+
+    def _load(self, path: str):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        magic, version, self.size, self.max_plies, count = _HEADER.unpack_from(buf)
+        if magic != BOOK_MAGIC:
+            raise ValueError(f"不是有效的定式库: {path}")
+        offset = _HEADER.size
+        columns = []
+        for typecode, width in (("Q", 8), ("I", 4), ("I", 4), ("H", 2)):
+            raw = buf[offset:offset + width * count]
+            # 小端平台上直接把 mmap 当作数组使用，不复制
+            columns.append(raw.cast(typecode) if sys.byteorder == "little" else _to_array(typecode, raw))
+            offset += width * count
+        self._keys, self._games, self._wins, self._moves = columns
+        logger.info(f"已加载定式库 {path}: {count} 个条目, 前 {self.max_plies} 手")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(len(self._keys)) and self.max_plies > 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def lookup(self, board: GoBoard, color: int) -> List[BookMove]:
+        """当前局面下库中的合法着手（实际坐标），按出现局数从多到少排列"""
+        if board.size != self.size or not len(self._keys):
+            return []
+        key, transforms = canonical_key(board, color)
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key, lo)
+        if lo == hi:
+            return []
+        back = board.geometry.inverse_symmetries[transforms[0]]
+        size = self.size
+        result = []
+        for i in range(lo, hi):
+            games = self._games[i]
+            if games < self.min_games:
+                continue
+            idx = int(back[self._moves[i]])
+            x, y = idx % size, idx // size
+            if board.is_legal(x, y, color):
+                result.append(BookMove(x, y, games, self._wins[i]))
+        result.sort(key=lambda move: move.games, reverse=True)
+        return result
+
+    def choose(self, board: GoBoard, color: int, ply: int,
+               rng: Optional[random.Random] = None) -> Optional[BookMove]:
+        """第 ply 手（从0开始）在库中时按出现局数加权随机选一手，否则返回 None"""
+        if ply >= self.max_plies:
+            return None
+        self.lookups += 1
+        moves = self.lookup(board, color)
+        if not moves:
+            return None
+        self.hits += 1
+        return (rng or random).choices(moves, weights=[move.games for move in moves])[0]
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "entries": len(self),
+            "max_plies": self.max_plies,
+            "lookups": self.lookups,
+            "hits": self.hits,
+        }
+
+    def close(self):
+        self._keys = self._games = self._wins = self._moves = ()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._file.close()
+            self._mmap = self._file = None
+
+
+# 全局共享的定式库（通过 GO_OPENING_BOOK_PATH 指定库文件）
+opening_book = OpeningBook.from_env()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="开局定式库工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="从棋谱库建立定式库")
+    build.add_argument("book")
+    build.add_argument("archives", nargs="+")
+    build.add_argument("--plies", type=int, default=20, help="收录前多少手")
+    build.add_argument("--min-games", type=int, default=2, help="着手至少出现的局数")
+    build.add_argument("--size", type=int, default=BOARD_SIZE, help="棋盘大小")
+    query = sub.add_parser("query", help="列出空棋盘（或给定着手之后）的库中着手")
+    query.add_argument("book")
+    query.add_argument("moves", nargs="*", help="已下的着手，如 3,3 15,15")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_book(args.archives, args.book, args.plies, args.min_games, args.size)
+        print(f"已写入 {count} 个条目: {args.book}")
+        return
+
+    book = OpeningBook(args.book)
+    board = GoBoard(book.size)
+    color = 1
+    for move in args.moves:
+        x, y = (int(v) for v in move.split(","))
+        board.play(x, y, color)
+        color = 3 - color
+    moves = [{"x": m.x, "y": m.y, "games": m.games, "win_rate": round(m.win_rate, 3)}
+             for m in book.lookup(board, color)]
+    print(json.dumps(moves, ensure_ascii=False, indent=2))
+    book.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""增量提示词构建
+
+缓存提示词各部分的渲染结果：棋盘文本缓存在棋盘上（每手重新渲染一次，
+双方棋手和合并请求共用），历史记录只渲染新增的着手，并只保留最近的一段窗口（更早的着手压缩成一行摘要）。
+构建时按模型的token预算裁剪历史和对话，并记录提示词字节数和估算的token数。
+"""
+import hashlib
+import logging
+import re
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from go_board import PASS_MOVE, GoBoard
+from memory_usage import deep_sizeof
+
+logger = logging.getLogger('go_game')
+
+ATTACK_TEMPLATE = """我是一名围棋战术家，我的棋风以凌厉攻势著称，现在需要撕开对手防线。
+
+{board}
+
+此刻轮到我执{color}发起致命打击。
+
+{history}
+{candidates}
+{chat}
+
+我将执行：
+1. 闪电战局扫描 - 5秒内定位敌方最薄弱环节
+2. 死亡交叉分析 - 找出可同时威胁两个弱点的穿刺点
+3. 窒息战术选择 - 优先考虑能持续压缩对手生存空间的落点
+
+必须满足以下战争准则：
+1. 落子必须产生至少两个后续杀招威胁
+2. 优先阻断敌方大龙连接通道
+3. 当存在劫争可能时，主动制造战争迷雾
+4. 不能在已经存在棋子的地方落子
+5. 若已无有意义的落点（只剩填自己眼位的点），输出 "move": "pass" 停一手，双方连续停一手即终局数子
+
+立即输出作战方案：
+{{
+"move": [x,y], // 落子位置坐标
+"reasoning": "...", // 简明扼要的斩首战术说明（使用军事术语，如"钳形攻势/纵深突破"）
+"pressure_index": 0-100 // 计算该落子对敌方造成的心理压迫值
+}}
+
+血腥法则：
+
+1. 禁止任何防御性布阵
+2. 若存在同价值目标，选择使对手最痛苦的落点
+3. 当棋盘有血迹（吃子痕迹）时，必须持续扩大战果
+"""
+
+MASTER_TEMPLATE = """我是一位围棋大师，让我仔细思考下一步棋该如何落子。
+
+{board}
+
+现在轮到我下{color}棋了。
+
+{history}
+{candidates}
+{chat}
+
+我需要：
+1. 仔细评估当前局势
+2. 分析对手的意图和动向
+3. 制定整体战略部署
+
+我会以JSON格式表达我的思考结果：
+{{
+    "move": [x, y],     // x,y为0-18的整数，表示我决定落子的坐标
+    "reasoning": "..."  // 我为什么选择这个位置（以第一人称表述，如"我选择这里是因为..."）
+}}
+
+注意事项：
+- 确保我选择的位置是空位
+- 认真思考对手之前的对话（如果有）
+- 如果我认为对局已经结束，可以输出 "move": "pass" 停一手，双方连续停一手即终局数子
+- 清晰地解释我的战术分析
+"""
+
+# 多盘棋合并为一次请求时使用的模板（见 batching.py），每盘棋的局面由 build_position 渲染
+BATCH_TEMPLATE = """我正在同时下 {count} 盘围棋，下面是每盘棋的当前局面，我需要分别为每盘棋选择下一手。
+
+{positions}
+每盘棋独立判断，并遵守以下规则：
+1. 落子必须是该盘棋盘上标记为 · 的空位，x,y 为 0-18 的整数
+2. 若某盘棋已无有意义的落点（只剩填自己眼位的点），该盘输出 "move": "pass" 停一手
+
+只输出一个JSON对象，moves 中每盘棋一项，id 必须与局面编号一致：
+{{
+"moves": [
+    {{"id": "局面编号", "move": [x, y], "reasoning": "..."}}  // reasoning 以第一人称简要说明选择理由
+]
+}}
+"""
+
+PROMPT_TEMPLATES = {
+    "attack": ATTACK_TEMPLATE,
+    "master": MASTER_TEMPLATE,
+}
+
+# 各模型类型默认的提示词token预算
+DEFAULT_TOKEN_BUDGETS = {
+    "deepseek": 6000,
+    "openai": 6000,
+    "compatible": 6000,
+}
+
+_CJK_PATTERN = re.compile(r'[⺀-鿿＀-￯]')
+_STONE_SYMBOLS = {0: "·", 1: "●", 2: "○"}
+_BOARD_HEADERS: Dict[int, str] = {}
+
+
+def render_board_text(board: GoBoard) -> str:
+    """棋盘的提示词文本，通过 board.cached_render 按局面缓存"""
+    size = board.size
+    header = _BOARD_HEADERS.get(size)
+    if header is None:
+        header = _BOARD_HEADERS[size] = "当前棋盘状态：\n\n   " + " ".join(f"{i:2d}" for i in range(size)) + "\n"
+    symbols = board.cells.decode("latin-1").translate(_STONE_SYMBOLS)
+    rows = [f"{row:2d} " + " ".join(symbols[row * size:(row + 1) * size]) + "\n" for row in range(size)]
+    return header + "".join(rows)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符约1个token，其余字符约4个一个token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def template_id(template: str) -> str:
+    """模板内容的短哈希，模板修改后自动变化，可作为缓存键的一部分"""
+    return hashlib.sha1(template.encode('utf-8')).hexdigest()[:12]
+
+
+class PromptBuilder:
+    """为一名AI棋手增量构建提示词"""
+
+    def __init__(self, template: str = "attack", token_budget: int = 6000,
+                 history_window: int = 40, chat_window: int = 5, chat_max_chars: int = 200):
+        self.template_name = template
+        self.template = PROMPT_TEMPLATES[template]
+        self.template_id = template_id(self.template)
+        self.token_budget = token_budget
+        self.history_window = history_window  # 历史记录最多保留的最近着手数
+        self.chat_window = chat_window  # 最多保留的最近对话条数
+        self.chat_max_chars = chat_max_chars  # 每条对话最多保留的字符数
+        self._move_lines: List[str] = []
+        self.last_prompt_bytes = 0
+        self.last_prompt_tokens = 0
+
+    def memory_footprint(self) -> int:
+        """估算缓存的历史记录行占用的内存（字节）"""
+        return deep_sizeof(self._move_lines)
+
+    def _render_board(self, board: GoBoard) -> str:
+        return board.cached_render("prompt", render_board_text)
+
+    def _render_history(self, moves_history: List[Tuple[int, int, int]], window: int) -> str:
+        """渲染最近 window 手的历史，更早的着手压缩为摘要"""
+        if not moves_history:
+            return "暂无历史移动"
+        lines = self._move_lines
+        if len(lines) > len(moves_history):
+            # 历史被重置（例如新开局或重新加载），重新渲染
+            lines.clear()
+        for x, y, player in moves_history[len(lines):]:
+            color = "黑棋" if player == 1 else "白棋"
+            if (x, y) == PASS_MOVE:
+                lines.append(f"- {color}：停一手\n")
+            else:
+                lines.append(f"- {color}：({x}, {y})\n")
+
+        formatted = "历史移动记录：\n"
+        omitted = len(lines) - window
+        if omitted > 0:
+            black = sum(1 for _, _, player in moves_history[:omitted] if player == 1)
+            formatted += f"（前{omitted}手已省略：黑棋{black}手，白棋{omitted - black}手）\n"
+            formatted += "".join(lines[omitted:])
+        else:
+            formatted += "".join(lines)
+        return formatted
+
+    def _render_chat(self, chat_history: Optional[List[Dict]]) -> str:
+        """渲染最近几条对话，过长的内容会被截断"""
+        if not chat_history or not self.chat_window:
+            return ""
+        formatted = "\n最近对话记录：\n"
+        # chat_history 可以是列表或有界的 deque
+        for msg in islice(chat_history, max(0, len(chat_history) - self.chat_window), None):
+            player = "黑方" if msg["player"] == 1 else "白方"
+            text = msg['message']
+            if len(text) > self.chat_max_chars:
+                text = text[:self.chat_max_chars] + "…"
+            formatted += f"- {player}：{text}\n"
+        return formatted
+
+    def _render_candidates(self, candidates: Optional[List[Tuple[int, int]]]) -> str:
+        """渲染本地评估给出的候选落点"""
+        if not candidates:
+            return ""
+        points = "、".join(f"({x}, {y})" for x, y in candidates)
+        return f"本地快速评估的候选落点（仅供参考，可以选择其他位置）：{points}\n"
+
+    def build_position(self, position_id: str, board: GoBoard, current_player: int,
+                       moves_history: List[Tuple[int, int, int]],
+                       candidates: Optional[List[Tuple[int, int]]] = None, history_window: int = 10) -> str:
+        """只渲染一盘棋的局面（棋盘、最近几手和候选点），用于多盘棋合并的批量提示词"""
+        color = '黑' if current_player == 1 else '白'
+        return (
+            f"=== 局面 {position_id}：轮到我下{color}棋 ===\n"
+            f"{self._render_board(board)}\n"
+            f"{self._render_history(moves_history, history_window)}\n"
+            f"{self._render_candidates(candidates)}\n"
+        )
+
+    def build(self, board: GoBoard, current_player: int, moves_history: List[Tuple[int, int, int]],
+              chat_history: Optional[List[Dict]] = None,
+              candidates: Optional[List[Tuple[int, int]]] = None) -> str:
+        """构建提示词，超出token预算时依次缩短历史窗口、去掉对话记录"""
+        board_text = self._render_board(board)
+        candidates_text = self._render_candidates(candidates)
+        color = '黑' if current_player == 1 else '白'
+        window = self.history_window
+        chat_text = self._render_chat(chat_history)
+        while True:
+            prompt = self.template.format(
+                board=board_text,
+                color=color,
+                history=self._render_history(moves_history, window),
+                candidates=candidates_text,
+                chat=chat_text
+            )
+            tokens = estimate_tokens(prompt)
+            if tokens <= self.token_budget:
+                break
+            if window > 0:
+                window //= 2
+            elif chat_text:
+                chat_text = ""
+            else:
+                logger.warning(f"提示词估算 {tokens} token，超出预算 {self.token_budget}")
+                break
+
+        self.last_prompt_bytes = len(prompt.encode('utf-8'))
+        self.last_prompt_tokens = tokens
+        return prompt
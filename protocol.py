@@ -0,0 +1,70 @@
+"""WebSocket 增量协议
+
+每条改变游戏状态的消息（落子、聊天）都带有递增的序号 seq，只包含本次变化：
+落下的棋子、被提的棋子和新增的聊天记录，因此每手棋的消息大小与对局长度无关。
+客户端发现序号不连续时发送 {"type": "resync"}，服务端回复一条完整快照（init 消息）。
+"""
+from typing import Dict, List, Optional
+
+PROTOCOL_VERSION = 2
+
+
+def build_snapshot(game, player_number: Optional[int] = None) -> Dict:
+    """完整快照，用于初次连接和断档重同步"""
+    return {
+        "type": "init",
+        "v": PROTOCOL_VERSION,
+        "seq": game.seq,
+        "player_number": player_number,
+        "board": game.get_board_state(),
+        "current_player": game.get_current_player(),
+        "moves_history": game.moves_history,
+        "chat_history": list(game.chat_history),
+        "last_move": game.last_move,
+        "result": game.result
+    }
+
+
+def build_move_delta(game, x: int, y: int, player: int, chat_entries: List[Dict] = None,
+                     elapsed: Optional[float] = None) -> Dict:
+    """
+    一手棋的增量消息：落子（停一手时坐标为 -1）、提子和新增聊天记录
+
+    AI落子的思考过程只在聊天记录中发送一次，elapsed 为其思考耗时（人类落子为 None），
+    客户端据此还原 last_move
+    """
+    return {
+        "type": "move_complete",
+        "v": PROTOCOL_VERSION,
+        "seq": game.next_seq(),
+        "move": [x, y, player],
+        "captured": [[cx, cy] for cx, cy in game.last_captured],
+        "current_player": game.get_current_player(),
+        "elapsed": elapsed,
+        "chat": chat_entries or []
+    }
+
+
+def build_game_over(game) -> Dict:
+    """终局消息：双方连续停一手后的计分结果"""
+    return {
+        "type": "game_over",
+        "v": PROTOCOL_VERSION,
+        "seq": game.next_seq(),
+        "result": game.result
+    }
+
+
+def build_chat_delta(game, chat_entry: Dict) -> Dict:
+    """聊天消息，和落子共用同一个序号空间"""
+    return dict(chat_entry, v=PROTOCOL_VERSION, seq=game.next_seq())
+
+
+def build_thinking_start(game) -> Dict:
+    """AI开始思考的通知（不改变状态，不占用序号）"""
+    return {
+        "type": "thinking_start",
+        "v": PROTOCOL_VERSION,
+        "player": game.current_player,
+        "current_player": game.get_current_player()
+    }
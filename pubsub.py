@@ -0,0 +1,290 @@
+"""多 worker 之间的发布订阅总线
+
+每个 worker 只持有连接到自己的 WebSocket。某个 worker 上产生的消息先直接扇出给
+本地连接，再通过总线发给其他 worker，由它们扇出给各自的本地连接，因此观众可以
+连接到任意一个 worker。总线消息同时携带对应的存储事件（落子、聊天），其他 worker
+据此更新内存中的游戏副本。
+
+- LocalPubSub：进程内实现。同一个 hub 上的多个实例互相投递，单 worker 部署时
+  没有其他实例，发布即为空操作；也可以在一个进程里模拟多个 worker
+- UnixSocketPubSub：本机多进程实现，不依赖外部服务。拿到旁路锁文件（套接字
+  路径加 .lock）上 flock 排他锁的 worker 在 Unix 套接字上运行一个简单的中转
+  （broker），并在中转运行期间一直持有该锁；所有 worker（包括它自己）作为客户端
+  连接，中转把每条消息转发给除发送者以外的客户端。只有持锁者才会删除或绑定套接字
+  文件。运行中转的 worker 退出后锁由系统释放，其他 worker 自动重连，并由其中一个
+  拿到锁后接替中转
+
+总线消息为一行 JSON：{"o": 来源 worker, "g": game_id, "t": 已序列化的消息, "e": 事件}，
+消息文本只在发布方序列化一次，接收方直接转发给 WebSocket。
+"""
+import asyncio
+import json
+import logging
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # fcntl 仅在 POSIX 系统上可用，UnixSocketPubSub 依赖它
+    fcntl = None
+
+logger = logging.getLogger('go_game')
+
+# handler(game_id, text, event) 处理其他 worker 发来的消息
+Handler = Callable[[str, str, Optional[dict]], Awaitable[None]]
+
+
+class PubSub(ABC):
+    """发布订阅总线接口"""
+
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handler: Optional[Handler] = None
+        self.published = 0
+        self.received = 0
+        self.dropped = 0  # 总线不可用时未能发出的消息数
+
+    async def start(self, handler: Handler):
+        """开始接收其他 worker 的消息"""
+        self._handler = handler
+
+    @abstractmethod
+    async def publish(self, game_id: str, text: str, event: Optional[dict] = None):
+        """把已序列化的消息（以及对应的存储事件）发给其他 worker"""
+
+    @property
+    def has_peers(self) -> bool:
+        """是否可能有其他 worker 接收消息（没有时发布方可以省去序列化）"""
+        return False
+
+    async def _deliver(self, game_id: str, text: str, event: Optional[dict]):
+        self.received += 1
+        if self._handler is None:
+            return
+        try:
+            await self._handler(game_id, text, event)
+        except Exception as e:
+            logger.error(f"处理总线消息失败: {str(e)}")
+
+    async def close(self):
+        self._handler = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "worker_id": self.worker_id,
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+        }
+
+
+_default_hub: List["LocalPubSub"] = []
+
+
+class LocalPubSub(PubSub):
+    """进程内总线：投递给同一个 hub 上的其他实例"""
+
+    def __init__(self, hub: Optional[List["LocalPubSub"]] = None):
+        super().__init__()
+        self.hub = _default_hub if hub is None else hub
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        if self not in self.hub:
+            self.hub.append(self)
+
+    @property
+    def has_peers(self) -> bool:
+        return len(self.hub) > 1
+
+    async def publish(self, game_id: str, text: str, event: Optional[dict] = None):
+        self.published += 1
+        for peer in list(self.hub):
+            if peer is not self:
+                await peer._deliver(game_id, text, event)
+
+    async def close(self):
+        if self in self.hub:
+            self.hub.remove(self)
+        await super().close()
+
+
+class UnixSocketPubSub(PubSub):
+    """基于 Unix 套接字中转的本机多进程总线"""
+
+    def __init__(self, path: str, reconnect_delay: float = 0.5, max_buffer: int = 4 * 1024 * 1024):
+        if fcntl is None:
+            raise RuntimeError("Unix 套接字消息总线需要 POSIX 系统（fcntl）")
+        super().__init__()
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._lock_fd: Optional[int] = None  # 持有中转锁时为锁文件的描述符
+        self.reconnect_delay = reconnect_delay
+        self.max_buffer = max_buffer  # 中转给单个客户端的积压超过该字节数时断开它
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning(f"暂时无法连接消息总线 {self.path}，将在后台重试")
+
+    @property
+    def has_peers(self) -> bool:
+        return self._writer is not None
+
+    @property
+    def is_broker(self) -> bool:
+        return self._server is not None
+
+    def _acquire_broker_lock(self) -> bool:
+        """非阻塞地获取中转锁，已被其他 worker 持有时返回 False"""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _release_broker_lock(self):
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _start_broker(self) -> bool:
+        """尝试成为中转，中转锁已被其他 worker 持有时返回 False"""
+        if not self._acquire_broker_lock():
+            return False
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)  # 上一个中转异常退出留下的套接字文件
+            self._server = await asyncio.start_unix_server(
+                self._serve_client, self.path, limit=self.max_buffer
+            )
+        except OSError as e:
+            self._release_broker_lock()
+            logger.warning(f"启动消息总线中转失败: {str(e)}")
+            return False
+        logger.info(f"消息总线中转已在 {self.path} 启动（worker {self.worker_id}）")
+        return True
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """中转：把一个客户端发来的每一行转发给其他客户端"""
+        self._clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                for client in list(self._clients):
+                    if client is writer:
+                        continue
+                    if client.transport.get_write_buffer_size() > self.max_buffer:
+                        logger.warning("消息总线客户端积压过多，断开连接")
+                        self._clients.discard(client)
+                        client.close()
+                        continue
+                    client.write(line)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError: 单行超过 max_buffer
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _run(self):
+        """保持与中转的连接并读取消息，断开后重连（必要时接替中转）"""
+        while True:
+            try:
+                if not self.is_broker:
+                    await self._start_broker()
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=self.max_buffer)
+            except (FileNotFoundError, ConnectionRefusedError, OSError) as e:
+                logger.warning(f"连接消息总线失败: {str(e)}")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            self._writer = writer
+            self._connected.set()
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    data = json.loads(line)
+                    if data["o"] != self.worker_id:
+                        await self._deliver(data["g"], data["t"], data.get("e"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"消息总线连接中断: {str(e)}")
+            finally:
+                self._connected.clear()
+                self._writer = None
+                writer.close()
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def publish(self, game_id: str, text: str, event: Optional[dict] = None):
+        writer = self._writer
+        if writer is None:
+            self.dropped += 1
+            return
+        line = json.dumps({"o": self.worker_id, "g": game_id, "t": text, "e": event},
+                          ensure_ascii=False, separators=(',', ':'))
+        writer.write(line.encode('utf-8') + b"\n")
+        self.published += 1
+        await writer.drain()
+
+    async def close(self):
+        await super().close()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            for client in list(self._clients):
+                client.close()
+            self._clients.clear()
+            self._server = None
+            # 仍持有中转锁，删除的一定是自己绑定的套接字文件
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self._release_broker_lock()
+
+    def stats(self) -> dict:
+        data = super().stats()
+        data.update({
+            "path": self.path,
+            "connected": self._connected.is_set(),
+            "broker": self.is_broker,
+            "broker_clients": len(self._clients),
+            "reconnects": self.reconnects,
+        })
+        return data
+
+
+def create_pubsub(spec: str = None) -> PubSub:
+    """
+    按配置创建总线，spec 默认取环境变量 GO_PUBSUB：
+    "local"（默认，单 worker）或 "unix:/path/to/go_game.sock"
+    """
+    spec = spec or os.getenv("GO_PUBSUB", "local")
+    kind, _, path = spec.partition(":")
+    if kind == "unix":
+        return UnixSocketPubSub(path or "/tmp/go_game_pubsub.sock")
+    return LocalPubSub()
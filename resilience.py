@@ -0,0 +1,315 @@
+"""模型接口的容错层
+
+- 每次请求单独超时
+- 有上限的重试，重试前按指数退避加随机抖动等待
+- 模型给出无效落子（越界、已有棋子、禁着）或无法解析的回复时，附带纠正说明重新提问
+- 可选的对冲请求：主接口超过历史延迟的某个百分位仍未返回时，向备用接口再发一次，取先成功的结果
+- 按 api_url 的熔断器：连续失败达到阈值后短路一段时间，期间直接使用备用接口或本地兜底
+
+每个接口的请求、重试、对冲、纠正次数和熔断状态可通过 stats() 导出。
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+logger = logging.getLogger('go_game')
+
+T = TypeVar("T")
+
+
+class ModelResponseError(Exception):
+    """模型的回复可以纠正（格式错误或无效落子），重试时附带纠正说明"""
+
+    def __init__(self, message: str, correction: str):
+        super().__init__(message)
+        self.correction = correction  # 追加到提示词末尾的纠正说明
+
+
+class InvalidMoveError(ModelResponseError):
+    """模型给出的落子越界、已有棋子或为禁着点"""
+
+    def __init__(self, x, y, reason: str):
+        super().__init__(
+            f"AI返回的移动无效: ({x}, {y}) {reason}",
+            f"注意：我上一次选择的 ({x}, {y}) 无效（{reason}）。"
+            f"这一次必须从棋盘上标记为 · 的空位中选择，并严格按要求的JSON格式回复。"
+        )
+        self.x = x
+        self.y = y
+        self.reason = reason
+
+
+class CircuitOpenError(Exception):
+    """接口处于熔断状态，本次没有发出请求"""
+
+
+@dataclass
+class RetryPolicy:
+    """重试、超时和对冲的配置"""
+    attempt_timeout: float = 90.0  # 单次请求超时（秒）
+    max_attempts: int = 3  # 每手最多请求次数（含第一次）
+    backoff_base: float = 0.5  # 退避基数（秒）
+    backoff_max: float = 8.0  # 单次退避上限（秒）
+    hedge_percentile: float = 95.0  # 超过该百分位延迟后发出对冲请求，0 表示不对冲
+    hedge_min_samples: int = 20  # 延迟样本不足时不对冲
+    breaker_failures: int = 5  # 连续失败多少次后熔断
+    breaker_reset: float = 30.0  # 熔断多久后放行一次试探请求（秒）
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """从 GO_AI_* / GO_BREAKER_* 环境变量读取配置"""
+        return cls(
+            attempt_timeout=float(os.getenv("GO_AI_ATTEMPT_TIMEOUT", 90.0)),
+            max_attempts=max(1, int(os.getenv("GO_AI_MAX_ATTEMPTS", 3))),  # 至少请求一次
+            backoff_base=float(os.getenv("GO_AI_BACKOFF_BASE", 0.5)),
+            backoff_max=float(os.getenv("GO_AI_BACKOFF_MAX", 8.0)),
+            hedge_percentile=float(os.getenv("GO_AI_HEDGE_PERCENTILE", 95.0)),
+            hedge_min_samples=int(os.getenv("GO_AI_HEDGE_MIN_SAMPLES", 20)),
+            breaker_failures=int(os.getenv("GO_BREAKER_FAILURES", 5)),
+            breaker_reset=float(os.getenv("GO_BREAKER_RESET", 30.0)),
+        )
+
+    def backoff(self, retry: int) -> float:
+        """第 retry 次重试前的等待时间（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+
+
+class CircuitBreaker:
+    """单个接口的熔断器：closed -> open -> half_open -> closed/open"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0  # 连续失败次数
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """是否放行本次请求，半开状态只放行一个试探请求"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def available(self) -> bool:
+        """只判断是否可能放行，不占用半开状态的试探名额"""
+        return self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._probe_in_flight)
+
+    def release(self):
+        """请求被取消，既不算成功也不算失败，归还试探名额"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        self._state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.opened_count += 1
+            self._state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class EndpointHealth:
+    """单个接口的延迟样本、熔断器和计数"""
+
+    def __init__(self, policy: RetryPolicy, window: int = 200):
+        self.breaker = CircuitBreaker(policy.breaker_failures, policy.breaker_reset)
+        self.latencies: Deque[float] = deque(maxlen=window)  # 最近成功请求的延迟
+        self.attempts = 0
+        self.retries = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.corrections = 0  # 带纠正说明的重新提问次数
+        self.rejected = 0  # 因熔断没有发出的请求
+        self.hedges = 0  # 作为主接口时发出的对冲请求
+        self.hedge_wins = 0  # 作为对冲接口时先于主接口返回
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def to_dict(self) -> dict:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "opened": self.breaker.opened_count,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "corrections": self.corrections,
+            "rejected": self.rejected,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class ResilientCaller:
+    """按接口维护健康状态，执行带超时、重试、对冲和熔断的模型调用"""
+
+    def __init__(self, policy: Optional[RetryPolicy] = None):
+        self.policy = policy or RetryPolicy()
+        self._endpoints: Dict[str, EndpointHealth] = {}
+
+    def health(self, api_url: str) -> EndpointHealth:
+        health = self._endpoints.get(api_url)
+        if health is None:
+            health = self._endpoints[api_url] = EndpointHealth(self.policy)
+        return health
+
+    async def _attempt(self, api_url: str, make_call: Callable[[], Awaitable[T]]) -> T:
+        """对单个接口发出一次请求并记录结果"""
+        health = self.health(api_url)
+        if not health.breaker.allow():
+            health.rejected += 1
+            raise CircuitOpenError(f"接口处于熔断状态: {api_url}")
+        health.attempts += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(make_call(), timeout=self.policy.attempt_timeout)
+        except asyncio.TimeoutError:
+            health.timeouts += 1
+            health.failures += 1
+            health.breaker.record_failure()
+            raise
+        except ModelResponseError:
+            # 接口本身是正常的，只是回复内容不可用
+            health.breaker.record_success()
+            health.failures += 1
+            raise
+        except asyncio.CancelledError:
+            # 对冲请求中输掉的一方被取消，不计入成败
+            health.breaker.release()
+            raise
+        except Exception:
+            health.failures += 1
+            health.breaker.record_failure()
+            raise
+        health.latencies.append(time.perf_counter() - start)
+        health.successes += 1
+        health.breaker.record_success()
+        return result
+
+    def _hedge_delay(self, api_url: str) -> Optional[float]:
+        """主接口延迟超过该值后发出对冲请求，样本不足或未启用时返回 None"""
+        if not self.policy.hedge_percentile:
+            return None
+        health = self.health(api_url)
+        if len(health.latencies) < self.policy.hedge_min_samples:
+            return None
+        return health.percentile(self.policy.hedge_percentile)
+
+    async def _hedged(self, primary_url: str, primary: Callable[[], Awaitable[T]],
+                      hedge_url: Optional[str], hedge: Optional[Callable[[], Awaitable[T]]]) -> T:
+        """主请求超过百分位延迟仍未返回时向备用接口发出对冲请求，取先成功的结果"""
+        primary_task = asyncio.ensure_future(self._attempt(primary_url, primary))
+        delay = self._hedge_delay(primary_url) if hedge is not None else None
+        if delay is None or not self.health(hedge_url).breaker.available():
+            return await primary_task
+
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        if done:
+            return primary_task.result()
+        self.health(primary_url).hedges += 1
+        logger.info(f"主接口 {primary_url} 超过 {round(delay, 2)} 秒未返回，向 {hedge_url} 发出对冲请求")
+        hedge_task = asyncio.ensure_future(self._attempt(hedge_url, hedge))
+        pending = {primary_task, hedge_task}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.health(hedge_url).hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, api_url: str, make_call: Callable[[Optional[str]], Awaitable[T]],
+                   hedge_url: Optional[str] = None,
+                   make_hedge_call: Optional[Callable[[Optional[str]], Awaitable[T]]] = None) -> T:
+        """
+        带重试的模型调用
+
+        make_call(correction) 发出一次请求，correction 为上一次回复无效时的纠正说明（首次为 None）。
+        主接口熔断时改用备用接口；全部尝试失败时抛出最后一次的异常。
+        """
+        correction: Optional[str] = None
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.policy.max_attempts):
+            primary_url, primary_call = api_url, make_call
+            hedge_target, hedge_call = hedge_url, make_hedge_call
+            if hedge_url and self.health(api_url).breaker.state == CircuitBreaker.OPEN:
+                # 主接口熔断，直接改用备用接口
+                primary_url, primary_call = hedge_url, make_hedge_call
+                hedge_target, hedge_call = None, None
+            if attempt:
+                self.health(primary_url).retries += 1
+            try:
+                hedge_fn = (lambda c=correction: hedge_call(c)) if hedge_call else None
+                return await self._hedged(
+                    primary_url, lambda c=correction: primary_call(c), hedge_target, hedge_fn
+                )
+            except ModelResponseError as e:
+                # 回复可纠正：附带说明立即重新提问，不需要退避
+                last_error = e
+                correction = e.correction
+                self.health(primary_url).corrections += 1
+                logger.warning(f"第 {attempt + 1} 次请求的回复无效，重新提问: {str(e)}")
+            except CircuitOpenError as e:
+                last_error = e
+                logger.warning(str(e))
+                break
+            except asyncio.TimeoutError as e:
+                last_error = e
+                logger.warning(f"第 {attempt + 1} 次请求 {primary_url} 超过 {self.policy.attempt_timeout} 秒")
+            except Exception as e:
+                last_error = e
+                logger.warning(f"第 {attempt + 1} 次请求 {primary_url} 失败: {str(e)}")
+                if attempt + 1 < self.policy.max_attempts:
+                    await asyncio.sleep(self.policy.backoff(attempt))
+        raise last_error
+
+    def stats(self) -> Dict[str, dict]:
+        return {url: health.to_dict() for url, health in self._endpoints.items()}
+
+
+# 全局共享的模型调用容错层
+resilient_caller = ResilientCaller(RetryPolicy.from_env())
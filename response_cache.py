@@ -0,0 +1,164 @@
+"""按局面缓存的LLM落子结果
+
+缓存键为 (模型名, 提示词模板, 局面哈希, 行棋方)。内存中使用带容量和过期时间的
+LRU，可选使用 SQLite 持久化，使缓存在重启后仍然有效。命中的结果仍需通过
+合法性检查才能使用。
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger('go_game')
+
+
+def make_cache_key(model_name: str, template_id: str, position_key: str, current_player: int) -> str:
+    return f"{model_name}|{template_id}|{position_key}|{current_player}"
+
+
+class SQLiteCacheBackend:
+    """SQLite 持久化后端，所有操作在线程池中执行以免阻塞事件循环"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, x INTEGER, y INTEGER, reasoning TEXT, "
+            "elapsed REAL, created REAL)"
+        )
+        self._conn.commit()
+
+    def _get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT x, y, reasoning, elapsed, created FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        x, y, reasoning, elapsed, created = row
+        return {"x": x, "y": y, "reasoning": reasoning, "elapsed": elapsed, "created": created}
+
+    def _put(self, key: str, value: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value["x"], value["y"], value["reasoning"], value["elapsed"], value["created"])
+            )
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key: str, value: dict):
+        await asyncio.to_thread(self._put, key, value)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """内存LRU + 可选持久化后端的落子缓存"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 7 * 24 * 3600,
+                 backend: Optional[SQLiteCacheBackend] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl  # 过期时间（秒），0 表示永不过期
+        self.backend = backend
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.memory_hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.rejected = 0  # 命中但未通过合法性检查
+        self.latency_saved = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """从 GO_RESPONSE_CACHE_* 环境变量读取配置"""
+        path = os.getenv("GO_RESPONSE_CACHE_PATH")
+        backend = SQLiteCacheBackend(path) if path else None
+        return cls(
+            max_entries=int(os.getenv("GO_RESPONSE_CACHE_SIZE", 10000)),
+            ttl=float(os.getenv("GO_RESPONSE_CACHE_TTL", 7 * 24 * 3600)),
+            backend=backend,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _expired(self, value: dict) -> bool:
+        return bool(self.ttl) and time.time() - value["created"] > self.ttl
+
+    async def get(self, key: str) -> Optional[dict]:
+        """查找缓存，返回 {x, y, reasoning, elapsed} 或 None"""
+        if not self.enabled:
+            return None
+        value = self._entries.get(key)
+        if value is not None:
+            if self._expired(value):
+                del self._entries[key]
+            else:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return value
+        if self.backend is not None:
+            value = await self.backend.get(key)
+            if value is not None and not self._expired(value):
+                self._store(key, value)
+                self.backend_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def record_saved(self, value: dict):
+        """记录一次命中节省的模型调用时间"""
+        self.latency_saved += value.get("elapsed") or 0.0
+
+    def record_rejected(self):
+        """命中的结果在当前局面下不合法（例如劫争禁着），本次不使用"""
+        self.rejected += 1
+
+    async def put(self, key: str, x: int, y: int, reasoning: str, elapsed: float):
+        if not self.enabled:
+            return
+        value = {"x": x, "y": y, "reasoning": reasoning, "elapsed": elapsed, "created": time.time()}
+        self._store(key, value)
+        if self.backend is not None:
+            await self.backend.put(key, value)
+
+    def _store(self, key: str, value: dict):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+    def stats(self) -> Dict[str, object]:
+        hits = self.memory_hits + self.backend_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "backend_hits": self.backend_hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "latency_saved": round(self.latency_saved, 2),
+            "persistent": self.backend is not None,
+        }
+
+
+# 全局共享的落子缓存
+response_cache = ResponseCache.from_env()
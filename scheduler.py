@@ -0,0 +1,225 @@
+"""AI回合调度
+
+每局游戏只有一个回合循环任务（不再递归调用 ai_move），重复的触发会被去重；
+所有LLM调用经过按 api_url 划分的并发限制，并带有单步超时和取消支持。
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Set
+
+from leases import LeaseManager
+
+logger = logging.getLogger('go_game')
+
+
+class EndpointStats:
+    """单个模型接口的排队统计"""
+
+    def __init__(self):
+        self.waiting = 0  # 当前排队数
+        self.in_flight = 0  # 当前进行中的调用数
+        self.calls = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "wait_total": round(self.wait_total, 4),
+            "wait_avg": round(self.wait_total / self.calls, 4) if self.calls else 0.0,
+            "wait_max": round(self.wait_max, 4),
+        }
+
+
+class EndpointLimiter:
+    """限制全局以及每个 api_url 同时进行的LLM调用数"""
+
+    def __init__(self, global_limit: int = 64, per_endpoint_limit: int = 16):
+        self.global_limit = global_limit
+        self.per_endpoint_limit = per_endpoint_limit
+        self._global = asyncio.Semaphore(global_limit)
+        self._endpoints: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, EndpointStats] = {}
+
+    @asynccontextmanager
+    async def acquire(self, api_url: str):
+        """获取调用许可，先按接口排队再占用全局名额"""
+        semaphore = self._endpoints.get(api_url)
+        if semaphore is None:
+            semaphore = self._endpoints[api_url] = asyncio.Semaphore(self.per_endpoint_limit)
+            self._stats[api_url] = EndpointStats()
+        stats = self._stats[api_url]
+
+        stats.waiting += 1
+        start = time.perf_counter()
+        try:
+            await semaphore.acquire()
+            try:
+                await self._global.acquire()
+            except BaseException:
+                semaphore.release()
+                raise
+        finally:
+            stats.waiting -= 1
+        waited = time.perf_counter() - start
+        stats.calls += 1
+        stats.wait_total += waited
+        if waited > stats.wait_max:
+            stats.wait_max = waited
+
+        stats.in_flight += 1
+        try:
+            yield waited
+        finally:
+            stats.in_flight -= 1
+            self._global.release()
+            semaphore.release()
+
+    def stats(self) -> Dict[str, dict]:
+        return {api_url: stats.to_dict() for api_url, stats in self._stats.items()}
+
+
+class TurnScheduler:
+    """每局一个回合循环的AI调度器"""
+
+    def __init__(self, run_turn: Callable[[str], Awaitable[bool]], limiter: EndpointLimiter = None,
+                 move_timeout: float = 300.0, turn_delay: float = 1.0, leases: LeaseManager = None,
+                 lease_wait: float = 5.0):
+        """
+        run_turn(game_id) 执行一步AI落子，返回下一手是否仍由AI走；
+        回合循环期间持有该局的租约，多 worker 部署时同一局只由一个 worker 驱动
+        """
+        self.run_turn = run_turn
+        self.limiter = limiter or EndpointLimiter()
+        self.leases = leases or LeaseManager()
+        self.lease_wait = lease_wait  # 租约被占用时最多等待的时间（秒）
+        self.move_timeout = move_timeout  # 单步LLM调用的最长时间（秒）
+        self.turn_delay = turn_delay  # 两步之间的界面延迟（秒），无头运行时可设为0
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._retrigger: Set[str] = set()  # 回合循环运行期间又收到触发的游戏
+        self._pending_checks = set()
+        self.triggers = 0
+        self.deduplicated = 0
+        self.cancelled = 0
+        self.timeouts = 0
+        self.lease_denied = 0
+
+    @classmethod
+    def from_env(cls, run_turn: Callable[[str], Awaitable[bool]],
+                 leases: LeaseManager = None) -> "TurnScheduler":
+        """从 GO_AI_* 环境变量读取配置"""
+        limiter = EndpointLimiter(
+            global_limit=int(os.getenv("GO_AI_MAX_INFLIGHT", 64)),
+            per_endpoint_limit=int(os.getenv("GO_AI_MAX_INFLIGHT_PER_ENDPOINT", 16)),
+        )
+        return cls(
+            run_turn,
+            limiter=limiter,
+            move_timeout=float(os.getenv("GO_AI_MOVE_TIMEOUT", 300.0)),
+            turn_delay=float(os.getenv("GO_AI_TURN_DELAY", 1.0)),
+            leases=leases,
+        )
+
+    def is_running(self, game_id: str) -> bool:
+        task = self._tasks.get(game_id)
+        return task is not None and not task.done()
+
+    def trigger(self, game_id: str) -> bool:
+        """启动该局的回合循环，已在运行时忽略重复触发，返回是否新启动"""
+        self.triggers += 1
+        if self.is_running(game_id):
+            # 循环可能已判断完轮到谁、正在释放租约，退出后据此再检查一次
+            self._retrigger.add(game_id)
+            self.deduplicated += 1
+            logger.info(f"游戏 {game_id}: AI回合已在进行中，忽略重复触发")
+            return False
+        self._tasks[game_id] = asyncio.create_task(self._turn_loop(game_id))
+        return True
+
+    async def _turn_loop(self, game_id: str):
+        """循环执行AI回合，直到轮到人类玩家或游戏结束"""
+        retrigger = False
+        try:
+            async with self.leases.hold(game_id, self.lease_wait) as acquired:
+                if not acquired:
+                    self.lease_denied += 1
+                    logger.info(f"游戏 {game_id}: AI回合由其他 worker 驱动")
+                    return
+                while True:
+                    self._retrigger.discard(game_id)
+                    if not await self.run_turn(game_id):
+                        break
+                    if self.turn_delay:
+                        await asyncio.sleep(self.turn_delay)  # 添加短暂延迟，使界面更新更自然
+            # 最后一次判断之后（包括释放租约期间）收到的触发被当作重复触发忽略了，需要重新检查
+            retrigger = game_id in self._retrigger
+        except asyncio.CancelledError:
+            logger.info(f"游戏 {game_id}: AI回合循环已取消")
+            raise
+        except Exception as e:
+            logger.exception(f"游戏 {game_id}: AI回合循环出错: {str(e)}")
+        finally:
+            self._retrigger.discard(game_id)
+            if self._tasks.get(game_id) is asyncio.current_task():
+                del self._tasks[game_id]
+        if retrigger:
+            self.trigger(game_id)
+
+    async def call_model(self, api_url: str, make_call: Callable[[], Awaitable]):
+        """在并发限制和单步超时下执行一次模型调用，超时抛出 asyncio.TimeoutError"""
+        async with self.limiter.acquire(api_url):
+            try:
+                return await asyncio.wait_for(make_call(), timeout=self.move_timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+
+    def cancel(self, game_id: str) -> bool:
+        """取消该局正在进行的AI回合"""
+        task = self._tasks.pop(game_id, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        self.cancelled += 1
+        logger.info(f"游戏 {game_id}: 取消AI回合")
+        return True
+
+    def cancel_later(self, game_id: str, delay: float, should_cancel: Callable[[], bool]):
+        """延迟 delay 秒后，若 should_cancel() 仍为真则取消该局（用于处理被放弃的游戏）"""
+        async def check():
+            await asyncio.sleep(delay)
+            if should_cancel():
+                self.cancel(game_id)
+
+        task = asyncio.create_task(check())
+        self._pending_checks.add(task)
+        task.add_done_callback(self._pending_checks.discard)
+
+    async def shutdown(self):
+        """取消所有回合循环，应用关闭时调用"""
+        tasks = list(self._tasks.values()) + list(self._pending_checks)
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "active_games": sum(1 for task in self._tasks.values() if not task.done()),
+            "triggers": self.triggers,
+            "deduplicated": self.deduplicated,
+            "cancelled": self.cancelled,
+            "timeouts": self.timeouts,
+            "lease_denied": self.lease_denied,
+            "leases": self.leases.stats(),
+            "move_timeout": self.move_timeout,
+            "global_limit": self.limiter.global_limit,
+            "per_endpoint_limit": self.limiter.per_endpoint_limit,
+            "endpoints": self.limiter.stats(),
+        }
@@ -0,0 +1,134 @@
+"""终局计分
+
+在扁平棋盘上用显式栈做洪水填充，找出每块连通的空白区域及其边界颜色：
+只与一方棋子相邻的区域算作该方的地，同时与双方相邻的区域为单官（公气）。
+
+- 数子法（area，中国规则）：棋盘上的棋子 + 地，白方加贴目（默认 7.5）
+- 数目法（territory，日韩规则）：地 + 提子数，白方加贴目（默认 6.5）
+
+不做死活判断：终局时盘面上的棋子都视为活棋，双方应在停一手前提净死子。
+"""
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Tuple
+
+from go_board import BLACK, EMPTY, WHITE, GoBoard, get_neighbor_table
+
+AREA_SCORING = "area"
+TERRITORY_SCORING = "territory"
+
+DEFAULT_KOMI = {
+    AREA_SCORING: 7.5,
+    TERRITORY_SCORING: 6.5,
+}
+
+
+@dataclass
+class GameScore:
+    """一局的计分结果"""
+    method: str
+    komi: float
+    black: float
+    white: float
+    black_stones: int
+    white_stones: int
+    black_territory: int
+    white_territory: int
+    black_captures: int = 0
+    white_captures: int = 0
+    dame: int = 0
+
+    @property
+    def winner(self) -> int:
+        """胜方：1黑 2白 0和棋"""
+        if self.black > self.white:
+            return BLACK
+        if self.white > self.black:
+            return WHITE
+        return EMPTY
+
+    @property
+    def margin(self) -> float:
+        return abs(self.black - self.white)
+
+    @property
+    def summary(self) -> str:
+        """SGF 风格的结果，如 B+3.5、W+R、0（和棋）"""
+        if self.winner == EMPTY:
+            return "0"
+        return f"{'B' if self.winner == BLACK else 'W'}+{self.margin:g}"
+
+    def to_dict(self) -> Dict[str, object]:
+        data = asdict(self)
+        data.update(winner=self.winner, margin=self.margin, result=self.summary)
+        return data
+
+
+def territory_map(cells: bytearray, size: int) -> Tuple[int, int, int, bytearray]:
+    """
+    统计双方的地，返回 (黑地, 白地, 单官, owner)，owner[idx] 为该空点的归属（0 为单官）
+    """
+    neighbors = get_neighbor_table(size)
+    owner = bytearray(size * size)
+    visited = bytearray(size * size)
+    territory = [0, 0, 0]
+    for start in range(size * size):
+        if cells[start] != EMPTY or visited[start]:
+            continue
+        region = [start]
+        visited[start] = 1
+        stack = [start]
+        borders = 0  # 位掩码：1 接触黑棋，2 接触白棋
+        while stack:
+            p = stack.pop()
+            for nb in neighbors[p]:
+                c = cells[nb]
+                if c == EMPTY:
+                    if not visited[nb]:
+                        visited[nb] = 1
+                        region.append(nb)
+                        stack.append(nb)
+                else:
+                    borders |= c
+        color = borders if borders in (BLACK, WHITE) else EMPTY
+        territory[color] += len(region)
+        if color:
+            for p in region:
+                owner[p] = color
+    return territory[BLACK], territory[WHITE], territory[EMPTY], owner
+
+
+def score_board(board: GoBoard, method: str = AREA_SCORING, komi: Optional[float] = None,
+                captures: Optional[Dict[int, int]] = None) -> GameScore:
+    """
+    计算当前局面的得分
+
+    captures: {1: 黑方提子数, 2: 白方提子数}，数目法需要
+    """
+    if method not in DEFAULT_KOMI:
+        raise ValueError(f"未知的计分规则: {method}")
+    if komi is None:
+        komi = DEFAULT_KOMI[method]
+    captures = captures or {}
+    black_captures = captures.get(BLACK, 0)
+    white_captures = captures.get(WHITE, 0)
+    black_stones, white_stones = board.stone_counts()
+    black_territory, white_territory, dame, _ = territory_map(board.cells, board.size)
+    if method == AREA_SCORING:
+        black = black_stones + black_territory
+        white = white_stones + white_territory + komi
+    else:
+        black = black_territory + black_captures
+        white = white_territory + white_captures + komi
+    return GameScore(
+        method=method,
+        komi=komi,
+        black=black,
+        white=white,
+        black_stones=black_stones,
+        white_stones=white_stones,
+        black_territory=black_territory,
+        white_territory=white_territory,
+        black_captures=black_captures,
+        white_captures=white_captures,
+        dame=dame,
+    )
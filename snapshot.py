@@ -0,0 +1,220 @@
+"""面向轮询客户端的紧凑快照
+
+看板等客户端通常轮询而不是保持 WebSocket 连接。快照只包含显示一盘棋所需的最少
+信息，棋盘压缩为每点 2 位（19 路为 91 字节，base64 后 124 个字符）：
+
+    {"id": 游戏ID, "v": 版本, "moves": 手数, "to_move": 1|2, "board": base64,
+     "last": [x, y] | null, "captures": [黑提子, 白提子], "result": 结果 | null}
+
+- 版本即游戏的状态变化序号 seq（落子、聊天、终局时递增，多 worker 之间一致），
+  用作弱 ETag；客户端带 If-None-Match 且没有变化时返回 304
+- 每局的 JSON 片段按版本缓存，批量接口只是把片段拼接起来。游戏移出内存时片段
+  转入有上限的冷缓存，批量接口据存储中的版本直接使用，不为轮询重新加载游戏
+- 响应体较大时按 Accept-Encoding 压缩：优先 brotli（需安装 brotli），其次 gzip
+
+打包格式：点 idx = y * size + x 位于第 idx // 4 个字节的第 (idx % 4) * 2 位起的两位，
+值为 0 空 / 1 黑 / 2 白。
+"""
+import base64
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from broadcaster import serialize
+from go_board import PASS_MOVE, GoBoard
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖
+    brotli = None
+
+MIN_COMPRESS_SIZE = 512  # 小于该字节数的响应不压缩
+# 冷缓存（已移出内存的游戏）最多保留的片段数
+COLD_SNAPSHOT_LIMIT = int(os.getenv("GO_COLD_SNAPSHOT_LIMIT", 10000))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+def pack_board(board: GoBoard) -> bytes:
+    """把棋盘打包为每点 2 位的字节串（19 路为 91 字节）"""
+    cells = board.array.ravel()
+    padded = np.zeros(-(-cells.size // 4) * 4, dtype=np.uint8)
+    padded[:cells.size] = cells
+    return np.bitwise_or.reduce(padded.reshape(-1, 4) << _SHIFTS, axis=1).astype(np.uint8).tobytes()
+
+
+def unpack_board(data: bytes, size: int) -> bytearray:
+    """pack_board 的逆操作，返回扁平的 cells"""
+    packed = np.frombuffer(data, dtype=np.uint8)
+    cells = (packed[:, None] >> _SHIFTS) & 3
+    return bytearray(cells.ravel()[:size * size].tobytes())
+
+
+def _packed_board_text(board: GoBoard) -> str:
+    return base64.b64encode(pack_board(board)).decode("ascii")
+
+
+def build_compact_snapshot(game) -> Dict:
+    """一局的紧凑快照"""
+    last = None
+    if game.moves_history:
+        x, y, _ = game.moves_history[-1]
+        last = None if (x, y) == PASS_MOVE else [x, y]
+    return {
+        "id": game.game_id,
+        "v": game.seq,
+        "moves": len(game.moves_history),
+        "to_move": game.current_player,
+        "board": game.board.cached_render("packed", _packed_board_text),
+        "last": last,
+        "captures": [game.captures[1], game.captures[2]],
+        "result": game.result["result"] if game.result else None,
+    }
+
+
+class SnapshotCache:
+    """按游戏版本缓存序列化后的快照片段"""
+
+    def __init__(self, cold_limit: int = COLD_SNAPSHOT_LIMIT):
+        self._fragments: Dict[str, Tuple[int, bytes]] = {}
+        # 已移出内存的游戏的片段，最久未使用的在前
+        self._cold: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
+        self.cold_limit = cold_limit
+        self.hits = 0
+        self.misses = 0
+        self.cold_hits = 0
+        self.cold_misses = 0
+
+    def fragment(self, game) -> bytes:
+        cached = self._fragments.get(game.game_id)
+        if cached is not None and cached[0] == game.seq:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        data = serialize(build_compact_snapshot(game)).encode("utf-8")
+        self._fragments[game.game_id] = (game.seq, data)
+        return data
+
+    def cold_fragment(self, game_id: str, version: int, build: Callable[[], Dict]) -> bytes:
+        """不在内存中的游戏的片段，version 为存储中的版本，缓存过期时用 build() 生成快照"""
+        cached = self._cold.get(game_id)
+        if cached is not None and cached[0] == version:
+            self.cold_hits += 1
+            self._cold.move_to_end(game_id)
+            return cached[1]
+        self.cold_misses += 1
+        data = serialize(build()).encode("utf-8")
+        self._store_cold(game_id, version, data)
+        return data
+
+    def _store_cold(self, game_id: str, version: int, data: bytes):
+        self._cold[game_id] = (version, data)
+        self._cold.move_to_end(game_id)
+        while len(self._cold) > self.cold_limit:
+            self._cold.popitem(last=False)
+
+    def retire(self, game_id: str):
+        """游戏移出内存时把它的片段转入冷缓存"""
+        cached = self._fragments.pop(game_id, None)
+        if cached is not None and self.cold_limit > 0:
+            self._store_cold(game_id, *cached)
+
+    def discard(self, game_id: str):
+        """丢弃该局的所有缓存"""
+        self._fragments.pop(game_id, None)
+        self._cold.pop(game_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._fragments), "hits": self.hits, "misses": self.misses,
+            "cold_entries": len(self._cold), "cold_hits": self.cold_hits, "cold_misses": self.cold_misses,
+        }
+
+
+def game_etag(game) -> str:
+    return f'W/"{game.seq}"'
+
+
+def batch_etag(versions: Iterable[Tuple[str, Optional[int], Optional[int]]]) -> str:
+    """
+    批量快照的 ETag：请求的每局游戏、其版本（不存在的游戏为 None）和客户端已有的版本
+
+    响应体只包含版本与客户端不同的游戏，因此客户端版本也要计入
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    for game_id, version, known in versions:
+        digest.update(f"{game_id}:{version}:{known};".encode("utf-8"))
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+def _quality(param: str) -> float:
+    """Accept-Encoding 参数的 q 值，其他参数返回 1，无法解析时返回 0"""
+    key, _, value = param.strip().partition("=")
+    if key.strip().lower() != "q":
+        return 1.0
+    try:
+        return float(value.strip())
+    except ValueError:
+        return 0.0
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    按 Accept-Encoding 选择压缩方式：br（已安装 brotli 时）优先，其次 gzip
+
+    q=0 或无法解析的 q 值视为不接受该编码（不压缩总是安全的）
+    """
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        if all(_quality(param) > 0 for param in params):
+            accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """按需压缩响应体，返回 (响应体, Content-Encoding)"""
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    encoding = choose_encoding(accept_encoding)
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), encoding
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), encoding
+    return body, None
+
+
+def join_fragments(fragments: List[bytes], missing: List[str]) -> bytes:
+    """拼接批量快照的响应体：{"games": [...], "missing": [...]}"""
+    return (b'{"games":[' + b",".join(fragments) + b'],"missing":'
+            + serialize(missing).encode("utf-8") + b"}")
+
+
+# 全局共享的快照片段缓存
+snapshot_cache = SnapshotCache()
@@ -5,6 +5,9 @@ let gameStarted = false;
 let boardElement = null;
 let myPlayerNumber = null;
 let movesHistory = [];
+let boardState = [];
+let lastSeq = 0;
+let awaitingResync = false;
 
 // 初始化WebSocket连接
 function initWebSocket() {
@@ -12,19 +15,41 @@ function initWebSocket() {
     
     ws.onmessage = function(event) {
         const data = JSON.parse(event.data);
+        if (data.type === 'init') {
+            handleInitData(data);
+            return;
+        }
+        // 状态变化消息必须按序号连续到达，否则请求完整快照
+        if (data.seq !== undefined) {
+            if (awaitingResync) {
+                return;
+            }
+            if (data.seq <= lastSeq) {
+                // 快照之前已经包含的消息
+                return;
+            }
+            if (data.seq !== lastSeq + 1) {
+                requestResync();
+                return;
+            }
+            lastSeq = data.seq;
+        }
         switch(data.type) {
-            case 'init':
-                handleInitData(data);
-                break;
             case 'chat':
                 addMessage(data.player, data.message);
                 break;
             case 'thinking_start':
                 handleThinkingStart(data);
                 break;
+            case 'thinking_delta':
+                handleThinkingDelta(data);
+                break;
             case 'move_complete':
                 handleMoveComplete(data);
                 break;
+            case 'game_over':
+                showGameResult(data.result);
+                break;
         }
     };
 
@@ -34,9 +59,17 @@ function initWebSocket() {
     };
 }
 
-// 处理初始化数据
+// 请求服务端重新发送完整快照
+function requestResync() {
+    awaitingResync = true;
+    ws.send(JSON.stringify({ type: 'resync' }));
+}
+
+// 处理初始化数据（完整快照）
 function handleInitData(data) {
     const userText = currentPlayer === 1 ? '黑方' : '白方'
+    lastSeq = data.seq || 0;
+    awaitingResync = false;
     myPlayerNumber = data.player_number;
     updateBoard(data.board);
     updateCurrentPlayer(data.current_player);
@@ -53,6 +86,7 @@ function handleInitData(data) {
     if (data.last_move) {
         updateAIReasoning(data.last_move,userText);
     }
+    showGameResult(data.result);
     
     console.log(`已连接为玩家${myPlayerNumber} (${myPlayerNumber === 1 ? '黑棋' : '白棋'})`);
     
@@ -64,22 +98,35 @@ function handleInitData(data) {
 // 处理AI开始思考的消息
 function handleThinkingStart(data) {
     document.getElementById('thinkingIndicator').classList.add('active');
-    updateBoard(data.board);
+    document.getElementById('thinkingStream').textContent = '';
     updateCurrentPlayer(data.current_player);
-    movesHistory = data.moves_history;
 }
 
-// 处理移动完成的消息
+// 处理流式思考过程增量
+function handleThinkingDelta(data) {
+    const streamElement = document.getElementById('thinkingStream');
+    streamElement.textContent += data.delta;
+    streamElement.scrollTop = streamElement.scrollHeight;
+}
+
+// 处理移动完成的消息（增量：落子和提子）
 function handleMoveComplete(data) {
     const userText = currentPlayer === 1 ? '黑方' : '白方'
-    updateBoard(data.board);
+    const [x, y, player] = data.move;
+    if (x >= 0) {
+        setStone(x, y, player);
+    }
+    data.captured.forEach(([cx, cy]) => setStone(cx, cy, 0));
+    movesHistory.push(data.move);
     updateCurrentPlayer(data.current_player);
-    movesHistory = data.moves_history;
     
-    if (data.last_move) {
-        updateAIReasoning(data.last_move,userText);
+    // AI落子的思考过程只在本手的聊天记录中发送
+    const aiChat = data.chat.find(msg => msg.player === player);
+    if (aiChat) {
+        updateAIReasoning([x, y, aiChat.message, data.elapsed], userText);
     }
     document.getElementById('thinkingIndicator').classList.remove('active');
+    document.getElementById('thinkingStream').textContent = '';
     
     if (data.current_player === myPlayerNumber) {
         boardElement.classList.remove('disabled');
@@ -88,6 +135,19 @@ function handleMoveComplete(data) {
     }
 }
 
+// 显示终局结果（result为空时清除）
+function showGameResult(result) {
+    const resultElement = document.getElementById('gameResult');
+    if (!result) {
+        resultElement.textContent = '';
+        return;
+    }
+    const winner = result.winner === 1 ? '黑胜' : result.winner === 2 ? '白胜' : '和棋';
+    const rule = result.method === 'area' ? '数子' : '数目';
+    resultElement.textContent = `终局（${rule}，贴${result.komi}）：黑 ${result.black} / 白 ${result.white}，${winner} ${result.result}`;
+    boardElement.classList.add('disabled');
+}
+
 // 初始化棋盘
 function initBoard() {
     const grid = document.getElementById('grid');
@@ -127,26 +187,40 @@ function handleCellClick(event) {
 
 // 更新棋盘状态
 function updateBoard(board) {
+    boardState = board.map(row => row.slice());
     const cells = document.querySelectorAll('.cell');
     cells.forEach(cell => {
         const x = parseInt(cell.dataset.x);
         const y = parseInt(cell.dataset.y);
-        
-        // 移除现有的棋子
-        const existingStone = cell.querySelector('.stone');
-        if (existingStone) {
-            cell.removeChild(existingStone);
-        }
-        
-        // 添加新棋子
-        if (board[y][x] !== 0) {
-            const stone = document.createElement('div');
-            stone.className = `stone ${board[y][x] === 1 ? 'black' : 'white'}`;
-            cell.appendChild(stone);
-        }
+        renderStone(cell, board[y][x]);
     });
 }
 
+// 更新单个交叉点
+function setStone(x, y, player) {
+    boardState[y][x] = player;
+    const cell = document.querySelector(`.cell[data-x="${x}"][data-y="${y}"]`);
+    if (cell) {
+        renderStone(cell, player);
+    }
+}
+
+// 绘制交叉点上的棋子（player为0时移除）
+function renderStone(cell, player) {
+    // 移除现有的棋子
+    const existingStone = cell.querySelector('.stone');
+    if (existingStone) {
+        cell.removeChild(existingStone);
+    }
+    
+    // 添加新棋子
+    if (player !== 0) {
+        const stone = document.createElement('div');
+        stone.className = `stone ${player === 1 ? 'black' : 'white'}`;
+        cell.appendChild(stone);
+    }
+}
+
 // 更新当前玩家显示
 function updateCurrentPlayer(player) {
     currentPlayer = player;
@@ -161,7 +235,7 @@ function updateCurrentPlayer(player) {
 function updateAIReasoning(last_move,userText) {
     const thinkingHistoryElement = document.getElementById('thinkingHistory');
     reasoning = last_move[2];
-    cordinate = [last_move[0],last_move[1]];
+    cordinate = last_move[0] < 0 ? '停一手' : [last_move[0],last_move[1]];
     elapsed_time = last_move[3];
     if (!reasoning) {
         return;
@@ -251,11 +325,13 @@ function startNewGame() {
     const blackModelUrl = document.getElementById('blackModelUrl').value;
     const blackModelName = document.getElementById('blackModelName').value;
     const blackBearerToken = document.getElementById('blackBearerToken').value;
+    const blackStream = document.getElementById('blackStream').checked;
     
     const whiteModelType = document.getElementById('whiteModelType').value;
     const whiteModelUrl = document.getElementById('whiteModelUrl').value;
     const whiteModelName = document.getElementById('whiteModelName').value;
     const whiteBearerToken = document.getElementById('whiteBearerToken').value;
+    const whiteStream = document.getElementById('whiteStream').checked;
     
     fetch('/start_game', {
         method: 'POST',
@@ -268,10 +344,12 @@ function startNewGame() {
             black_model_url: blackModelUrl,
             black_model_name: blackModelName,
             black_bearer_token: blackBearerToken,
+            black_stream: blackStream,
             white_model_type: whiteModelType,
             white_model_url: whiteModelUrl,
             white_model_name: whiteModelName,
             white_bearer_token: whiteBearerToken,
+            white_stream: whiteStream,
             first_player: 1
         })
     })
@@ -0,0 +1,347 @@
+"""无界面的AI对战批量运行器
+
+不经过 FastAPI、WebSocket 和界面延迟，直接用 GoBoard + AIPlayer 同时运行多局
+AI 对局。模型调用按接口限制并发，终局的规则复核和计分放到进程池中执行，
+每局结果以一行紧凑的 JSON 写入结果文件。
+
+配置文件示例（JSON）：
+{
+    "players": {
+        "deepseek": {"model_type": "deepseek", "bearer_token": "..."},
+        "local": {"model_type": "compatible", "api_url": "http://127.0.0.1:8000/v1/chat/completions",
+                  "model_name": "DeepSeek-R1"}
+    },
+    "pairings": [["deepseek", "local"], ["local", "deepseek"]],
+    "games_per_pairing": 10,
+    "max_moves": 400,
+    "scoring": "area",
+    "komi": 7.5
+}
+
+双方连续停一手即终局，按 scoring（area 数子法 / territory 数目法）和 komi 计分；
+达到 max_moves 仍未终局的对局按当前局面计分。
+
+用法: python tournament.py config.json --output results.jsonl --concurrency 32 --workers 4
+      [--archive games.gor]
+
+指定 --archive 时同时把每局棋谱（含思考过程）写入二进制棋谱库，见 game_record.py。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai_player import AIPlayer
+from game_record import ArchiveWriter, GameRecord
+from go_board import BOARD_SIZE, PASS_MOVE, GoBoard
+from http_pool import session_registry
+from scheduler import EndpointLimiter
+from scoring import AREA_SCORING, score_board
+
+logger = logging.getLogger('go_game')
+progress_logger = logging.getLogger('go_game.tournament')  # 每局完成的进度，非 --verbose 时也输出
+
+_COORDS = "abcdefghijklmnopqrstuvwxyz"
+# 停一手的编码（与SGF在19路及以下棋盘上的约定一致）
+_PASS_CODE = "tt"
+
+
+def encode_moves(moves: List[Tuple[int, int, int]]) -> str:
+    """把着手序列编码为紧凑字符串，每手两个字母（与SGF坐标一致）"""
+    return "".join(
+        _PASS_CODE if (x, y) == PASS_MOVE else _COORDS[x] + _COORDS[y]
+        for x, y, _ in moves
+    )
+
+
+def decode_moves(encoded: str, first_player: int = 1) -> List[Tuple[int, int, int]]:
+    """encode_moves 的逆操作，假设双方交替落子"""
+    moves = []
+    player = first_player
+    for i in range(0, len(encoded), 2):
+        code = encoded[i:i + 2]
+        if code == _PASS_CODE:
+            moves.append((*PASS_MOVE, player))
+        else:
+            moves.append((_COORDS.index(code[0]), _COORDS.index(code[1]), player))
+        player = 3 - player
+    return moves
+
+
+def score_game(moves: List[Tuple[int, int, int]], size: int = BOARD_SIZE,
+               scoring: str = AREA_SCORING, komi: Optional[float] = None) -> Dict[str, Any]:
+    """
+    在进程池中复核整局棋并计分：重放所有着手检查合法性，
+    统计双方提子数，再按计分规则和贴目计算胜负
+    """
+    board = GoBoard(size, superko=True)
+    captures = {1: 0, 2: 0}
+    illegal = 0
+    for x, y, player in moves:
+        if (x, y) == PASS_MOVE:
+            board.pass_turn()
+            continue
+        if not board.is_legal(x, y, player):
+            illegal += 1
+            continue
+        captures[player] += len(board.play(x, y, player))
+    score = score_board(board, scoring, komi, captures)
+    return {
+        "winner": score.winner,
+        "result": score.summary,
+        "score": score.to_dict(),
+        "illegal_moves": illegal,
+    }
+
+
+class TournamentRunner:
+    """批量运行AI对局"""
+
+    def __init__(self, players: Dict[str, Dict[str, Any]], concurrency: int = 16,
+                 per_endpoint_limit: int = 8, move_timeout: float = 300.0,
+                 max_moves: int = 400, scoring: str = AREA_SCORING, komi: Optional[float] = None,
+                 executor: Optional[Executor] = None, archive: Optional[ArchiveWriter] = None):
+        self.players = players
+        self.concurrency = concurrency  # 同时进行的对局数
+        self.limiter = EndpointLimiter(global_limit=concurrency, per_endpoint_limit=per_endpoint_limit)
+        self.move_timeout = move_timeout
+        self.max_moves = max_moves
+        self.scoring = scoring  # 计分规则
+        self.komi = komi  # 贴目，None 表示使用计分规则的默认值
+        self.executor = executor  # 计分用的进程池，为 None 时在当前进程执行
+        self.archive = archive  # 棋谱库，为 None 时不保存棋谱
+
+    def _create_player(self, name: str) -> AIPlayer:
+        spec = self.players[name]
+        return AIPlayer(
+            model_type=spec.get("model_type", "compatible"),
+            api_url=spec.get("api_url"),
+            model_name=spec.get("model_name"),
+            bearer_token=spec.get("bearer_token"),
+            stream=spec.get("stream", False),
+            hedge_api_url=spec.get("hedge_api_url"),
+        )
+
+    async def play_game(self, game_index: int, black_name: str, white_name: str) -> Dict[str, Any]:
+        """进行一局对局，返回结果记录"""
+        board = GoBoard(BOARD_SIZE, superko=True)
+        players = {1: self._create_player(black_name), 2: self._create_player(white_name)}
+        moves: List[Tuple[int, int, int]] = []
+        chat_history: List[Dict[str, Any]] = []
+        move_times: List[float] = []
+        errors: List[str] = []
+        captures = {1: 0, 2: 0}
+        current = 1
+        passes = 0
+        start = time.perf_counter()
+
+        while len(moves) < self.max_moves:
+            ai = players[current]
+            move_start = time.perf_counter()
+            try:
+                async with self.limiter.acquire(ai.api_url):
+                    x, y, reasoning, _ = await asyncio.wait_for(
+                        ai.get_move(board, current, moves, chat_history,
+                                    scoring=self.scoring, komi=self.komi, captures=captures),
+                        timeout=self.move_timeout
+                    )
+            except asyncio.TimeoutError:
+                errors.append(f"move {len(moves)}: timeout")
+                x, y, reasoning, _ = ai.fallback_move(board, current)
+            except Exception as e:
+                errors.append(f"move {len(moves)}: {str(e)}")
+                x, y, reasoning, _ = ai.fallback_move(board, current)
+            move_times.append(round(time.perf_counter() - move_start, 3))
+            if x is None or y is None:
+                break
+            captured = []
+            if (x, y) != PASS_MOVE:
+                try:
+                    captured = board.play(x, y, current)
+                except ValueError as e:
+                    # 模型给出的着手在本地棋盘上非法（例如全局同形），改用本地策略
+                    errors.append(f"move {len(moves)}: {str(e)}")
+                    x, y, reasoning, _ = ai.fallback_move(board, current)
+                    if (x, y) != PASS_MOVE:
+                        captured = board.play(x, y, current)
+            if (x, y) == PASS_MOVE:
+                board.pass_turn()
+                passes += 1
+            else:
+                captures[current] += len(captured)
+                passes = 0
+            moves.append((x, y, current))
+            chat_history.append({"type": "chat", "player": current, "message": reasoning})
+            current = 3 - current
+            if passes >= 2:
+                break
+
+        duration = time.perf_counter() - start
+        if self.executor is not None:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self.executor, score_game, moves, BOARD_SIZE, self.scoring, self.komi
+            )
+        else:
+            result = score_game(moves, BOARD_SIZE, self.scoring, self.komi)
+
+        result.update({
+            "game": game_index,
+            "black": black_name,
+            "white": white_name,
+            "moves": encode_moves(moves),
+            "move_count": len(moves),
+            "finished": passes >= 2,
+            "move_times": move_times,
+            "duration": round(duration, 3),
+            "fallbacks": {"black": players[1].fallback_count, "white": players[2].fallback_count},
+            "errors": errors,
+        })
+        if self.archive is not None:
+            score = result["score"]
+            self.archive.append(GameRecord(
+                size=BOARD_SIZE,
+                komi=score["komi"],
+                winner=result["winner"],
+                margin=score["margin"],
+                moves=moves,
+                reasonings=[entry["message"] for entry in chat_history],
+                meta={"game_id": f"tournament-{game_index}", "black": black_name,
+                      "white": white_name, "scoring": self.scoring},
+            ))
+        return result
+
+    async def run(self, pairings: List[Tuple[str, str]], games_per_pairing: int,
+                  output_path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """运行全部对局，每完成一局就追加写入结果文件"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        schedule = [
+            (black, white)
+            for black, white in pairings
+            for _ in range(games_per_pairing)
+        ]
+        results: List[Dict[str, Any]] = []
+        output = open(output_path, 'a', encoding='utf-8') if output_path else None
+
+        async def run_one(index: int, black: str, white: str):
+            async with semaphore:
+                try:
+                    result = await self.play_game(index, black, white)
+                except Exception as e:
+                    logger.exception(f"对局 {index} 失败: {str(e)}")
+                    result = {"game": index, "black": black, "white": white, "errors": [str(e)]}
+            results.append(result)
+            if output:
+                output.write(json.dumps(result, ensure_ascii=False, separators=(',', ':')) + "\n")
+                output.flush()
+            progress_logger.info(f"对局 {index} 完成 ({len(results)}/{len(schedule)}): "
+                                 f"{black} vs {white}, {result.get('move_count', 0)} 手, 结果: {result.get('result')}")
+
+        try:
+            await asyncio.gather(*(
+                run_one(index, black, white) for index, (black, white) in enumerate(schedule)
+            ))
+        finally:
+            if output:
+                output.close()
+        return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """按对阵统计胜负、平均手数和平均每手耗时"""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        key = f"{result['black']} vs {result['white']}"
+        entry = summary.setdefault(key, {"games": 0, "black_wins": 0, "white_wins": 0,
+                                         "draws": 0, "failed": 0, "moves": 0, "move_time": 0.0})
+        entry["games"] += 1
+        if "winner" not in result:
+            entry["failed"] += 1
+            continue
+        entry[{1: "black_wins", 2: "white_wins", 0: "draws"}[result["winner"]]] += 1
+        entry["moves"] += result["move_count"]
+        entry["move_time"] += sum(result["move_times"])
+    for entry in summary.values():
+        finished = entry["games"] - entry["failed"]
+        total_moves = entry.pop("moves")
+        total_time = entry.pop("move_time")
+        entry["avg_moves"] = round(total_moves / finished, 1) if finished else 0
+        entry["avg_move_time"] = round(total_time / total_moves, 3) if total_moves else 0
+    return summary
+
+
+async def run_tournament(config: Dict[str, Any], output_path: Optional[str] = None,
+                         concurrency: int = 16, per_endpoint_limit: int = 8,
+                         move_timeout: float = 300.0, workers: int = 0,
+                         archive_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """按配置运行一次锦标赛（供其他代码直接调用）"""
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    archive = ArchiveWriter(archive_path) if archive_path else None
+    runner = TournamentRunner(
+        config["players"],
+        concurrency=concurrency,
+        per_endpoint_limit=per_endpoint_limit,
+        move_timeout=move_timeout,
+        max_moves=config.get("max_moves", 400),
+        scoring=config.get("scoring", AREA_SCORING),
+        komi=config.get("komi"),
+        executor=executor,
+        archive=archive,
+    )
+    try:
+        return await runner.run(
+            [tuple(pair) for pair in config["pairings"]],
+            config.get("games_per_pairing", 1),
+            output_path,
+        )
+    finally:
+        await session_registry.close()
+        if executor is not None:
+            executor.shutdown()
+        if archive is not None:
+            archive.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面批量运行AI对局")
+    parser.add_argument("config", help="锦标赛配置文件（JSON）")
+    parser.add_argument("--output", default="tournament_results.jsonl", help="结果文件（JSON Lines，追加写入）")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时进行的对局数")
+    parser.add_argument("--per-endpoint", type=int, default=8, help="每个模型接口同时进行的请求数")
+    parser.add_argument("--move-timeout", type=float, default=300.0, help="单步超时（秒）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="计分进程数，0 表示在主进程中计分")
+    parser.add_argument("--archive", help="同时把棋谱写入该二进制棋谱库")
+    parser.add_argument("--verbose", action="store_true", help="输出AI调用的详细日志")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    progress_logger.setLevel(logging.INFO)
+    with open(args.config, encoding='utf-8') as f:
+        config = json.load(f)
+
+    start = time.perf_counter()
+    results = asyncio.run(run_tournament(
+        config,
+        output_path=args.output,
+        concurrency=args.concurrency,
+        per_endpoint_limit=args.per_endpoint,
+        move_timeout=args.move_timeout,
+        workers=args.workers,
+        archive_path=args.archive,
+    ))
+    elapsed = time.perf_counter() - start
+    print(json.dumps(summarize(results), ensure_ascii=False, indent=2))
+    print(f"共 {len(results)} 局，耗时 {elapsed:.1f} 秒，结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()